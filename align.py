@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""Relate RTT to throughput: latency under load, RTT inflation, lagged correlation.
+
+The per-packet RTT samples and the per-interval iperf3 throughput are put
+on one time grid (step seconds, default 0.1):
+
+- RTT: each sample falls in exactly one bin, per-bin count/mean via
+  bincount and max via reduceat over the (time sorted) samples.
+- throughput: as-of join, each grid point takes the iperf3 interval that
+  contains it (the first interval ending at or after it, searchsorted).
+
+Everything is a handful of O(n) numpy passes (plus a sort if the RTT file
+isn't in time order), so multi-million-sample runs are fine.
+
+From the grid:
+
+- baseline: a low percentile (BASELINE_PCT) of all RTT samples, the
+  "unloaded" RTT. The raw minimum is not used, stray acks on the iperf3
+  control connection come back in microseconds.
+- latency under load, per phase: RTT in bins where throughput is at least
+  LOAD_FRACTION of the phase's peak, against bins below IDLE_FRACTION.
+- inflation: loaded RTT over the baseline, as a difference and a ratio.
+- lagged cross-correlation between throughput drops (how much throughput
+  fell since the previous grid point) and RTT inflation, for lags up to
+  max_lag seconds. A positive best lag means RTT spikes follow the drops.
+
+    python align.py rtt_<ts>.csv iperf3_<ts>.json [--step 0.1] [--max-lag 5]
+"""
+import sys
+import argparse
+import numpy as np
+
+import phases
+from phases import num, cell
+
+STEP = 0.1
+MAX_LAG = 5.0
+BASELINE_PCT = 1
+LOAD_FRACTION = 0.5
+IDLE_FRACTION = 0.1
+
+
+def grid_rtt(times, values, start, step, n_bins):
+    """Per-bin count, mean and max of RTT samples on the grid (NaN when empty)."""
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if len(times) > 1 and np.any(np.diff(times) < 0):
+        order = np.argsort(times, kind='stable')
+        times, values = times[order], values[order]
+    bins = np.floor((times - start) / step).astype(np.int64)
+    keep = (bins >= 0) & (bins < n_bins)
+    bins, values = bins[keep], values[keep]
+
+    count = np.bincount(bins, minlength=n_bins)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(bins, weights=values, minlength=n_bins) / count
+    peak = np.full(n_bins, np.nan)
+    if len(bins):
+        starts = np.flatnonzero(np.diff(bins, prepend=-1))
+        peak[bins[starts]] = np.maximum.reduceat(values, starts)
+    return count, mean, peak
+
+
+def asof_throughput(grid, interval_ends, throughput):
+    """Throughput of the iperf3 interval containing each grid point (NaN past the end)."""
+    ends = np.asarray(interval_ends, dtype=np.float64)
+    values = np.asarray(throughput, dtype=np.float64)
+    out = np.full(len(grid), np.nan)
+    if len(ends) == 0:
+        return out
+    idx = np.searchsorted(ends, grid, side='left')
+    inside = idx < len(ends)
+    out[inside] = values[idx[inside]]
+    return out
+
+
+def align(rtt_times, rtt_values, tput_times, tput_values, step=STEP):
+    """Put RTT and throughput on a common grid starting at 0.
+
+    Returns {'t', 'count', 'rtt_mean', 'rtt_max', 'tput'}, one entry per bin
+    (t is the bin centre).
+    """
+    rtt_times = np.asarray(rtt_times, dtype=np.float64)
+    end = max(rtt_times.max() if len(rtt_times) else 0.0,
+              max(tput_times) if len(tput_times) else 0.0)
+    n_bins = max(int(np.ceil(end / step)), 1)
+    t = (np.arange(n_bins) + 0.5) * step
+    count, mean, peak = grid_rtt(rtt_times, rtt_values, 0.0, step, n_bins)
+    return {'t': t, 'count': count, 'rtt_mean': mean, 'rtt_max': peak,
+            'tput': asof_throughput(t, tput_times, tput_values)}
+
+
+def lagged_correlation(x, y, max_lag):
+    """Pearson correlation of x[i] with y[i + lag] for lag in -max_lag..max_lag.
+
+    NaNs are left out pairwise. O(n * lags), with max_lag in grid steps.
+    """
+    n = len(x)
+    lags = np.arange(-max_lag, max_lag + 1)
+    corr = np.full(len(lags), np.nan)
+    for k, lag in enumerate(lags):
+        if abs(lag) >= n:
+            continue
+        a = x[max(0, -lag):n - max(0, lag)]
+        b = y[max(0, lag):n - max(0, -lag)]
+        ok = ~(np.isnan(a) | np.isnan(b))
+        if ok.sum() < 3:
+            continue
+        a, b = a[ok] - a[ok].mean(), b[ok] - b[ok].mean()
+        denom = np.sqrt((a * a).sum() * (b * b).sum())
+        if denom > 0:
+            corr[k] = (a * b).sum() / denom
+    return lags, corr
+
+
+def _weighted_mean(mean, count):
+    total = count.sum()
+    return np.nansum(mean * count) / total if total else np.nan
+
+
+def load_report(rtt_times, rtt_values, iperf_data, manifest, step=STEP, max_lag=MAX_LAG):
+    """Latency under load, inflation and lagged correlation as a plain dict."""
+    rtt_values = np.asarray(rtt_values, dtype=np.float64)
+    grid = align(rtt_times, rtt_values, iperf_data['times'], iperf_data['throughput'], step)
+    baseline = np.percentile(rtt_values, BASELINE_PCT) if len(rtt_values) else np.nan
+    inflation = grid['rtt_mean'] - baseline
+
+    phase = phases.assign(grid['t'], manifest)
+    rows = []
+    for i, p in enumerate(manifest['phases']):
+        in_phase = (phase == i) & ~np.isnan(grid['tput'])
+        if manifest.get('end') is not None:
+            in_phase &= grid['t'] <= manifest['end']
+        peak = np.max(grid['tput'][in_phase]) if in_phase.any() else np.nan
+        if not peak > 0:
+            # no traffic at all in this phase, nothing counts as loaded
+            in_phase[:] = False
+        loaded = in_phase & (grid['tput'] >= LOAD_FRACTION * peak)
+        idle = in_phase & (grid['tput'] < IDLE_FRACTION * peak)
+        loaded_rtt = _weighted_mean(grid['rtt_mean'][loaded], grid['count'][loaded])
+        idle_rtt = _weighted_mean(grid['rtt_mean'][idle], grid['count'][idle])
+        rows.append({'phase': i, 'bw': p.get('bw'), 'peak_tput_mbps': num(peak),
+                     'loaded_bins': int(loaded.sum()), 'idle_bins': int(idle.sum()),
+                     'loaded_rtt': num(loaded_rtt), 'idle_rtt': num(idle_rtt),
+                     'inflation': num(loaded_rtt - baseline),
+                     'inflation_ratio': num(loaded_rtt / baseline) if baseline > 0 else None})
+
+    # throughput drop per grid step (0 when it went up) against RTT inflation
+    drops = np.clip(-np.diff(grid['tput'], prepend=np.nan), 0, None)
+    lags, corr = lagged_correlation(drops, inflation, int(round(max_lag / step)))
+    best = int(np.nanargmax(corr)) if np.any(~np.isnan(corr)) else None
+    return {'step': step, 'baseline_rtt': num(baseline), 'baseline_pct': BASELINE_PCT,
+            'phases': rows,
+            'xcorr': {'lags': np.round(lags * step, 6).tolist(), 'corr': [num(c) for c in corr],
+                      'best_lag': round(float(lags[best] * step), 6) if best is not None else None,
+                      'best_corr': num(corr[best]) if best is not None else None}}
+
+
+def print_report(report):
+    print(f"Baseline RTT (p{report['baseline_pct']}): {cell(report['baseline_rtt'], 0, 4).strip()}")
+    print(f"{'phase':<10} {'peak Mbps':>9} {'loaded':>6} {'rtt':>8} {'idle':>6} {'rtt':>8} "
+          f"{'inflation':>9} {'ratio':>6}")
+    for row in report['phases']:
+        print(f"{row['bw'] or row['phase']!s:<10} {cell(row['peak_tput_mbps'], 9, 2)} "
+              f"{row['loaded_bins']:>6} {cell(row['loaded_rtt'], 8, 4)} "
+              f"{row['idle_bins']:>6} {cell(row['idle_rtt'], 8, 4)} "
+              f"{cell(row['inflation'], 9, 4)} {cell(row['inflation_ratio'], 6, 2)}")
+    xcorr = report['xcorr']
+    if xcorr['best_lag'] is None:
+        print("Throughput drop / RTT correlation: not enough data")
+    else:
+        print(f"Throughput drop / RTT correlation: {xcorr['best_corr']:.3f} at lag {xcorr['best_lag']:+.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency under load and RTT/throughput correlation for one run.')
+    parser.add_argument('rtt_csv_file', help='RTT CSV from tshark/pcaprtt.py, or a .pcap')
+    parser.add_argument('iperf_json_file', help='iperf3 JSON file')
+    parser.add_argument('--step', type=float, default=STEP, help='Grid step in seconds (default: 0.1)')
+    parser.add_argument('--max-lag', type=float, default=MAX_LAG, help='Largest lag in seconds for the cross-correlation')
+    parser.add_argument('--manifest', help='Run manifest with the tune schedule (default: run_<ts>.json next to the CSV)')
+    args = parser.parse_args()
+
+    import loaders
+    try:
+        columns = loaders.load_rtt(args.rtt_csv_file)
+        iperf_data = loaders.load_iperf(args.iperf_json_file)
+    except Exception as e:
+        print(f"Error reading input: {e}")
+        sys.exit(1)
+    if iperf_data is None:
+        print(f"Error: iperf3 JSON file '{args.iperf_json_file}' not found.")
+        sys.exit(1)
+    manifest = phases.load_manifest(args.rtt_csv_file, args.manifest)
+    report = load_report(columns['frame.time_relative'], columns['tcp.analysis.ack_rtt'],
+                         iperf_data, manifest, args.step, args.max_lag)
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
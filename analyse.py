@@ -1,159 +1,185 @@
 #!/usr/bin/env python3
 import sys
-import json
-import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 import os
+import argparse
+import loaders
+import decimate
+import phases
+import align
+import flows
+import goodput
+import queuing
+import profiling
+# matplotlib is imported where it is used, so --help, argument errors and
+# --no-plot runs don't pay for it (pandas only when a CSV has to be parsed)
 
-def process_rtt_csv(csv_file):
-    """Process the RTT CSV file from tcpdump/tshark."""
+def process_rtt_csv(csv_file, flow=flows.DOMINANT, show_flows=False):
+    """Process the RTT CSV file from tcpdump/tshark (or a pcap, see loaders.py).
+
+    Returns a loaders.Run with the time/RTT arrays of flow (see flows.py);
+    show_flows prints the per-flow breakdown first.
+    """
     try:
-        # Read the CSV file
-        df = pd.read_csv(csv_file)
-        
-        # Check if we have the expected columns
-        expected_cols = ['frame.time_relative', 'tcp.seq', 'tcp.analysis.ack_rtt']
-        if not all(col in df.columns for col in expected_cols):
-            print(f"Warning: CSV file missing expected columns. Found: {df.columns}")
-        
-        # Clean up data - ensure numeric types
-        df['frame.time_relative'] = pd.to_numeric(df['frame.time_relative'], errors='coerce')
-        df['tcp.analysis.ack_rtt'] = pd.to_numeric(df['tcp.analysis.ack_rtt'], errors='coerce')
-        
-        # Drop rows with NaN values
-        df = df.dropna(subset=['frame.time_relative', 'tcp.analysis.ack_rtt'])
-        
-        return df
+        # Cleaned columns come from the on-disk cache when the file is unchanged
+        return loaders.load_run(csv_file, flow, show_flows=show_flows)
     except Exception as e:
         print(f"Error processing RTT CSV file: {e}")
         sys.exit(1)
 
 def process_iperf_json(json_file):
     """Process the iperf3 JSON file."""
-    if not json_file or not os.path.exists(json_file):
-        return None
-    
     try:
-        # Read the JSON file
-        with open(json_file, 'r') as f:
-            data = json.load(f)
-        
-        # Extract intervals data
-        intervals = data.get('intervals', [])
-        
-        # Create lists for time and throughput
-        times = []
-        throughput_values = []
-        
-        for interval in intervals:
-            # Get the end time and throughput from each interval
-            end_time = interval['sum']['end']
-            bits_per_second = interval['sum']['bits_per_second']
-            
-            times.append(end_time)
-            # Convert to Mbps for readability
-            throughput_values.append(bits_per_second / 1e6)
-        
         # Add a zero point if needed for better alignment
-        if times and times[0] > 0:
-            times.insert(0, 0)
-            throughput_values.insert(0, 0)
-            
-        return {
-            'times': times,
-            'throughput': throughput_values
-        }
+        return loaders.load_iperf(json_file, zero_start=True)
     except Exception as e:
         print(f"Warning: Could not process iperf3 JSON file: {e}")
         return None
 
-def create_plot(rtt_data, iperf_data=None, output_prefix=None):
-    """Create a time series plot of RTT and optionally throughput."""
-    fig, ax1 = plt.subplots(figsize=(12, 6))
-    
-    # Plot RTT data on primary y-axis
-    ax1.plot(rtt_data['frame.time_relative'], rtt_data['tcp.analysis.ack_rtt'], 
-             'b-', linewidth=1.2, alpha=0.8, label='RTT')
-    ax1.set_xlabel('Time (seconds)', fontsize=12)
-    ax1.set_ylabel('Round Trip Time (ms)', color='b', fontsize=12)
-    ax1.tick_params(axis='y', labelcolor='b')
-    
-    # Add vertical lines for bandwidth changes - based on full-test.sh
-    markers = [10, 20, 30, 40]  # Script changes bandwidth every 10s
-    labels = ['5Mbps→2Mbps', '2Mbps→1Mbps', '1Mbps→500kbps', 'End of test']
-    colors = ['red', 'green', 'purple', 'orange']
-    
-    for i, (marker, label, color) in enumerate(zip(markers, labels, colors)):
-        ax1.axvline(x=marker, color=color, linestyle='--', alpha=0.7, label=label)
-    
-    # If we have iperf data, plot it on secondary y-axis
-    if iperf_data and len(iperf_data['times']) > 1:
-        ax2 = ax1.twinx()
-        ax2.plot(iperf_data['times'], iperf_data['throughput'], 
-                 'g-', linewidth=1.5, label='Throughput')
-        ax2.set_ylabel('Throughput (Mbps)', color='g', fontsize=12)
-        ax2.tick_params(axis='y', labelcolor='g')
+def create_plot(rtt_data, iperf_data=None, output_prefix=None, output_dir=None, dpi=300, show=True,
+                decimation='minmax', manifest=None, queue=None):
+    """Create a time series plot of RTT and optionally throughput.
+
+    Returns the path of the saved PNG. With show=False the figure is closed
+    instead of shown, which is what headless/batch runs want. decimation
+    ('minmax', 'lttb' or 'none') thins the RTT line to the figure width
+    before drawing; stats are always computed on the full data. Phase
+    markers come from the run manifest (default schedule if None).
+    iperf_data can also be pcap goodput from goodput.py, its 'label' then
+    names the line. queue is (base RTT, queuing delay, window) from
+    queuing.py, drawn as an extra layer on the RTT axis.
+    """
+    with profiling.stage('import matplotlib'):
+        import matplotlib.pyplot as plt
+    
+    with profiling.stage('draw'):
+        fig, ax1 = plt.subplots(figsize=(12, 6))
+    
+        # Plot RTT data on primary y-axis
+        rtt_x, rtt_y = decimate.decimate_for_axes(ax1, rtt_data.time, rtt_data.rtt, decimation, dpi)
+        ax1.plot(rtt_x, rtt_y, 
+                 'b-', linewidth=1.2, alpha=0.8, label='RTT')
+        ax1.set_xlabel('Time (seconds)', fontsize=12)
+        ax1.set_ylabel('Round Trip Time (ms)', color='b', fontsize=12)
+        ax1.tick_params(axis='y', labelcolor='b')
+        if queue is not None:
+            base, delay, window = queue
+            queuing.plot_layer(ax1, rtt_data.time, base, delay, window, decimation, dpi)
+    
+        # Add vertical lines for bandwidth changes - from the run manifest
+        if manifest is None:
+            manifest = phases.load_manifest()
+        colors = ['red', 'green', 'purple', 'orange', 'brown', 'olive', 'cyan']
+    
+        for i, (marker, label) in enumerate(phases.markers(manifest)):
+            ax1.axvline(x=marker, color=colors[i % len(colors)], linestyle='--', alpha=0.7, label=label)
+    
+        # If we have iperf data, plot it on secondary y-axis
+        if iperf_data and len(iperf_data['times']) > 1:
+            ax2 = ax1.twinx()
+            ax2.plot(iperf_data['times'], iperf_data['throughput'], 
+                     'g-', linewidth=0.6 if 'step' in iperf_data else 1.5,
+                     label=iperf_data.get('label', 'Throughput'))
+            ax2.set_ylabel('Throughput (Mbps)', color='g', fontsize=12)
+            ax2.tick_params(axis='y', labelcolor='g')
         
-        # Set y-axis limit to avoid extreme values
-        ax2.set_ylim(0, max(iperf_data['throughput']) * 1.1)
-    
-    # Calculate and add RTT statistics
-    rtt_stats = f"Avg RTT: {rtt_data['tcp.analysis.ack_rtt'].mean():.2f} ms\n"
-    rtt_stats += f"Min RTT: {rtt_data['tcp.analysis.ack_rtt'].min():.2f} ms\n"
-    rtt_stats += f"Max RTT: {rtt_data['tcp.analysis.ack_rtt'].max():.2f} ms\n"
-    rtt_stats += f"Std Dev: {rtt_data['tcp.analysis.ack_rtt'].std():.2f} ms"
-    
-    #plt.figtext(0.02, 0.02, rtt_stats, fontsize=10, 
-    #            bbox=dict(facecolor='white', alpha=0.7))
-    
-    # Add throughput statistics if available
-    if iperf_data and len(iperf_data['throughput']) > 1:
-        tput_stats = f"Avg Throughput: {np.mean(iperf_data['throughput']):.2f} Mbps\n"
-        tput_stats += f"Min Throughput: {np.min(iperf_data['throughput']):.2f} Mbps\n"
-        tput_stats += f"Max Throughput: {np.max(iperf_data['throughput']):.2f} Mbps\n"
-        tput_stats += f"Total Transfer: {sum(iperf_data['throughput'])/len(iperf_data['throughput'])*len(iperf_data['times']):.2f} Mb"
+            # Set y-axis limit to avoid extreme values
+            ax2.set_ylim(0, max(iperf_data['throughput']) * 1.1)
+    
+        # Calculate and add RTT statistics
+        stats = rtt_data.stats()
+        rtt_stats = f"Avg RTT: {stats['mean']:.2f} ms\n"
+        rtt_stats += f"Min RTT: {stats['min']:.2f} ms\n"
+        rtt_stats += f"Max RTT: {stats['max']:.2f} ms\n"
+        rtt_stats += f"Std Dev: {stats['std']:.2f} ms"
+    
+        #plt.figtext(0.02, 0.02, rtt_stats, fontsize=10, 
+        #            bbox=dict(facecolor='white', alpha=0.7))
+    
+        # Add throughput statistics if available
+        if iperf_data and len(iperf_data['throughput']) > 1:
+            tput_stats = f"Avg Throughput: {np.mean(iperf_data['throughput']):.2f} Mbps\n"
+            tput_stats += f"Min Throughput: {np.min(iperf_data['throughput']):.2f} Mbps\n"
+            tput_stats += f"Max Throughput: {np.max(iperf_data['throughput']):.2f} Mbps\n"
+            tput_stats += f"Total Transfer: {np.mean(iperf_data['throughput'])*len(iperf_data['times']):.2f} Mb"
         
-        #plt.figtext(0.02, 0.14, tput_stats, fontsize=10, 
-        #           bbox=dict(facecolor='white', alpha=0.7))
-    
-    # Add title and legend
-    title = f"TCP RTT Analysis - {output_prefix}"
-    if iperf_data:
-        title += " with iperf3 Throughput"
-    plt.title(title, fontsize=14)
-    
-    # Combine legends
-    lines1, labels1 = ax1.get_legend_handles_labels()
-    if iperf_data and len(iperf_data['times']) > 1:
-        lines2, labels2 = ax2.get_legend_handles_labels()
-        ax1.legend(lines1 + lines2, labels1 + labels2, loc='upper right')
-    else:
-        ax1.legend(loc='upper right')
-    
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
+            #plt.figtext(0.02, 0.14, tput_stats, fontsize=10, 
+            #           bbox=dict(facecolor='white', alpha=0.7))
+    
+        # Add title and legend
+        title = f"TCP RTT Analysis - {output_prefix}"
+        if iperf_data:
+            title += f" with {iperf_data.get('label', 'iperf3 Throughput')}"
+        plt.title(title, fontsize=14)
+    
+        # Combine legends
+        lines1, labels1 = ax1.get_legend_handles_labels()
+        if iperf_data and len(iperf_data['times']) > 1:
+            lines2, labels2 = ax2.get_legend_handles_labels()
+            ax1.legend(lines1 + lines2, labels1 + labels2, loc='upper right')
+        else:
+            ax1.legend(loc='upper right')
+    
+        plt.grid(True, alpha=0.3)
+        plt.tight_layout()
     
     # Save the figure
     if output_prefix:
         output_file = f"{output_prefix}_analysis.png"
     else:
         output_file = "tcp_analysis.png"
+    if output_dir:
+        output_file = os.path.join(output_dir, output_file)
     
-    plt.savefig(output_file, dpi=300)
+    with profiling.stage(f'savefig dpi={dpi}'):
+        plt.savefig(output_file, dpi=dpi)
     print(f"Plot saved as {output_file}")
     
     # Show the plot
-    plt.show()
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
+    return output_file
 
 def main():
     """Main function to handle command line arguments and orchestrate the analysis."""
-    if len(sys.argv) < 2 or len(sys.argv) > 3:
-        print(f"Usage: {sys.argv[0]} <rtt_csv_file> [iperf3_json_file]")
+    parser = argparse.ArgumentParser(description='Plot RTT (and optionally iperf3 throughput) for one run.')
+    parser.add_argument('rtt_csv_file', help='RTT CSV from tshark/pcaprtt.py, or a .pcap')
+    parser.add_argument('iperf_json_file', nargs='?', help='iperf3 JSON file')
+    parser.add_argument('--decimate', choices=decimate.METHODS, default='minmax',
+                        help='Thin the RTT line to the plot width before drawing (default: minmax)')
+    parser.add_argument('--throughput', choices=('iperf', 'pcap'), default='iperf',
+                        help="Throughput source: iperf3's 1 s intervals, or goodput binned from the pcap (see goodput.py)")
+    parser.add_argument('--tput-step', type=float, default=goodput.STEP,
+                        help='--throughput pcap: bin width in seconds (default: 0.01)')
+    parser.add_argument('--queuing', action='store_true',
+                        help='Queuing delay over a sliding-window minimum RTT: per-phase table and plot layer (see queuing.py)')
+    parser.add_argument('--base-window', type=float, default=queuing.WINDOW,
+                        help='Seconds of history for the base RTT minimum, batch and live (default: 10)')
+    parser.add_argument('--manifest', help='Run manifest with the tune schedule (default: run_<ts>.json next to the CSV)')
+    parser.add_argument('--live', action='store_true',
+                        help='Follow a growing RTT CSV or pcap and update stats/plot as it grows')
+    parser.add_argument('--window', type=float, default=30.0, help='Live mode: seconds shown in the rolling plot')
+    parser.add_argument('--fps', type=float, default=4.0, help='Live mode: refreshes per second')
+    parser.add_argument('--no-plot', action='store_true',
+                        help='Print stats only, skip the plot (live mode: no window)')
+    flows.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.from_args(args)
+    if args.base_window <= 0:
+        print("Error: --base-window must be positive")
         sys.exit(1)
     
-    rtt_csv_file = sys.argv[1]
-    iperf_json_file = sys.argv[2] if len(sys.argv) == 3 else None
+    if args.live:
+        import live
+        live.run_live(args.rtt_csv_file, args.window, args.fps, plot=not args.no_plot,
+                      base_window=args.base_window)
+        return
+    
+    rtt_csv_file = args.rtt_csv_file
+    iperf_json_file = args.iperf_json_file
     
     # Check if files exist
     if not os.path.exists(rtt_csv_file):
@@ -168,16 +194,53 @@ def main():
     output_prefix = os.path.splitext(os.path.basename(rtt_csv_file))[0]
     
     # Process files
-    rtt_data = process_rtt_csv(rtt_csv_file)
+    rtt_data = process_rtt_csv(rtt_csv_file, args.flow, args.flows)
     iperf_data = process_iperf_json(iperf_json_file) if iperf_json_file else None
+    if args.throughput == 'pcap':
+        # falls back to the iperf3 data (if any) when there is no capture
+        with profiling.stage('pcap goodput'):
+            iperf_data = goodput.load_for(rtt_csv_file, args.tput_step) or iperf_data
+    rtt = rtt_data.rtt
     
     # Print basic info
-    print(f"Analyzed {len(rtt_data)} RTT data points")
+    print(f"Analyzed {len(rtt)} RTT data points")
     if iperf_data:
-        print(f"Analyzed {len(iperf_data['times'])} iperf3 intervals")
+        print(f"Analyzed {len(iperf_data['times'])} {'goodput bins' if 'step' in iperf_data else 'iperf3 intervals'}")
+    with profiling.stage('stats', len(rtt)):
+        if len(rtt):
+            rtt_stats = rtt_data.stats()
+            print(f"Avg RTT: {rtt_stats['mean']:.4f}, Min RTT: {rtt_stats['min']:.4f}, "
+                  f"Max RTT: {rtt_stats['max']:.4f}, Std Dev: {rtt_stats['std']:.4f}")
+    
+        # Per-phase stats from the tune schedule
+        manifest = phases.load_manifest(rtt_csv_file, args.manifest)
+        if manifest['source'] is None:
+            print("No run manifest found, using the default full-test.sh schedule")
+        phase_rows = phases.summarize(rtt_data.time, rtt, manifest, iperf_data)
+        phases.print_table(phase_rows)
+    
+        # RTT against throughput: latency under load, inflation, lagged correlation
+        load = None
+        if iperf_data and len(iperf_data['times']) > 1 and len(rtt):
+            load = align.load_report(rtt_data.time, rtt, iperf_data, manifest)
+            align.print_report(load)
+    
+        # Queuing delay over the windowed base RTT, restarted at each phase
+        queue = queue_rows = None
+        if args.queuing:
+            with profiling.stage('queuing delay', len(rtt)):
+                base, delay = queuing.for_run(rtt_data.time, rtt, manifest, args.base_window)
+            queue = (base, delay, args.base_window)
+            queue_rows = queuing.phase_rows(rtt_data.time, base, delay, manifest, args.base_window)
+            queuing.print_table(queue_rows)
+        phases.write_summary(phase_rows, manifest, f"{output_prefix}_phases.json", load, queue_rows)
+    
+    if args.no_plot:
+        return
     
     # Create plot
-    create_plot(rtt_data, iperf_data, output_prefix)
+    create_plot(rtt_data, iperf_data, output_prefix, decimation=args.decimate, manifest=manifest,
+                queue=queue)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""Analyse every run in a directory in one go, headless and in parallel.
+
+Finds rtt_<ts>.csv files, pairs each with iperf3_<ts>.json when it exists,
+and runs the analyse.py pipeline (process_rtt_csv -> process_iperf_json ->
+create_plot, plus the per-phase rtt_<ts>_phases.json with the align.py
+load report) for each run in a process pool with the Agg backend. Runs
+whose rtt_<ts>_analysis.png is already newer than its inputs are skipped.
+--pyramid also writes the zoom pyramid of each rendered run (see
+pyramid.py).
+
+    python batch.py [directory] [-j 8] [--dpi 150] [--force] [--pyramid]
+                    [--where "qdisc = 'fq_codel'"]
+"""
+import os
+# must be set before analyse.py pulls in pyplot, workers inherit it
+os.environ['MPLBACKEND'] = 'Agg'
+
+import sys
+import re
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+import phases
+from phases import cell
+import align
+import catalog
+
+RUN_PATTERN = re.compile(r'^rtt_(\d{8}[-_]\d{6})\.csv$')
+
+
+def find_runs(directory):
+    """Return [(timestamp, rtt_csv, iperf_json or None)] sorted by timestamp."""
+    runs = []
+    for name in os.listdir(directory):
+        match = RUN_PATTERN.match(name)
+        if not match:
+            continue
+        ts = match.group(1)
+        iperf_json = os.path.join(directory, f"iperf3_{ts}.json")
+        runs.append((ts, os.path.join(directory, name),
+                     iperf_json if os.path.exists(iperf_json) else None))
+    return sorted(runs)
+
+
+def output_path(rtt_csv):
+    prefix = os.path.splitext(os.path.basename(rtt_csv))[0]
+    return os.path.join(os.path.dirname(rtt_csv), f"{prefix}_analysis.png")
+
+
+def is_up_to_date(rtt_csv, iperf_json):
+    """True when the analysis PNG is newer than every input of the run."""
+    png = output_path(rtt_csv)
+    if not os.path.exists(png):
+        return False
+    inputs = [rtt_csv] + ([iperf_json] if iperf_json else [])
+    manifest = phases.manifest_path(rtt_csv)
+    if manifest and os.path.exists(manifest):
+        inputs.append(manifest)
+    return os.path.getmtime(png) >= max(os.path.getmtime(p) for p in inputs)
+
+
+def summary_row(ts, status):
+    return {'run': ts, 'samples': 0, 'intervals': 0, 'avg_rtt': None, 'max_rtt': None,
+            'avg_tput': None, 'status': status, 'seconds': 0.0}
+
+
+def analyse_run(ts, rtt_csv, iperf_json, dpi, pyramids=False):
+    """Worker: parse and render one run, returning a summary row."""
+    import io
+    import contextlib
+    import analyse
+
+    row = summary_row(ts, 'ok')
+    start = time.perf_counter()
+    pyramid_key = None
+    # keep the per-run chatter of analyse.py out of the summary
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            if pyramids:
+                import pyramid
+                # before loading, so a file still being written isn't saved
+                pyramid_key = pyramid.source_key(rtt_csv)
+            rtt_data = analyse.process_rtt_csv(rtt_csv)
+            iperf_data = analyse.process_iperf_json(iperf_json) if iperf_json else None
+            row['samples'] = len(rtt_data)
+            row['intervals'] = len(iperf_data['times']) if iperf_data else 0
+            if len(rtt_data) == 0:
+                row['status'] = 'empty'
+            else:
+                stats = rtt_data.stats()
+                row['avg_rtt'] = stats['mean']
+                row['max_rtt'] = stats['max']
+                if iperf_data and len(iperf_data['throughput']):
+                    row['avg_tput'] = float(np.mean(iperf_data['throughput']))
+                prefix = os.path.splitext(rtt_csv)[0]
+                manifest = phases.load_manifest(rtt_csv)
+                phase_rows = phases.summarize(rtt_data.time, rtt_data.rtt, manifest, iperf_data)
+                load = None
+                if iperf_data and len(iperf_data['times']) > 1:
+                    load = align.load_report(rtt_data.time, rtt_data.rtt, iperf_data, manifest)
+                phases.write_summary(phase_rows, manifest, f"{prefix}_phases.json", load)
+                analyse.create_plot(rtt_data, iperf_data, os.path.basename(prefix),
+                                    output_dir=os.path.dirname(rtt_csv), dpi=dpi, show=False,
+                                    manifest=manifest)
+                if pyramids:
+                    pyramid.build_for(rtt_csv, run=rtt_data, key=pyramid_key)
+    except SystemExit:
+        # process_rtt_csv prints the reason and exits on unreadable files
+        lines = log.getvalue().strip().splitlines()
+        row['status'] = 'error: ' + lines[-1] if lines else 'error'
+    except Exception as e:
+        row['status'] = f'error: {e}'
+    row['seconds'] = time.perf_counter() - start
+    return row
+
+
+def print_summary(rows, elapsed):
+    print(f"{'run':<17} {'samples':>8} {'ivals':>5} {'avg rtt':>9} {'max rtt':>9} "
+          f"{'avg Mbps':>8} {'secs':>6}  status")
+    for row in rows:
+        print(f"{row['run']:<17} {row['samples']:>8} {row['intervals']:>5} "
+              f"{cell(row['avg_rtt'], 9, 4)} {cell(row['max_rtt'], 9, 4)} "
+              f"{cell(row['avg_tput'], 8, 2)} {row['seconds']:>6.2f}  {row['status']}")
+    counts = {}
+    for row in rows:
+        key = row['status'].split(':')[0]
+        counts[key] = counts.get(key, 0) + 1
+    print(f"{len(rows)} runs in {elapsed:.1f}s: " + ', '.join(f"{n} {k}" for k, n in sorted(counts.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyse every rtt_<ts>.csv / iperf3_<ts>.json run in a directory.')
+    parser.add_argument('directory', nargs='?', default='.', help='Directory with the run files')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(), help='Worker processes')
+    parser.add_argument('--dpi', type=int, default=300, help='Resolution of the saved plots')
+    parser.add_argument('--force', '-f', action='store_true', help='Re-render runs that are up to date')
+    parser.add_argument('--pyramid', action='store_true',
+                        help='Also build the zoom pyramid of each rendered run (see pyramid.py)')
+    parser.add_argument('--where', help="Only runs matching this SQL over the catalog (see catalog.py), e.g. \"rtt_p99 > 0.2\"")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"Error: directory '{args.directory}' not found.")
+        sys.exit(1)
+
+    runs = find_runs(args.directory)
+    if args.where:
+        selected = {row['run'] for row in catalog.select(args.directory, args.where)}
+        runs = [run for run in runs if run[0] in selected]
+    if not runs:
+        print(f"No rtt_<timestamp>.csv files in {args.directory}")
+        return
+
+    start = time.perf_counter()
+    rows = []
+    todo = []
+    for ts, rtt_csv, iperf_json in runs:
+        if not args.force and is_up_to_date(rtt_csv, iperf_json):
+            rows.append(summary_row(ts, 'skipped'))
+        else:
+            todo.append((ts, rtt_csv, iperf_json))
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(todo)))) as pool:
+            futures = [pool.submit(analyse_run, ts, rtt_csv, iperf_json, args.dpi, args.pyramid)
+                       for ts, rtt_csv, iperf_json in todo]
+            for future in as_completed(futures):
+                rows.append(future.result())
+
+    print_summary(sorted(rows, key=lambda r: r['run']), time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""Benchmark the analysis pipeline on synthetic runs, fully offline.
+
+For each size (number of RTT samples) a run is generated once into the
+work directory and reused afterwards:
+
+- rtt_<size>.csv: tshark-style quoted CSV, ~500 samples/s like the
+  testbed, a netem-like base RTT with queue build-up per phase, jitter,
+  a few microsecond control-connection acks and some empty ack_rtt
+  fields for the cleaning step to drop.
+- iperf3_<size>.json / iperf3_<size>.jsonl: the matching 1s intervals as
+  an iperf3 -J document and as --json-stream lines.
+- cap_<size>.pcap: data segments and their ACKs (capped at PCAP_MAX
+  packets, pcaps are only benchmarked small).
+
+Each stage is timed separately (wall and CPU seconds), then run again
+under tracemalloc for its peak traced memory (numpy buffers included,
+pyarrow's own allocator is not), and the process peak RSS is recorded at
+the end:
+
+    parse        loaders.read_columns (pandas, pyarrow or C engine)
+    clean        loaders.clean_columns
+    cache_write  loaders.load_rtt on a cold cache
+    cache_hit    loaders.load_rtt again
+    iperf_json   iperfparse on the -J document
+    iperf_stream iperfparse on the --json-stream file
+    pcap         pcaprtt.extract_rtt
+    stats        phases.summarize + align.load_report
+    render_*     analyse.create_plot, multi.create_overlay_plot, rtt.plot_rtt_and_throughput
+
+Results go to a JSON file; --compare prints the ratios between two of them.
+
+    python bench.py [--sizes 10k,1M,50M] [--stages parse,clean,...] [-o out.json]
+    python bench.py --compare old.json new.json
+"""
+import os
+# nothing here ever opens a window
+os.environ['MPLBACKEND'] = 'Agg'
+
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import tempfile
+import tracemalloc
+import numpy as np
+
+SIZES = {'10k': 10_000, '1M': 1_000_000, '50M': 50_000_000}
+DEFAULT_SIZES = '10k,1M'
+STAGES = ('parse', 'clean', 'cache_write', 'cache_hit', 'iperf_json', 'iperf_stream', 'pcap',
+          'stats', 'render_analyse', 'render_multi', 'render_rtt')
+
+# RTT samples per second of synthetic run, roughly what the testbed records
+RATE = 500
+PCAP_MAX = 1_000_000
+WRITE_ROWS = 1_000_000
+SEED = 2425
+
+
+def parse_size(text):
+    if text in SIZES:
+        return SIZES[text]
+    scale = {'k': 1_000, 'M': 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip('kM')) * scale)
+
+
+def synthetic_rtt(n, rng):
+    """(time, seq, rtt) for n samples following the default tune schedule shape."""
+    duration = max(n / RATE, 20.0)
+    t = np.sort(rng.uniform(0, duration, n))
+    # four phases, each with queue build-up towards a different plateau
+    phase = np.minimum((t / duration * 4).astype(np.int64), 3)
+    phase_start = phase * duration / 4
+    plateau = np.array([0.03, 0.4, 0.12, 0.8])[phase]
+    queue = plateau * (1 - np.exp(-(t - phase_start) / 2.0))
+    rtt = 0.05 + queue + rng.exponential(0.004, n)
+    control = rng.random(n) < 0.002
+    rtt[control] = rng.uniform(5e-6, 5e-5, control.sum())
+    seq = np.cumsum(rng.integers(1, 3, n)) * 1448 + 1
+    return t, seq, rtt
+
+
+def write_csv(path, n, rng):
+    """tshark-style quoted CSV, written in blocks so 50M rows never sit in memory as text."""
+    t, seq, rtt = synthetic_rtt(n, rng)
+    empty = rng.random(n) < 0.001
+    with open(path, 'w') as f:
+        f.write('"frame.time_relative","tcp.seq","tcp.analysis.ack_rtt"\n')
+        for lo in range(0, n, WRITE_ROWS):
+            hi = min(lo + WRITE_ROWS, n)
+            rows = [f'"{a:.9f}","{b}","{c:.9f}"' if not e else f'"{a:.9f}","{b}",""'
+                    for a, b, c, e in zip(t[lo:hi].tolist(), seq[lo:hi].tolist(),
+                                          rtt[lo:hi].tolist(), empty[lo:hi].tolist())]
+            f.write('\n'.join(rows) + '\n')
+
+
+def synthetic_intervals(n, rng):
+    duration = int(max(n / RATE, 20.0))
+    for i in range(duration):
+        bps = max(rng.normal(16e6, 3e6), 0.0)
+        stream = {'socket': 5, 'start': float(i), 'end': float(i + 1), 'seconds': 1.0,
+                  'bytes': int(bps / 8), 'bits_per_second': bps,
+                  'retransmits': int(rng.poisson(3)), 'snd_cwnd': int(rng.integers(1448, 600000)),
+                  'rtt': int(rng.integers(50000, 900000)), 'rttvar': int(rng.integers(500, 50000)),
+                  'pmtu': 1500, 'omitted': False, 'sender': True}
+        total = {key: stream[key] for key in ('start', 'end', 'seconds', 'bytes', 'bits_per_second',
+                                              'retransmits', 'omitted', 'sender')}
+        yield {'streams': [stream], 'sum': total}
+
+
+def write_iperf(json_path, stream_path, n, rng):
+    start = {'connected': [{'socket': 5, 'local_host': '192.168.10.10', 'local_port': 40000,
+                            'remote_host': '192.168.11.10', 'remote_port': 5201}],
+             'version': 'iperf 3.9', 'test_start': {'protocol': 'TCP', 'num_streams': 1}}
+    with open(json_path, 'w') as doc, open(stream_path, 'w') as lines:
+        doc.write('{\n\t"start":\t' + json.dumps(start, indent='\t') + ',\n\t"intervals":\t[')
+        lines.write(json.dumps({'event': 'start', 'data': start}) + '\n')
+        for i, interval in enumerate(synthetic_intervals(n, rng)):
+            doc.write((',' if i else '') + json.dumps(interval, indent='\t'))
+            lines.write(json.dumps({'event': 'interval', 'data': interval}) + '\n')
+        doc.write('],\n\t"end":\t{},\n\t"error":\t"interrupt - the client has terminated"\n}\n')
+        lines.write(json.dumps({'event': 'end', 'data': {}}) + '\n')
+
+
+PCAP_RECORD = np.dtype([
+    ('ts_sec', '<u4'), ('ts_usec', '<u4'), ('incl_len', '<u4'), ('orig_len', '<u4'),
+    ('eth', 'V12'), ('ethertype', '>u2'),
+    ('vihl', 'u1'), ('tos', 'u1'), ('tot_len', '>u2'), ('ipid', '>u2'), ('frag', '>u2'),
+    ('ttl', 'u1'), ('proto', 'u1'), ('ip_csum', '>u2'), ('src', '>u4'), ('dst', '>u4'),
+    ('sport', '>u2'), ('dport', '>u2'), ('seq', '>u4'), ('ack', '>u4'),
+    ('doff', 'u1'), ('flags', 'u1'), ('win', '>u2'), ('tcp_csum', '>u2'), ('urg', '>u2'),
+])
+
+
+def write_pcap(path, n, rng):
+    """n/2 full-size segments and one ACK each, headers only (snaplen 54)."""
+    segments = max(n // 2, 1)
+    t, _, rtt = synthetic_rtt(segments, rng)
+    seq = (1000 + np.arange(segments, dtype=np.int64) * 1448) % (1 << 32)
+    rec = np.zeros(2 * segments, dtype=PCAP_RECORD)
+    data, acks = rec[:segments], rec[segments:]
+    # ACKs leave the receiver in order, however the RTTs jitter
+    acked = np.maximum.accumulate(t + rtt)
+    for part, when in ((data, t), (acks, acked)):
+        when = 1_741_650_000 + when
+        part['ts_sec'] = when.astype(np.uint32)
+        part['ts_usec'] = ((when % 1) * 1e6).astype(np.uint32)
+        part['incl_len'] = 54
+        part['ethertype'] = 0x0800
+        part['vihl'] = 0x45
+        part['ttl'] = 64
+        part['proto'] = 6
+        part['doff'] = 0x50
+        part['win'] = 65535
+    data['orig_len'], data['tot_len'] = 54 + 1448, 40 + 1448
+    acks['orig_len'], acks['tot_len'] = 54, 40
+    data['ipid'] = np.arange(segments) & 0xFFFF
+    acks['ipid'] = (np.arange(segments) + 7) & 0xFFFF
+    data['src'], data['dst'], data['sport'], data['dport'] = 0xC0A80A0A, 0xC0A80B0A, 40000, 5201
+    acks['src'], acks['dst'], acks['sport'], acks['dport'] = 0xC0A80B0A, 0xC0A80A0A, 5201, 40000
+    data['seq'], data['ack'], data['flags'] = seq, 1, 0x18
+    acks['seq'], acks['ack'], acks['flags'] = 1, (seq + 1448) % (1 << 32), 0x10
+    rec = rec[np.argsort(np.concatenate([t, acked]), kind='stable')]
+    with open(path, 'wb') as f:
+        # pcap global header: magic, v2.4, no tz/sigfigs, snaplen 54, ethernet
+        f.write(np.array([0xA1B2C3D4], dtype='<u4').tobytes())
+        f.write(np.array([2, 4], dtype='<u2').tobytes())
+        f.write(np.array([0, 0, 54, 1], dtype='<u4').tobytes())
+        rec.tofile(f)
+
+
+def generate(workdir, label, n):
+    """Create (or reuse) the synthetic inputs for one size; returns their paths."""
+    paths = {'csv': os.path.join(workdir, f'rtt_{label}.csv'),
+             'iperf_json': os.path.join(workdir, f'iperf3_{label}.json'),
+             'iperf_stream': os.path.join(workdir, f'iperf3_{label}.jsonl'),
+             'pcap': os.path.join(workdir, f'cap_{label}.pcap')}
+    rng = np.random.default_rng(SEED + n)
+    if not os.path.exists(paths['csv']):
+        print(f"  generating {paths['csv']}")
+        write_csv(paths['csv'], n, rng)
+    if not os.path.exists(paths['iperf_stream']):
+        print(f"  generating {paths['iperf_json']} / .jsonl")
+        write_iperf(paths['iperf_json'], paths['iperf_stream'], n, rng)
+    if not os.path.exists(paths['pcap']):
+        print(f"  generating {paths['pcap']}")
+        write_pcap(paths['pcap'], min(n, PCAP_MAX), rng)
+    return paths
+
+
+def measure(func, trace_memory=True, setup=None):
+    """Time func, then rerun it under tracemalloc for its peak memory.
+
+    Tracing slows allocation-heavy code several times over, so it never
+    runs during the timed call. setup() runs before each call.
+    Returns (result, {'seconds', 'cpu_seconds', 'peak_mb'}).
+    """
+    if setup:
+        setup()
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = func()
+    stats = {'seconds': time.perf_counter() - wall, 'cpu_seconds': time.process_time() - cpu}
+    if trace_memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        func()
+        stats['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result, stats
+
+
+def run_size(label, n, workdir, stages, trace_memory=True):
+    """Generate the inputs for one size and time every requested stage on them."""
+    import loaders
+    import rttcache
+    import iperfparse
+    import phases
+    import align
+
+    print(f"{label} ({n} samples)")
+    start = time.perf_counter()
+    paths = generate(workdir, label, n)
+    results = {'samples': n, 'generate_seconds': time.perf_counter() - start,
+               'bytes': {kind: os.path.getsize(path) for kind, path in paths.items()},
+               'stages': {}}
+    state = {}
+
+    def stage(name, func, setup=None):
+        if name not in stages:
+            return None
+        result, stats = measure(func, trace_memory, setup)
+        results['stages'][name] = stats
+        print(f"  {name:<15} {stats['seconds']:>8.3f}s" +
+              (f" {stats['peak_mb']:>9.1f} MB" if 'peak_mb' in stats else ''))
+        return result
+
+    csv = paths['csv']
+    has_header, cols = loaders.detect_columns(csv)
+    df = stage('parse', lambda: loaders.read_columns(csv, has_header, cols))
+    if df is not None:
+        stage('clean', lambda: loaders.clean_columns(df, cols))
+        del df
+    stage('cache_write', lambda: loaders.load_rtt(csv), setup=lambda: rttcache.evict(workdir, limit=0))
+    columns = loaders.load_rtt(csv)
+    stage('cache_hit', lambda: loaders.load_rtt(csv))
+    stage('iperf_json', lambda: iperfparse.parse(paths['iperf_json']))
+    stage('iperf_stream', lambda: iperfparse.parse(paths['iperf_stream']))
+    stage('pcap', lambda: loaders.parse_rtt(paths['pcap']))
+
+    iperf_data = loaders.load_iperf(paths['iperf_json'], zero_start=True)
+    manifest = phases.load_manifest()
+    times, rtts = columns['frame.time_relative'], columns['tcp.analysis.ack_rtt']
+
+    def stats():
+        rows = phases.summarize(times, rtts, manifest, iperf_data)
+        return rows, align.load_report(times, rtts, iperf_data, manifest)
+    stage('stats', stats)
+
+    if any(name.startswith('render') for name in stages):
+        render(stage, paths, columns, iperf_data, manifest, workdir)
+    return results
+
+
+def render(stage, paths, columns, iperf_data, manifest, workdir):
+    """The three plotting front-ends, output written into workdir."""
+    import io
+    import contextlib
+    import matplotlib.pyplot as plt
+    import loaders
+    import analyse
+    import multi
+    import rtt
+
+    def quiet(func):
+        # the front-ends report what they plot, keep that out of the table
+        def run():
+            with contextlib.redirect_stdout(io.StringIO()):
+                func()
+            plt.close('all')
+        return run
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        run = loaders.Run(paths['csv'], columns['frame.time_relative'], columns['tcp.analysis.ack_rtt'])
+        stage('render_analyse', quiet(lambda: analyse.create_plot(
+            run, iperf_data, 'bench', output_dir=workdir, show=False, manifest=manifest)))
+        stage('render_multi', quiet(lambda: multi.create_overlay_plot(
+            [run, run], [iperf_data, None], ['a', 'b'],
+            os.path.join(workdir, 'bench_comparison.png'), manifest=manifest)))
+        stage('render_rtt', quiet(lambda: rtt.plot_rtt_and_throughput(paths['csv'], paths['iperf_json'])))
+    finally:
+        os.chdir(cwd)
+
+
+def environment():
+    import pandas
+    try:
+        import pyarrow
+        arrow = pyarrow.__version__
+    except ImportError:
+        arrow = None
+    import loaders
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pandas.__version__,
+            'pyarrow': arrow, 'csv_engine': loaders.csv_engine(), 'machine': platform.machine(),
+            'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def compare(old_file, new_file):
+    """Print new/old time ratios for every stage both result files have."""
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    print(f"{'size':<6} {'stage':<15} {'old s':>9} {'new s':>9} {'ratio':>6} {'old MB':>8} {'new MB':>8}")
+    for label, result in new['sizes'].items():
+        before = old['sizes'].get(label)
+        if not before:
+            continue
+        for name, stats in result['stages'].items():
+            prev = before['stages'].get(name)
+            if not prev:
+                continue
+            ratio = stats['seconds'] / prev['seconds'] if prev['seconds'] else float('nan')
+            mem = lambda s: f"{s['peak_mb']:>8.1f}" if 'peak_mb' in s else f"{'-':>8}"
+            print(f"{label:<6} {name:<15} {prev['seconds']:>9.3f} {stats['seconds']:>9.3f} "
+                  f"{ratio:>6.2f} {mem(prev)} {mem(stats)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the analysis pipeline on synthetic runs.')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f'Comma separated sample counts, e.g. 10k,1M,50M (default: {DEFAULT_SIZES})')
+    parser.add_argument('--stages', default=','.join(STAGES), help='Comma separated stages to run')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'rtt-bench'),
+                        help='Where generated inputs and plots go (reused between runs)')
+    parser.add_argument('--output', '-o', help='Result JSON (default: bench_<timestamp>.json)')
+    parser.add_argument('--engine', choices=('pyarrow', 'c', 'python'),
+                        help='pandas CSV engine for the parse stages (sets RTT_CSV_ENGINE, default: loaders.py picks)')
+    parser.add_argument('--no-memory', action='store_true', help='Skip tracemalloc, times only')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two result files')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.engine:
+        os.environ['RTT_CSV_ENGINE'] = args.engine
+    stages = [s for s in args.stages.split(',') if s]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        print(f"Error: unknown stages {sorted(unknown)}, expected some of {STAGES}")
+        sys.exit(1)
+    os.makedirs(args.workdir, exist_ok=True)
+
+    results = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'environment': environment(), 'sizes': {}}
+    for label in args.sizes.split(','):
+        results['sizes'][label] = run_size(label, parse_size(label), args.workdir, stages,
+                                           trace_memory=not args.no_memory)
+    # ru_maxrss is in KiB on Linux
+    results['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    output = args.output or f"bench_{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Peak RSS {results['max_rss_mb']:.0f} MB, results saved as {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""SQLite catalog of the runs in a directory, so they can be picked by query.
+
+`python catalog.py update [dir]` indexes the run artifacts in dir (and
+dir/capture) into dir/runs.sqlite:
+
+    rtt_<ts>.csv, iperf3_<ts>.json or <ts>.json, run_<ts>.json (manifest),
+    <ts>.pcap, capture/s_<ts>.pcap, capture/r_<ts>.pcap
+
+Every file is recorded with its size, mtime and a status (ok, empty,
+header-only, truncated, no-intervals, broken) so leftovers from failed runs
+are easy to spot. Per run (timestamp) the qdisc and tune schedule from the
+manifest, duration, sample/interval counts, RTT summary stats (dominant flow, see flows.py), mean
+throughput, retransmits and the per-phase table from phases.py are stored.
+Only files whose size or mtime changed since the last update are looked at
+again, and only their runs are recomputed; loading goes through the RTT
+cache so that is cheap too.
+
+    python catalog.py update [dir]
+    python catalog.py list [dir] [--where "qdisc = 'fq_codel' AND rtt_p99 > 0.2"]
+    python catalog.py files [dir] [--broken]
+
+--where is an SQL expression over the runs table (columns: see `list`),
+which the plotting scripts accept too (multi.py --where/--by,
+batch.py --where). Those (and `list`) first bring runs.sqlite up to date,
+an incremental update() that writes to it, then run the --where itself on
+a read-only connection.
+"""
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import numpy as np
+
+import phases
+from phases import num, cell
+import flows
+import queuing
+
+DB_NAME = 'runs.sqlite'
+# bump when the schema or what gets stored changes, the catalog is rebuilt
+SCHEMA_VERSION = 3
+
+TS = r'(\d{8}[-_]\d{6})'
+PATTERNS = [
+    ('rtt_csv', re.compile(rf'^rtt_{TS}\.csv$')),
+    ('iperf_json', re.compile(rf'^(?:iperf3_)?{TS}\.json$')),
+    ('manifest', re.compile(rf'^run_{TS}\.json$')),
+    ('pcap', re.compile(rf'^{TS}\.pcap$')),
+]
+CAPTURE_PATTERNS = [
+    ('capture_s', re.compile(rf'^s_{TS}\.pcap$')),
+    ('capture_r', re.compile(rf'^r_{TS}\.pcap$')),
+]
+
+SCHEMA = '''
+CREATE TABLE files (
+    path TEXT PRIMARY KEY, run TEXT, kind TEXT, size INTEGER, mtime_ns INTEGER,
+    status TEXT, rows INTEGER, detail TEXT, indexed_at REAL
+);
+CREATE TABLE runs (
+    run TEXT PRIMARY KEY, qdisc TEXT, schedule TEXT, schedule_source TEXT, duration REAL,
+    rtt_csv TEXT, iperf_json TEXT, pcap TEXT, rtt_samples INTEGER, iperf_intervals INTEGER,
+    rtt_mean REAL, rtt_std REAL, rtt_min REAL, rtt_p50 REAL, rtt_p95 REAL, rtt_p99 REAL, rtt_max REAL,
+    tput_mean REAL, retransmits INTEGER, iperf_error TEXT, status TEXT, problems TEXT
+);
+CREATE TABLE phases (
+    run TEXT, phase INTEGER, start REAL, "end" REAL, bw TEXT, netem_rtt TEXT, samples INTEGER,
+    rtt_mean REAL, rtt_p50 REAL, rtt_p95 REAL, rtt_p99 REAL, queue_mean REAL, tput_mean_mbps REAL,
+    PRIMARY KEY (run, phase)
+);
+CREATE INDEX files_run ON files (run);
+'''
+
+
+def db_path(directory):
+    return os.path.join(directory, DB_NAME)
+
+
+def connect(directory):
+    """Open (creating or rebuilding on a schema change) the catalog for directory."""
+    conn = sqlite3.connect(db_path(directory))
+    conn.row_factory = sqlite3.Row
+    if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+        conn.executescript('DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS runs; '
+                           'DROP TABLE IF EXISTS phases;' + SCHEMA)
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+    return conn
+
+
+def scan(directory):
+    """{relative path: (kind, run)} for every run artifact under directory."""
+    found = {}
+    for sub, patterns in (('', PATTERNS), ('capture', CAPTURE_PATTERNS)):
+        folder = os.path.join(directory, sub)
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            for kind, pattern in patterns:
+                match = pattern.match(name)
+                if match:
+                    found[os.path.join(sub, name)] = (kind, match.group(1))
+                    break
+    return found
+
+
+def inspect(path, kind):
+    """(status, rows, detail) for one artifact, never raising."""
+    import loaders
+    if os.path.getsize(path) == 0:
+        return 'empty', 0, None
+    try:
+        if kind == 'rtt_csv':
+            rows = len(loaders.load_rtt(path, flows.ALL)['tcp.analysis.ack_rtt'])
+            return ('ok' if rows else 'header-only'), rows, None
+        if kind == 'iperf_json':
+            parsed = loaders.load_iperf(path)['parsed']
+            rows = len(parsed['times'])
+            if rows == 0:
+                return 'no-intervals', 0, parsed['error']
+            return ('truncated' if parsed['truncated'] else 'ok'), rows, parsed['error']
+        if kind == 'manifest':
+            with open(path) as f:
+                manifest = json.load(f)
+            return 'ok', len(manifest['phases']), manifest.get('qdisc')
+        import pcaprtt
+        records, span, truncated = pcaprtt.count_records(path)
+        if records == 0:
+            return 'header-only', 0, None
+        return ('truncated' if truncated else 'ok'), records, f'{span:.3f}s'
+    except Exception as e:
+        return 'broken', None, str(e)
+
+
+def summarize_run(directory, run, files):
+    """The runs row and phase rows for one timestamp, from its indexed files."""
+    import loaders
+    by_kind = {row['kind']: row for row in files}
+    row = {'run': run, 'problems': ', '.join(f"{r['kind']}:{r['status']}" for r in files
+                                             if r['status'] != 'ok') or None}
+    for kind in ('rtt_csv', 'iperf_json', 'pcap'):
+        row[kind] = by_kind[kind]['path'] if kind in by_kind else None
+
+    rtt_path = os.path.join(directory, row['rtt_csv']) if row['rtt_csv'] else None
+    manifest_file = os.path.join(directory, by_kind['manifest']['path']) if 'manifest' in by_kind else None
+    manifest = phases.load_manifest(rtt_path, manifest_file)
+    row['qdisc'] = manifest.get('qdisc')
+    row['schedule'] = json.dumps(manifest['phases'])
+    row['schedule_source'] = 'manifest' if manifest['source'] else 'default'
+
+    columns = None
+    if rtt_path and by_kind['rtt_csv']['status'] == 'ok':
+        columns = loaders.load_rtt(rtt_path)
+    iperf = None
+    if row['iperf_json'] and by_kind['iperf_json']['status'] in ('ok', 'truncated'):
+        iperf = loaders.load_iperf(os.path.join(directory, row['iperf_json']))
+
+    rtt = columns['tcp.analysis.ack_rtt'] if columns is not None else np.zeros(0)
+    row['rtt_samples'] = len(rtt)
+    row['iperf_intervals'] = len(iperf['times']) if iperf else 0
+    if len(rtt):
+        p50, p95, p99 = np.percentile(rtt, (50, 95, 99))
+        row.update(rtt_mean=float(rtt.mean()), rtt_std=num(rtt.std(ddof=1)) if len(rtt) > 1 else None,
+                   rtt_min=float(rtt.min()), rtt_p50=float(p50), rtt_p95=float(p95),
+                   rtt_p99=float(p99), rtt_max=float(rtt.max()))
+    if iperf:
+        parsed = iperf['parsed']
+        row['tput_mean'] = float(np.mean(iperf['throughput']))
+        row['retransmits'] = int(np.nansum(parsed['retransmits']))
+        row['iperf_error'] = parsed['error']
+
+    # the default schedule's end says nothing about this run
+    ends = [manifest.get('end')] if manifest['source'] else []
+    if len(rtt):
+        ends.append(float(columns['frame.time_relative'].max()))
+    if iperf:
+        ends.append(float(iperf['times'][-1]))
+    row['duration'] = max((e for e in ends if e is not None), default=None)
+    row['status'] = 'ok' if len(rtt) else 'empty'
+
+    phase_rows = []
+    if len(rtt):
+        times = columns['frame.time_relative']
+        phase_rows = phases.summarize(times, rtt, manifest, iperf)
+        # queuing delay over the windowed minimum RTT, see queuing.py
+        base, delay = queuing.for_run(times, rtt, manifest)
+        for p, q in zip(phase_rows, queuing.phase_rows(times, base, delay, manifest)):
+            p['queue_mean'] = q['queue_mean']
+    return row, phase_rows
+
+
+def update(directory, verbose=True):
+    """Bring the catalog in line with the files on disk; returns the runs touched."""
+    conn = connect(directory)
+    found = scan(directory)
+    known = {row['path']: row for row in conn.execute('SELECT * FROM files')}
+    dirty = set()
+
+    for path in set(known) - set(found):
+        dirty.add(known[path]['run'])
+        conn.execute('DELETE FROM files WHERE path = ?', (path,))
+    for path, (kind, run) in sorted(found.items()):
+        full = os.path.join(directory, path)
+        try:
+            st = os.stat(full)
+        except OSError:
+            continue
+        old = known.get(path)
+        if old and old['size'] == st.st_size and old['mtime_ns'] == st.st_mtime_ns:
+            continue
+        status, rows, detail = inspect(full, kind)
+        conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     (path, run, kind, st.st_size, st.st_mtime_ns, status, rows, detail, time.time()))
+        dirty.add(run)
+        if verbose:
+            print(f"indexed {path}: {status}" + (f" ({rows} rows)" if rows else ''))
+
+    for run in sorted(dirty):
+        conn.execute('DELETE FROM runs WHERE run = ?', (run,))
+        conn.execute('DELETE FROM phases WHERE run = ?', (run,))
+        files = conn.execute('SELECT * FROM files WHERE run = ? ORDER BY kind', (run,)).fetchall()
+        if not files:
+            continue
+        row, phase_rows = summarize_run(directory, run, files)
+        conn.execute(f"INSERT INTO runs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                     list(row.values()))
+        for p in phase_rows:
+            conn.execute('INSERT INTO phases VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         (run, p['phase'], p['start'], p['end'], p['bw'], p['netem_rtt'], p['samples'],
+                          p['rtt_mean'], p['rtt_p50'], p['rtt_p95'], p['rtt_p99'], p['queue_mean'],
+                          p.get('tput_mean_mbps')))
+    conn.commit()
+    conn.close()
+    return dirty
+
+
+def query(directory, where=None, params=()):
+    """Runs matching an SQL expression over the runs table, oldest first.
+
+    Reads the catalog as it is, call update() first to pick up new or
+    changed files. Paths in the result are joined with directory so they
+    can be opened directly.
+    """
+    # read-only, so a --where can't modify anything
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path(directory))}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    sql = 'SELECT * FROM runs' + (f' WHERE {where}' if where else '') + ' ORDER BY run'
+    try:
+        rows = [dict(row) for row in conn.execute(sql, params)]
+    except sqlite3.Error as e:
+        raise ValueError(f"bad --where expression '{where}': {e}")
+    finally:
+        conn.close()
+    for row in rows:
+        for key in ('rtt_csv', 'iperf_json', 'pcap'):
+            if row[key]:
+                row[key] = os.path.join(directory, row[key])
+    return rows
+
+
+def add_arguments(parser):
+    """--where / --catalog options shared by the plotting scripts."""
+    parser.add_argument('--where', help="Select runs from the catalog by SQL, e.g. \"qdisc = 'fq_codel' AND rtt_p99 > 0.2\"")
+    parser.add_argument('--catalog', default='.', help='Directory whose runs.sqlite --where queries (default: .)')
+
+
+def select(directory, where):
+    """Runs in directory with an RTT CSV that match where, or exits with the reason.
+
+    Updates directory/runs.sqlite first (incrementally), so the runs
+    recorded since the last update are included.
+    """
+    update(directory, verbose=False)
+    try:
+        rows = query(directory, where)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    rows = [row for row in rows if row['rtt_csv'] and row['rtt_samples']]
+    if not rows:
+        print(f"No runs with RTT data match: {where}")
+        sys.exit(1)
+    return rows
+
+
+def print_runs(rows):
+    print(f"{'run':<17} {'qdisc':<10} {'secs':>6} {'samples':>8} {'mean':>8} {'p95':>8} {'p99':>8} "
+          f"{'Mbps':>7} {'retx':>5}  problems")
+    for row in rows:
+        print(f"{row['run']:<17} {row['qdisc'] or '-':<10} {cell(row['duration'], 6, 1)} "
+              f"{row['rtt_samples']:>8} {cell(row['rtt_mean'], 8, 4)} {cell(row['rtt_p95'], 8, 4)} "
+              f"{cell(row['rtt_p99'], 8, 4)} {cell(row['tput_mean'], 7, 2)} "
+              f"{row['retransmits'] if row['retransmits'] is not None else '-':>5}  {row['problems'] or ''}")
+    print(f"{len(rows)} runs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index run artifacts into runs.sqlite and query them.')
+    parser.add_argument('command', choices=('update', 'list', 'files'))
+    parser.add_argument('directory', nargs='?', default='.', help='Directory with the run files')
+    parser.add_argument('--where', help='list: SQL expression over the runs table')
+    parser.add_argument('--broken', action='store_true', help='files: only artifacts that are not ok')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"Error: directory '{args.directory}' not found.")
+        sys.exit(1)
+
+    if args.command == 'update':
+        dirty = update(args.directory)
+        print(f"{len(dirty)} runs updated in {db_path(args.directory)}")
+    elif args.command == 'list':
+        update(args.directory, verbose=False)
+        try:
+            print_runs(query(args.directory, args.where))
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+    else:
+        update(args.directory, verbose=False)
+        conn = sqlite3.connect(db_path(args.directory))
+        sql = 'SELECT path, kind, status, size, rows, detail FROM files'
+        if args.broken:
+            sql += " WHERE status != 'ok'"
+        for path, kind, status, size, rows, detail in conn.execute(sql + ' ORDER BY path'):
+            print(f"{path:<40} {kind:<11} {status:<13} {size:>10} {rows if rows is not None else '-':>8}  {detail or ''}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""Is one qdisc really different from another? Bootstrap CIs per phase.
+
+Takes several runs per qdisc (--group label=a.csv,b.csv, or --where/--by
+over the catalog, see catalog.py). For every phase of the tune schedule
+(and the whole run), it estimates the difference in RTT percentiles
+between each group and the first one. Each difference comes with a
+bootstrap confidence interval:
+
+- each group's samples for the phase are resampled with replacement,
+  within each run, so every resample keeps the runs' sample counts;
+- a percentile of a resample is an order statistic of the sorted pooled
+  samples. So instead of an index matrix (resamples x samples) a batch
+  of resamples is a matrix of draw counts (resamples x sorted positions
+  near the percentile), one multinomial per run, and the percentile is
+  the first position whose cumulative count reaches its rank. This has
+  the same distribution as resampling indices but costs sqrt(n) rather
+  than n per resample (2000 resamples of 1M samples: ~3s instead of
+  ~90s). Batches are sized to about BATCH_ELEMENTS entries;
+- the resamples can be split over a process pool (--jobs). Each piece
+  has its own random stream spawned from --seed.
+
+A difference is marked '*' when its confidence interval excludes 0; p is
+the two-sided bootstrap p-value. Samples within a run are correlated in
+time, so treat the intervals as optimistic, the more runs per group the
+better.
+
+    python compare.py -g fq_codel=rtt_a.csv,rtt_b.csv -g pfifo=rtt_c.csv,rtt_d.csv
+    python compare.py --where "duration > 15" --by qdisc [--resamples 2000] [--jobs 4]
+"""
+import sys
+import json
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import phases
+from phases import num, cell
+import flows
+import catalog
+import profiling
+import multi
+
+PERCENTILES = (50, 95, 99)
+RESAMPLES = 2000
+CONFIDENCE = 95
+# entries of one resamples x window count matrix, bounds the memory per batch
+BATCH_ELEMENTS = 1 << 22
+# half-width of the sorted positions modelled one by one around a percentile
+WINDOW_SIGMAS = 8
+
+
+def run_layout(runs):
+    """Pooled samples sorted, the run each one came from, and the run sizes."""
+    counts = np.array([len(r) for r in runs], dtype=np.int64)
+    values = np.concatenate(runs) if runs else np.zeros(0)
+    run = np.repeat(np.arange(len(runs)), counts)
+    order = np.argsort(values, kind='stable')
+    return values[order], run[order], counts
+
+
+def _window(n, pct):
+    """Sorted positions [lo, hi) a resample's pct-th percentile can realistically fall in."""
+    q = pct / 100.0
+    rank = min(max(int(np.ceil(q * n)), 1), n)
+    half = int(WINDOW_SIGMAS * np.sqrt(n * q * (1 - q))) + 50
+    return rank, max(0, rank - 1 - half), min(n, rank + half)
+
+
+def resample_percentiles(values, run, counts, n_resamples, pcts, seed):
+    """Percentiles of n_resamples within-run bootstrap resamples, (n_resamples x pcts).
+
+    values/run/counts come from run_layout(). A resample's percentile is
+    an order statistic of the pooled samples, so only how many draws land
+    on each sorted position matters. Per run those counts are one
+    multinomial draw, and only positions within WINDOW_SIGMAS standard
+    deviations of the percentile's rank get their own category. Everything
+    below or above the window is lumped into one category on each side.
+    That gives the same distribution as resampling indices, at a cost of
+    sqrt(n) per resample instead of n.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(values)
+    out = np.full((n_resamples, len(pcts)), np.nan)
+    if n == 0:
+        return out
+    for j, pct in enumerate(pcts):
+        rank, lo, hi = _window(n, pct)
+        in_window = run[lo:hi]
+        below = np.bincount(run[:lo], minlength=len(counts))
+        above = counts - below - np.bincount(in_window, minlength=len(counts))
+        columns = [np.flatnonzero(in_window == r) for r in range(len(counts))]
+        batch = max(1, BATCH_ELEMENTS // (hi - lo))
+        for start in range(0, n_resamples, batch):
+            size = min(batch, n_resamples - start)
+            under = np.zeros(size, dtype=np.int64)
+            hits = np.zeros((size, hi - lo), dtype=np.int64)
+            for r, cols in enumerate(columns):
+                if counts[r] == 0:
+                    continue
+                pvals = np.concatenate([[below[r]], np.ones(len(cols)), [above[r]]]) / counts[r]
+                draw = rng.multinomial(counts[r], pvals, size=size)
+                under += draw[:, 0]
+                hits[:, cols] = draw[:, 1:-1]
+            # first sorted position where the resample has rank draws at or below it;
+            # outside the window (vanishingly rare) the window edge stands in
+            reached = (under[:, None] + np.cumsum(hits, axis=1)) >= rank
+            pos = np.where(reached.any(axis=1), np.argmax(reached, axis=1), hi - lo - 1)
+            out[start:start + size, j] = values[lo + pos]
+    return out
+
+
+def bootstrap(runs, n_resamples=RESAMPLES, pcts=PERCENTILES, seed=0, pool=None, tasks=1):
+    """(n_resamples x pcts) bootstrap distribution of the percentiles of runs.
+
+    runs is a list of per-run sample arrays; each resample draws every run's
+    sample count from that run. With a process pool the resamples are split
+    into tasks pieces; every piece gets its own child of SeedSequence(seed),
+    so the result depends only on seed and tasks.
+    """
+    values, run, counts = run_layout(runs)
+    seeds = np.random.SeedSequence(seed).spawn(tasks)
+    sizes = [len(part) for part in np.array_split(np.arange(n_resamples), tasks)]
+    if pool is None:
+        parts = [resample_percentiles(values, run, counts, size, pcts, s) for size, s in zip(sizes, seeds)]
+    else:
+        futures = [pool.submit(resample_percentiles, values, run, counts, size, pcts, s)
+                   for size, s in zip(sizes, seeds)]
+        parts = [f.result() for f in futures]
+    return np.concatenate(parts)
+
+
+def _p_value(diffs):
+    diffs = diffs[~np.isnan(diffs)]
+    if len(diffs) == 0:
+        return np.nan
+    return min(1.0, 2 * min((diffs <= 0).mean(), (diffs >= 0).mean()))
+
+
+def _estimate(runs, pcts):
+    # inverted CDF, the order statistic the bootstrap resamples use too
+    if not runs:
+        return np.full(len(pcts), np.nan)
+    return np.percentile(np.concatenate(runs), pcts, method='inverted_cdf')
+
+
+def phase_samples(runs, manifest):
+    """{phase index or 'all': [per-run RTT arrays]} for (columns, manifest) runs."""
+    out = {'all': []}
+    for i in range(len(manifest['phases'])):
+        out[i] = []
+    for columns, run_manifest in runs:
+        times, rtt = columns['frame.time_relative'], columns['tcp.analysis.ack_rtt']
+        out['all'].append(rtt)
+        keep = times >= run_manifest['phases'][0]['start']
+        if run_manifest.get('end') is not None:
+            keep &= times <= run_manifest['end']
+        phase = phases.assign(times[keep], run_manifest)
+        values = rtt[keep]
+        # the same phase index in every run, the schedule is per run
+        order = np.argsort(phase, kind='stable')
+        bounds = np.searchsorted(phase[order], np.arange(len(manifest['phases']) + 1))
+        for i in range(len(manifest['phases'])):
+            part = values[order[bounds[i]:bounds[i + 1]]]
+            if len(part):
+                out[i].append(part)
+    return out
+
+
+def compare(groups, manifest, n_resamples=RESAMPLES, pcts=PERCENTILES, confidence=CONFIDENCE,
+            seed=0, jobs=1):
+    """Bootstrap every group's percentiles per phase and diff them against the first group.
+
+    groups is [(label, [(columns, manifest), ...])]. Returns a list of row
+    dicts: phase, group, runs, samples, and per percentile the estimate,
+    the difference to the baseline, its CI and p-value.
+    """
+    per_group = [(label, phase_samples(runs, manifest)) for label, runs in groups]
+    keys = list(range(len(manifest['phases']))) + ['all']
+    tail = (100 - confidence) / 2
+    pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    rows = []
+    try:
+        for key in keys:
+            dists = []
+            for g, (label, samples) in enumerate(per_group):
+                with profiling.stage(f'bootstrap {label} phase {key}', sum(len(r) for r in samples[key])):
+                    # one random stream per group and phase
+                    dists.append(bootstrap(samples[key], n_resamples, pcts, [seed, g, keys.index(key)],
+                                           pool, jobs))
+            base = dists[0]
+            base_estimate = _estimate(per_group[0][1][key], pcts)
+            for g, (label, samples) in enumerate(per_group):
+                runs = samples[key]
+                estimate = _estimate(runs, pcts)
+                row = {'phase': key, 'bw': manifest['phases'][key].get('bw') if key != 'all' else 'all',
+                       'group': label, 'runs': len(runs), 'samples': int(sum(len(r) for r in runs))}
+                for j, pct in enumerate(pcts):
+                    row[f'p{pct}'] = num(estimate[j])
+                    if g == 0:
+                        continue
+                    diffs = dists[g][:, j] - base[:, j]
+                    with np.errstate(invalid='ignore'):
+                        lo, hi = (np.nanpercentile(diffs, (tail, 100 - tail))
+                                  if np.any(~np.isnan(diffs)) else (np.nan, np.nan))
+                    row[f'p{pct}_diff'] = num(estimate[j] - base_estimate[j])
+                    row[f'p{pct}_ci'] = [num(lo), num(hi)]
+                    row[f'p{pct}_p'] = num(_p_value(diffs))
+                rows.append(row)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return rows
+
+
+def print_table(rows, pcts=PERCENTILES, confidence=CONFIDENCE):
+    print(f"{'phase':<10} {'group':<12} {'runs':>4} {'n':>8}  "
+          + '  '.join(f"{f'p{p}':>8} {'diff':>8} {f'{confidence:g}% CI':>19} {'p':>6}" for p in pcts))
+    for row in rows:
+        cells = []
+        for p in pcts:
+            if f'p{p}_diff' not in row:
+                cells.append(f"{cell(row[f'p{p}'], 8, 4)} {'':>8} {'':>19} {'':>6}")
+                continue
+            lo, hi = row[f'p{p}_ci']
+            mark = '*' if lo is not None and (lo > 0 or hi < 0) else ' '
+            ci = f"[{cell(lo, 8, 4)},{cell(hi, 8, 4)}]"
+            cells.append(f"{cell(row[f'p{p}'], 8, 4)} {cell(row[f'p{p}_diff'], 8, 4)} {ci:>19} "
+                         f"{cell(row[f'p{p}_p'], 5, 3)}{mark}")
+        print(f"{str(row['bw']):<10} {row['group']:<12} {row['runs']:>4} {row['samples']:>8}  " + '  '.join(cells))
+
+
+def load_runs(groups, flow=flows.DOMINANT, manifest_file=None):
+    """[(label, [(columns, manifest), ...])], unreadable runs left out."""
+    files = [f for _, group_files in groups for f in group_files]
+    with profiling.stage('load groups', len(files)), ThreadPoolExecutor() as pool:
+        columns = dict(zip(files, pool.map(multi.load_rtt_columns, files, [flow] * len(files))))
+    return [(label, [(columns[f], phases.load_manifest(f, manifest_file)) for f in group_files
+                     if columns[f] is not None])
+            for label, group_files in groups]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-phase RTT percentile differences between groups of runs, with bootstrap CIs.')
+    parser.add_argument('--group', '-g', action='append', type=multi.parse_group, metavar='LABEL=A.csv,B.csv',
+                        help='A group of runs (repeatable); the first group is the baseline')
+    catalog.add_arguments(parser)
+    parser.add_argument('--by', default='qdisc', help='With --where: one group per value of this runs column (default: qdisc)')
+    parser.add_argument('--baseline', help='Label of the group to compare against (default: the first)')
+    parser.add_argument('--percentiles', default=','.join(map(str, PERCENTILES)),
+                        help='Comma separated RTT percentiles to compare (default: 50,95,99)')
+    parser.add_argument('--resamples', '-n', type=int, default=RESAMPLES, help='Bootstrap resamples (default: 2000)')
+    parser.add_argument('--confidence', type=float, default=CONFIDENCE, help='Confidence level in percent (default: 95)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Worker processes for the resampling (default: 1)')
+    parser.add_argument('--manifest', help='Tune schedule for all runs (default: each run\'s run_<ts>.json)')
+    parser.add_argument('--output', '-o', help='Also write the rows as JSON')
+    flows.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.from_args(args)
+
+    if args.where:
+        if args.group:
+            print("Error: --where selects the runs itself, don't also give --group.")
+            sys.exit(1)
+        args.group = multi.groups_from_catalog(catalog.select(args.catalog, args.where), args.by, args.where)
+    if not args.group or len(args.group) < 2:
+        parser.error('need at least two groups of runs (--group twice, or --where with --by)')
+    if args.baseline:
+        labels = [label for label, _ in args.group]
+        if args.baseline not in labels:
+            print(f"Error: no group '{args.baseline}', groups are {labels}")
+            sys.exit(1)
+        args.group.insert(0, args.group.pop(labels.index(args.baseline)))
+    try:
+        pcts = tuple(float(p) for p in args.percentiles.split(','))
+    except ValueError:
+        parser.error(f"bad --percentiles '{args.percentiles}'")
+    pcts = tuple(int(p) if p.is_integer() else p for p in pcts)
+
+    if args.flows:
+        for _, files in args.group:
+            for csv_file in files:
+                multi.print_file_flows(csv_file)
+    groups = load_runs(args.group, args.flow, args.manifest)
+    empty = [label for label, runs in groups if not runs]
+    if empty:
+        print(f"Error: no readable runs in group(s) {', '.join(empty)}")
+        sys.exit(1)
+    # phases are lined up by index, labelled by the baseline's first run
+    manifest = groups[0][1][0][1]
+    if len({len(m['phases']) for _, runs in groups for _, m in runs}) > 1:
+        print("Warning: runs have different numbers of phases, comparing by phase index")
+
+    rows = compare(groups, manifest, args.resamples, pcts, args.confidence, args.seed, args.jobs)
+    print(f"{args.resamples} resamples per group and phase, baseline {groups[0][0]}")
+    print_table(rows, pcts, args.confidence)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'baseline': groups[0][0], 'resamples': args.resamples, 'confidence': args.confidence,
+                       'percentiles': list(pcts), 'rows': rows}, f, indent=2)
+        print(f"Comparison saved as {args.output}")
+
+
+if __name__ == "__main__":
+    main()
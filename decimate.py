@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Shape-preserving downsampling of RTT series before they are plotted.
+
+Two methods, both sized to the pixel width of the axes they are drawn on:
+
+- minmax: per pixel column keep the first, last, lowest and highest sample
+  (M4). The rendered line is the same as drawing every sample, spikes
+  included, and it is a single O(n) numpy pass.
+- lttb: Largest-Triangle-Three-Buckets, one sample per bucket chosen to keep
+  the visual shape. Fewer points than minmax, but single-sample spikes can
+  be dropped when a bucket holds several of them.
+"""
+import numpy as np
+
+METHODS = ('minmax', 'lttb', 'none')
+
+
+def pixel_budget(ax, dpi):
+    """Width in pixels of the plotting area of ax when saved at dpi."""
+    fig = ax.get_figure()
+    return max(int(fig.get_size_inches()[0] * dpi * ax.get_position().width), 1)
+
+
+def _sorted(x, y):
+    if len(x) > 1 and np.any(np.diff(x) < 0):
+        order = np.argsort(x, kind='stable')
+        return x[order], y[order]
+    return x, y
+
+
+def _first_per_bucket(mask, which):
+    idx = np.flatnonzero(mask)
+    _, first = np.unique(which[idx], return_index=True)
+    return idx[first]
+
+
+def minmax(x, y, n_buckets):
+    """M4 downsampling: first/min/max/last sample of each of n_buckets."""
+    x, y = _sorted(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+    n = len(x)
+    if n <= 4 * n_buckets:
+        return x, y
+    span = x[-1] - x[0]
+    if span <= 0:
+        bucket = np.zeros(n, dtype=np.int64)
+    else:
+        bucket = np.minimum(((x - x[0]) / span * n_buckets).astype(np.int64), n_buckets - 1)
+    starts = np.flatnonzero(np.diff(bucket, prepend=-1))
+    ends = np.append(starts[1:], n) - 1
+    which = np.repeat(np.arange(len(starts)), ends - starts + 1)
+    lo = np.minimum.reduceat(y, starts)
+    hi = np.maximum.reduceat(y, starts)
+    keep = np.unique(np.concatenate([starts, ends,
+                                     _first_per_bucket(y == lo[which], which),
+                                     _first_per_bucket(y == hi[which], which)]))
+    return x[keep], y[keep]
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets down to n_out samples.
+
+    The selection is inherently sequential, so this loops over buckets
+    (a few thousand at most) with numpy doing the work inside each one.
+    """
+    x, y = _sorted(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+    # bucket edges for the n - 2 interior points
+    edges = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    # mean of each bucket, used as the third triangle vertex
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return x[keep], y[keep]
+
+
+def decimate(x, y, n_buckets, method='minmax'):
+    """Reduce (x, y) for drawing n_buckets pixels wide; 'none' returns as is."""
+    if method == 'minmax':
+        return minmax(x, y, n_buckets)
+    if method == 'lttb':
+        # roughly the same point count as minmax at this width
+        return lttb(x, y, 2 * n_buckets)
+    if method in (None, 'none'):
+        return np.asarray(x), np.asarray(y)
+    raise ValueError(f"unknown decimation method '{method}', expected one of {METHODS}")
+
+
+def decimate_for_axes(ax, x, y, method='minmax', dpi=300, label='RTT'):
+    """Decimate a series to the pixel width of ax and report what is drawn."""
+    total = len(x)
+    x, y = decimate(x, y, pixel_budget(ax, dpi), method)
+    print(f"{label}: plotting {len(x)} of {total} points ({method or 'none'})")
+    return x, y
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Per-flow view of RTT samples: pick the bulk-data flow, or break them down.
+
+A run has more than one TCP connection in the capture: iperf3's control
+connection, whose few acks come back in microseconds, next to the data
+connection(s) carrying the load (plus whatever else was on the wire).
+Mixed together the control samples drag the minimum and low percentiles
+down, so stats and plots use the dominant flow by default. A flow is one
+direction of one conversation, i.e. the samples whose ACKs were sent from
+the same end of the same tcp.stream (the data connection's own handshake
+and the few acks the receiver gets back would otherwise be mixed in with
+the bulk samples); the dominant one is the one with the most samples,
+which is the bulk transfer. --flow all keeps every sample, --flow N picks
+both directions of tcp.stream N, --flow N/PORT only the ACKs sent from
+PORT, and --flows prints a per-flow table first.
+
+Flows come from the tcp.stream/tcp.srcport/tcp.dstport columns pcaprtt.py
+writes (tshark gives the same with -e tcp.stream ...). CSVs from before
+those columns existed count as one flow; re-extract them from the pcap
+with pcaprtt.py to split them. Picking the dominant flow is two bincount
+passes (stream, then source port within it); the breakdown groups with
+one np.unique and phases.group_stats().
+
+    python flows.py rtt_<ts>.csv   # per-flow table
+"""
+import sys
+import argparse
+import numpy as np
+
+import phases
+from phases import num, cell
+
+# extra columns carried per sample when the source has them (int32, -1 = unknown)
+FLOW_COLUMNS = ('tcp.stream', 'tcp.srcport', 'tcp.dstport')
+
+DOMINANT = 'dominant'
+ALL = 'all'
+
+
+def parse_flow(spec):
+    """argparse type for --flow: 'dominant', 'all', STREAM or STREAM/SRCPORT.
+
+    Returns the string, an int, or a (stream, srcport) tuple.
+    """
+    if spec in (DOMINANT, ALL):
+        return spec
+    stream, sep, port = spec.partition('/')
+    try:
+        return (int(stream), int(port)) if sep else int(stream)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected '{DOMINANT}', '{ALL}', STREAM or STREAM/SRCPORT, got '{spec}'")
+
+
+def add_arguments(parser):
+    parser.add_argument('--flow', type=parse_flow, default=DOMINANT,
+                        help="RTT samples to use: 'dominant' (the bulk-data flow, default), 'all', "
+                             "a tcp.stream number, or STREAM/SRCPORT for one direction of it")
+    parser.add_argument('--flows', action='store_true', help='Print a per-flow breakdown of the RTT samples')
+
+
+def has_flows(columns):
+    return 'tcp.stream' in columns
+
+
+def dominant_flow(columns):
+    """(stream, srcport) of the flow with the most samples, None if unknown.
+
+    srcport is None when the source has stream numbers but no ports.
+    """
+    if not has_flows(columns):
+        return None
+    stream = columns['tcp.stream']
+    known = stream[stream >= 0]
+    if len(known) == 0:
+        return None
+    # the busiest stream, then the busiest direction (sending port) in it
+    top = int(np.argmax(np.bincount(known)))
+    if 'tcp.srcport' not in columns:
+        return top, None
+    ports = columns['tcp.srcport'][stream == top]
+    ports = ports[ports >= 0]
+    return top, int(np.argmax(np.bincount(ports))) if len(ports) else None
+
+
+def flow_keys(columns):
+    """One int64 per sample ordering (stream, srcport), equal within a flow."""
+    key = columns['tcp.stream'].astype(np.int64) << 17
+    if 'tcp.srcport' in columns:
+        key += columns['tcp.srcport'] + 1
+    return key
+
+
+def resolve(columns, flow=DOMINANT):
+    """flow with DOMINANT replaced by the dominant flow, ALL when it is unknown."""
+    if flow != DOMINANT:
+        return flow
+    if not has_flows(columns):
+        return ALL
+    dominant = dominant_flow(columns)
+    return ALL if dominant is None else dominant
+
+
+def _mask(columns, stream, port):
+    keep = columns['tcp.stream'] == stream
+    if port is not None and 'tcp.srcport' in columns:
+        keep &= columns['tcp.srcport'] == port
+    return keep
+
+
+def _time_ordered(columns):
+    """Rows of several flows back in time order (loaders.py stores them grouped by flow)."""
+    times = columns['frame.time_relative']
+    if len(times) < 2 or np.all(times[1:] >= times[:-1]):
+        return columns
+    order = np.argsort(times, kind='stable')
+    return {name: values[order] for name, values in columns.items()}
+
+
+def select(columns, flow=DOMINANT):
+    """Columns restricted to one flow (a slice or copy; the input when nothing is dropped).
+
+    flow is DOMINANT, ALL, a tcp.stream number or a (stream, srcport)
+    tuple as parse_flow() returns them. Sources without flow columns are
+    returned whole. ALL rows come back in time order, like the CSV they
+    were read from. Raises ValueError for a flow that has no samples.
+    """
+    flow = resolve(columns, flow)
+    if not has_flows(columns):
+        return columns
+    if flow == ALL:
+        return _time_ordered(columns)
+    stream, port = flow if isinstance(flow, tuple) else (flow, None)
+    keep = _mask(columns, stream, port)
+    if not keep.any():
+        present = np.unique(columns['tcp.stream']).tolist()
+        raise ValueError(f"no RTT samples on flow {stream}{'' if port is None else f'/{port}'}, "
+                         f"streams present: {present}")
+    if keep.all():
+        return columns
+    # loaders.py stores each flow as one block, slice it out without copying
+    index = np.flatnonzero(keep)
+    if index[-1] - index[0] + 1 == len(index):
+        return {name: values[index[0]:index[-1] + 1] for name, values in columns.items()}
+    return {name: values[keep] for name, values in columns.items()}
+
+
+def breakdown(columns):
+    """One row per flow: stream, ports, samples, time span, seq span and RTT stats.
+
+    Rows are in (stream, srcport) order; 'dominant' marks the flow
+    select() picks by default. Without flow columns there is a single row
+    with stream None.
+    """
+    rtt = columns['tcp.analysis.ack_rtt']
+    times = columns['frame.time_relative']
+    if len(rtt) == 0:
+        return []
+    if has_flows(columns):
+        keys, first, index = np.unique(flow_keys(columns), return_index=True, return_inverse=True)
+        index = index.reshape(-1)
+    else:
+        keys, first, index = np.array([-1]), np.array([0]), np.zeros(len(rtt), dtype=np.int64)
+    n = len(keys)
+    stats = phases.group_stats(index, rtt, n)
+    time_stats = phases.group_stats(index, times, n, pcts=())
+    seq = columns['tcp.seq']
+    seq_ok = seq >= 0
+    seq_stats = phases.group_stats(index[seq_ok], seq[seq_ok], n, pcts=())
+    dominant = dominant_flow(columns)
+
+    rows = []
+    for i in range(n):
+        stream = int(columns['tcp.stream'][first[i]]) if has_flows(columns) else -1
+        flow = (stream, int(columns['tcp.srcport'][first[i]]) if 'tcp.srcport' in columns else None)
+        row = {'stream': stream if stream >= 0 else None, 'samples': int(stats['count'][i]),
+               'dominant': dominant is None or flow == dominant,
+               'start': num(time_stats['min'][i]), 'end': num(time_stats['max'][i]),
+               'seq_span': num(seq_stats['max'][i] - seq_stats['min'][i])}
+        for name in ('tcp.srcport', 'tcp.dstport'):
+            row[name.split('.')[1]] = int(columns[name][first[i]]) if name in columns else None
+        for key in ('mean', 'min', 'p50', 'p95', 'p99', 'max'):
+            row[f'rtt_{key}'] = num(stats[key][i])
+        rows.append(row)
+    return rows
+
+
+def print_flows(rows):
+    print(f"  {'stream':>6} {'ports':<13} {'n':>8} {'start':>7} {'end':>7} {'mean':>8} "
+          f"{'min':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for row in rows:
+        stream = '-' if row['stream'] is None else row['stream']
+        ports = f"{row['srcport']}>{row['dstport']}" if row['srcport'] is not None else '-'
+        print(f"{'*' if row['dominant'] else ' '} {stream!s:>6} {ports:<13} {row['samples']:>8} "
+              f"{cell(row['start'], 7, 2)} {cell(row['end'], 7, 2)} {cell(row['rtt_mean'], 8, 4)} "
+              f"{cell(row['rtt_min'], 8, 4)} {cell(row['rtt_p50'], 8, 4)} "
+              f"{cell(row['rtt_p95'], 8, 4)} {cell(row['rtt_p99'], 8, 4)}")
+    if len(rows) == 1 and rows[0]['stream'] is None:
+        print("  (no tcp.stream column, re-extract with pcaprtt.py to split flows)")
+
+
+def show(columns, flow=DOMINANT):
+    """Print the per-flow table for all-flow columns, then select(columns, flow)."""
+    print_flows(breakdown(columns))
+    return select(columns, flow)
+
+
+def main():
+    if len(sys.argv) != 2:
+        print(f"Usage: {sys.argv[0]} <rtt_csv_file>")
+        sys.exit(1)
+    import loaders
+    try:
+        columns = loaders.load_rtt(sys.argv[1], ALL)
+    except Exception as e:
+        print(f"Error reading {sys.argv[1]}: {e}")
+        sys.exit(1)
+    print_flows(breakdown(columns))
+
+
+if __name__ == "__main__":
+    main()
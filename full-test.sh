@@ -2,6 +2,8 @@
 
 # 
 # this scripts takes qdisc for router as argument
+# legacy path, kept unchanged: orchestrate.py runs the same steps concurrently,
+# without the 0.2s polling, and is what new runs should use
 QDISC="$@"
 # if qdisc null, set as fq_codel
 if [ -z "$QDISC" ]; then
@@ -185,6 +187,27 @@ finish_iperf() {
     # todo: will json in json be handled properly
 }
 
+# -- run manifest: actual phase boundaries, read by phases.py
+# seconds since capture start
+since_start() {
+    awk -v now="$(date +%s.%N)" -v t0="$T0" 'BEGIN { printf "%.3f", now - t0 }'
+}
+
+# takes bandwidth and RTT, records the phase once the tune has been applied
+mark_phase() {
+    PHASES="$PHASES${PHASES:+, }{\"start\": $(since_start), \"bw\": \"$1\", \"rtt\": \"$2\"}"
+}
+
+# tune and record the phase boundary
+tune_phase() {
+    tune $1 $2
+    mark_phase $1 $2
+}
+
+write_manifest() {
+    echo "{\"time\": \"$TIME\", \"qdisc\": \"$QDISC\", \"phases\": [$PHASES], \"end\": $1}" > run_$TIME.json
+}
+
 ####################
 #mkdir $TIME
 setup_ifb
@@ -192,37 +215,36 @@ setup_router
 tune 5Mbps 50ms
 tune 500Mbps 50ms
 TCD=$(start_capture)
+T0=$(date +%s.%N)
+mark_phase 500Mbps 50ms
 IPFg=$(begin_iperf)
 echo "tcpdump pid: $TCD"
 echo "iperf pid: $IPFg"
-# if change interval here, remember to change in analyse.py as well
+# the schedule lands in run_$TIME.json, analysis picks it up from there
 sleep 5;
-tune 2kbps 50ms;
+tune_phase 2kbps 50ms;
 sleep 5;
-tune 2Mbps 50ms;
+tune_phase 2Mbps 50ms;
 sleep 5;
-tune 500kbps 50ms;
+tune_phase 500kbps 50ms;
 sleep 5;
+END=$(since_start)
 finish_iperf;
 sleep 5; # a bit buffer time i guess
 stop_capture
 scp fyp-vm1:/tmp/$TIME.pcap .
 scp fyp-vm1:/tmp/iperf3_$TIME.json .
 vm_exec_get $SND_VM "rm -f /tmp/$TIME.pcap /tmp/iperf3_$TIME.json"
+write_manifest $END
 # output files should be:
 # ./$time.log
 # ./$time.pcap
+# ./run_$time.json
 
 ### pre-analyse ###
-tshark -r $TIME.pcap -T fields \
-  -e frame.time_relative \
-  -e tcp.seq \
-  -e tcp.analysis.ack_rtt \
-  -E header=y \
-  -E separator=, \
-  -E quote=d \
-  -Y "tcp.analysis.ack_rtt" \
-  > rtt_$TIME.csv
-
-echo "RTT analysis done, please run python analyse.py rtt_$TIME.csv iperf3_$TIME.json"
+# same columns as `tshark -T fields -e frame.time_relative -e tcp.seq -e tcp.analysis.ack_rtt
+#   -e tcp.stream -e ip.src -e tcp.srcport -e ip.dst -e tcp.dstport`
+python3 pcaprtt.py $TIME.pcap rtt_$TIME.csv
+
+echo "RTT analysis done, please run python analyse.py rtt_$TIME.csv iperf3_$TIME.json (phases from run_$TIME.json)"
 echo "rtt_$TIME.csv"
\ No newline at end of file
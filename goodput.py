@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Fine-grained goodput, in-flight bytes and retransmissions straight from a pcap.
+
+iperf3 reports throughput once a second, too coarse to see what a tune
+does in the first few hundred ms. This bins the capture instead, at any
+step (10 ms by default):
+
+- goodput: bytes newly acknowledged (the cumulative ACK moving forward),
+  i.e. what reached the receiver, timed when the ACK was captured;
+- sent: new data bytes put on the wire, retransmitted bytes kept apart,
+  and retrans_rate = retransmitted / all data bytes in the bin;
+- inflight: the largest highest-seq-sent minus highest-ACK seen in the
+  bin, over all connections (the bulk flow dominates).
+
+Captures are taken at the sender (full-test.sh), so the ACK clock is
+the receiver's delivery as seen from there, one RTT/2 late.
+
+The pcap is streamed with pcaprtt.iter_tcp_chunks(). Per chunk, sequence
+and ACK numbers are unwrapped per direction, carrying the state of each
+direction across chunks, then running maxima give new/retransmitted and
+acknowledged bytes per packet, which np.bincount adds up per bin. The
+result looks like loaders.load_iperf() output ('times' = bin ends,
+'throughput' = goodput Mbps), so the plots and per-phase stats take it
+in place of iperf3 data (--throughput pcap on analyse.py and multi.py).
+
+    python goodput.py <ts>.pcap [--step 0.01] [-o goodput.csv]
+"""
+import os
+import sys
+import argparse
+import numpy as np
+
+import pcaprtt
+import phases
+
+STEP = 0.01
+
+# unknown seq/ack state, below any unwrapped sequence number
+_NONE = -(np.int64(1) << np.int64(62))
+# keeps directions apart in one running maximum, cf. pcaprtt._SEQ_SPAN
+_SPAN = np.int64(1) << np.int64(48)
+_LOW = -(np.int64(1) << np.int64(40))
+
+SERIES = ('goodput', 'sent', 'retrans', 'inflight')
+
+
+def find_pcap(data_file):
+    """The capture behind an rtt_<ts>.csv (or the file itself if it is a pcap), None if not found."""
+    if data_file.endswith('.pcap'):
+        return data_file
+    match = phases.TIMESTAMP.search(os.path.basename(data_file))
+    if not match:
+        return None
+    directory = os.path.dirname(data_file)
+    for candidate in (os.path.join(directory, f"{match.group(1)}.pcap"),
+                      os.path.join(directory, 'capture', f"{match.group(1)}.pcap")):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+class _State:
+    """Per-direction sequence state, carried from one chunk to the next."""
+
+    def __init__(self):
+        self.ids = {}
+        self.last_raw = np.zeros(0, dtype=np.int64)
+        self.last_abs = np.zeros(0, dtype=np.int64)
+        self.high = np.zeros(0, dtype=np.int64)
+        self.una = np.zeros(0, dtype=np.int64)
+
+    def direction_ids(self, chunk):
+        """Id of each packet's own direction and of the reverse one (whose data it ACKs)."""
+        a = (chunk['src'].astype(np.int64) << 16) | chunk['sport']
+        b = (chunk['dst'].astype(np.int64) << 16) | chunk['dport']
+        pairs, inverse = np.unique(np.stack([a, b], axis=1), axis=0, return_inverse=True)
+        ids = self.ids
+        own = np.array([ids.setdefault((int(x), int(y)), len(ids)) for x, y in pairs], dtype=np.int64)
+        peer = np.array([ids.setdefault((int(y), int(x)), len(ids)) for x, y in pairs], dtype=np.int64)
+        grow = len(ids) - len(self.high)
+        if grow > 0:
+            self.last_raw = np.append(self.last_raw, np.full(grow, -1, dtype=np.int64))
+            self.last_abs = np.append(self.last_abs, np.zeros(grow, dtype=np.int64))
+            self.high = np.append(self.high, np.full(grow, _NONE))
+            self.una = np.append(self.una, np.full(grow, _NONE))
+        inverse = inverse.reshape(-1)
+        return own[inverse], peer[inverse]
+
+
+def _exclusive(running, starts, first):
+    """running shifted by one within each group, first[group] at each group's start."""
+    out = np.empty_like(running)
+    out[1:] = running[:-1]
+    out[starts] = first
+    return out
+
+
+def chunk_events(chunk, state):
+    """Per data/ACK packet of a chunk: (packet index, new, retransmitted, acked, in flight bytes)."""
+    own, peer = state.direction_ids(chunk)
+    data = np.flatnonzero(chunk['payload'] > 0)
+    acks = np.flatnonzero((chunk['flags'] & pcaprtt.TCP_ACK) != 0)
+    # seq numbers of data and the ACK numbers covering them live in the same space
+    space = np.concatenate([own[data], peer[acks]])
+    raw = np.concatenate([chunk['seq'][data], chunk['ack'][acks]]).astype(np.int64)
+    pos = np.concatenate([data, acks])
+    is_ack = np.concatenate([np.zeros(len(data), dtype=bool), np.ones(len(acks), dtype=bool)])
+    payload = np.concatenate([chunk['payload'][data], np.zeros(len(acks), dtype=np.int64)])
+    order = np.lexsort((is_ack, pos, space))
+    space, raw, pos, is_ack, payload = space[order], raw[order], pos[order], is_ack[order], payload[order]
+    n = len(space)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty, empty
+    starts = np.flatnonzero(np.diff(space, prepend=-1))
+    group = space[starts]
+
+    # unwrap: each value moves from the previous one of its space by a signed 32-bit step
+    fresh = state.last_raw[group] < 0
+    prev = _exclusive(raw, starts, np.where(fresh, raw[starts], state.last_raw[group]))
+    step = (raw - prev + (1 << 31)) % (1 << 32) - (1 << 31)
+    total = np.cumsum(step)
+    base = np.where(fresh, raw[starts], state.last_abs[group]) - (total[starts] - step[starts])
+    which = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+    seq = total + base[which]
+
+    # running highest data byte sent / highest ACK, per space
+    offset = which * _SPAN
+    end = seq + payload
+    high_run = np.maximum.accumulate(np.where(is_ack, _LOW, end) + offset) - offset
+    una_run = np.maximum.accumulate(np.where(is_ack, seq, _LOW) + offset) - offset
+    high_run = np.maximum(high_run, state.high[space])
+    una_run = np.maximum(una_run, state.una[space])
+    high_run[high_run <= _LOW] = _NONE
+    una_run[una_run <= _LOW] = _NONE
+    high_before = _exclusive(high_run, starts, state.high[group])
+    una_before = _exclusive(una_run, starts, state.una[group])
+
+    new = np.where(is_ack, 0, np.clip(end - np.maximum(seq, high_before), 0, payload))
+    retrans = np.where(is_ack, 0, payload - new)
+    # the first ACK seen in a direction only sets the starting point
+    acked = np.where(is_ack & (una_before != _NONE), np.maximum(seq - una_before, 0), 0)
+    known = (high_run != _NONE) & (una_run != _NONE)
+    inflight = np.where(known, np.maximum(high_run - una_run, 0), 0)
+
+    last = np.append(starts[1:], n) - 1
+    state.last_raw[group] = raw[last]
+    state.last_abs[group] = seq[last]
+    state.high[group] = high_run[last]
+    state.una[group] = una_run[last]
+    return pos, new, retrans, acked, inflight
+
+
+def _add(totals, name, values, reduce=np.add):
+    old = totals[name]
+    if len(values) > len(old):
+        old, values = values, old
+    reduce(old[:len(values)], values, out=old[:len(values)])
+    totals[name] = old
+
+
+def load(pcap_file, step=STEP, chunk_records=pcaprtt.CHUNK_RECORDS):
+    """Goodput/sent/retransmission/in-flight series for a capture, binned every step seconds.
+
+    Returns {'times' (bin ends, s from the first record, like
+    frame.time_relative), 'throughput' (goodput, Mbps), 'sent_mbps',
+    'retrans_rate' (NaN where nothing was sent), 'inflight' (bytes),
+    'step', 'label', 'source'}, the series as float32 arrays. Raises
+    ValueError for files that aren't pcaps.
+    """
+    totals = {name: np.zeros(0) for name in SERIES}
+    epoch = None
+    state = _State()
+    for chunk in pcaprtt.iter_tcp_chunks(pcap_file, chunk_records):
+        if epoch is None:
+            epoch = pcaprtt.first_timestamp(pcap_file)
+        pos, new, retrans, acked, inflight = chunk_events(chunk, state)
+        if len(pos) == 0:
+            continue
+        bins = np.floor((chunk['time'][pos] - epoch) / step).astype(np.int64)
+        # a clock step back before the first record lands in bin 0
+        bins = np.maximum(bins, 0)
+        for name, weights in (('goodput', acked), ('sent', new), ('retrans', retrans)):
+            _add(totals, name, np.bincount(bins, weights=weights))
+        peak = np.zeros(bins.max() + 1)
+        np.maximum.at(peak, bins, inflight)
+        _add(totals, 'inflight', peak, np.maximum)
+
+    n = max(len(v) for v in totals.values())
+    series = {name: np.pad(v, (0, n - len(v))) for name, v in totals.items()}
+    mbps = 8 / step / 1e6
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rate = series['retrans'] / (series['sent'] + series['retrans'])
+    return {'times': (np.arange(n) + 1) * step,
+            'throughput': (series['goodput'] * mbps).astype(np.float32),
+            'sent_mbps': ((series['sent'] + series['retrans']) * mbps).astype(np.float32),
+            'retrans_rate': rate.astype(np.float32),
+            'inflight': series['inflight'].astype(np.float32),
+            'step': step, 'label': f'Goodput (pcap, {step * 1000:g} ms)', 'source': pcap_file}
+
+
+def load_for(data_file, step=STEP):
+    """load() on the capture behind data_file, None (with a warning) if there is none."""
+    pcap = find_pcap(data_file)
+    if pcap is None:
+        print(f"Warning: no pcap found for {data_file}, can't compute pcap goodput")
+        return None
+    try:
+        return load(pcap, step)
+    except (OSError, ValueError) as e:
+        print(f"Warning: could not compute goodput from {pcap}: {e}")
+        return None
+
+
+def write_csv(series, out):
+    out.write('time,goodput_mbps,sent_mbps,retrans_rate,inflight_bytes\n')
+    rows = zip(series['times'].tolist(), series['throughput'].tolist(), series['sent_mbps'].tolist(),
+               series['retrans_rate'].tolist(), series['inflight'].tolist())
+    out.writelines(f"{t:.6f},{g:.4f},{s:.4f},{'' if r != r else f'{r:.4f}'},{int(i)}\n"
+                   for t, g, s, r, i in rows)
+
+
+def phase_table(series, manifest):
+    """Mean/peak goodput (Mbps), retransmitted share and peak in-flight bytes per phase."""
+    idx = phases.assign(series['times'] - series['step'] / 2, manifest)
+    sent = series['sent_mbps'].astype(np.float64)
+    retrans = np.nan_to_num(series['retrans_rate']) * sent
+    rows = []
+    for i, p in enumerate(manifest['phases']):
+        keep = idx == i
+        if manifest.get('end') is not None:
+            keep &= series['times'] <= manifest['end'] + series['step']
+        good = series['throughput'][keep]
+        rows.append({'label': f"{p['bw']} {p.get('rtt') or ''}".strip(), 'start': p['start'],
+                     'goodput': float(good.mean()) if len(good) else float('nan'),
+                     'peak': float(good.max()) if len(good) else float('nan'),
+                     'retrans': float(retrans[keep].sum() / sent[keep].sum()) if sent[keep].sum() else 0.0,
+                     'inflight': float(series['inflight'][keep].max()) if keep.any() else float('nan')})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Goodput, in-flight bytes and retransmissions binned from a pcap.')
+    parser.add_argument('pcap', help='Capture (or an rtt_<ts>.csv with <ts>.pcap next to it)')
+    parser.add_argument('--step', type=float, default=STEP, help='Bin width in seconds (default: 0.01)')
+    parser.add_argument('--output', '-o', help='Write the binned series to this CSV')
+    args = parser.parse_args()
+    if args.step <= 0:
+        parser.error('--step must be positive')
+
+    pcap = find_pcap(args.pcap)
+    if pcap is None or not os.path.exists(pcap):
+        print(f"Error: no pcap found for '{args.pcap}'.")
+        sys.exit(1)
+    try:
+        series = load(pcap, args.step)
+    except ValueError as e:
+        print(f"Error processing pcap file: {e}")
+        sys.exit(1)
+
+    n = len(series['times'])
+    print(f"{pcap}: {n} bins of {args.step * 1000:g} ms")
+    if n:
+        manifest = phases.load_manifest(pcap)
+        if manifest['source'] is None:
+            print("No run manifest found, using the default full-test.sh schedule")
+        print(f"{'phase':<16} {'start':>6} {'goodput':>8} {'peak':>8} {'retrans':>8} {'inflight':>10}")
+        for row in phase_table(series, manifest):
+            print(f"{row['label']:<16} {row['start']:>6.1f} {row['goodput']:>8.2f} {row['peak']:>8.2f} "
+                  f"{row['retrans']:>8.4f} {row['inflight']:>10.0f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            write_csv(series, f)
+        print(f"Goodput series saved as {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""Incremental parser for iperf3 client logs, -J or --json-stream.
+
+Both formats are read one interval at a time, so memory stays flat however
+long the run was:
+
+- -J (what full-test.sh uses): one JSON document. The top level is walked
+  key by key and the "intervals" array is decoded one element at a time
+  from a bounded read buffer, never as a whole tree. Documents cut off by
+  the `killall iperf3` in finish_iperf keep every complete interval, and
+  anything after the closing brace (iperf3's "server is busy" line) is
+  ignored.
+- --json-stream (junkyard/auto.sh): one {"event": ..., "data": ...} object
+  per line. A partial last line is dropped.
+
+Per-interval totals and per-stream snd_cwnd, rtt, rttvar (microseconds,
+as iperf3 reports them), retransmits and bytes go into numpy arrays that
+are preallocated from the file size and doubled if that guess was short.
+Fields a stream doesn't report (receiver side, UDP) are NaN.
+
+    python iperfparse.py iperf3_<ts>.json   # per-stream summary
+"""
+import os
+import sys
+import json
+import numpy as np
+
+# per-stream fields kept from each interval
+STREAM_FIELDS = ('snd_cwnd', 'rtt', 'rttvar', 'retransmits', 'bytes', 'bits_per_second')
+
+READ_SIZE = 1 << 20
+# rough bytes of log per interval with one stream, used to size the arrays
+INTERVAL_BYTES = 600
+
+
+class Truncated(Exception):
+    """The document ended before the value being read was complete."""
+
+
+class IntervalTable:
+    """Growable, preallocated per-interval arrays (intervals x streams)."""
+
+    def __init__(self, capacity=64):
+        self.capacity = max(int(capacity), 1)
+        self.n = 0
+        self.sockets = None
+        self.times = np.empty(self.capacity)
+        self.starts = np.empty(self.capacity)
+        self.bits_per_second = np.empty(self.capacity)
+        self.bytes = np.empty(self.capacity, dtype=np.int64)
+        self.retransmits = np.empty(self.capacity)
+        self.omitted = np.empty(self.capacity, dtype=bool)
+        self.streams = None
+
+    def _grow(self):
+        self.capacity *= 2
+        for name in ('times', 'starts', 'bits_per_second', 'bytes', 'retransmits', 'omitted'):
+            old = getattr(self, name)
+            new = np.empty(self.capacity, dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+        for name, old in self.streams.items():
+            new = np.full((self.capacity, old.shape[1]), np.nan)
+            new[:self.n] = old[:self.n]
+            self.streams[name] = new
+
+    def add(self, interval):
+        streams = interval.get('streams', [])
+        total = interval['sum']
+        if self.streams is None:
+            self.sockets = [s.get('socket') for s in streams]
+            self.streams = {name: np.full((self.capacity, len(streams)), np.nan) for name in STREAM_FIELDS}
+        if self.n == self.capacity:
+            self._grow()
+        i = self.n
+        self.times[i] = total['end']
+        self.starts[i] = total['start']
+        self.bits_per_second[i] = total['bits_per_second']
+        self.bytes[i] = total.get('bytes', 0)
+        self.retransmits[i] = total.get('retransmits', np.nan)
+        self.omitted[i] = total.get('omitted', False)
+        for j, stream in enumerate(streams[:len(self.sockets)]):
+            for name in STREAM_FIELDS:
+                value = stream.get(name)
+                if value is not None:
+                    self.streams[name][i, j] = value
+        self.n += 1
+
+    def result(self):
+        n = self.n
+        return {
+            'times': self.times[:n].copy(),
+            'starts': self.starts[:n].copy(),
+            'bits_per_second': self.bits_per_second[:n].copy(),
+            'bytes': self.bytes[:n].copy(),
+            'retransmits': self.retransmits[:n].copy(),
+            'omitted': self.omitted[:n].copy(),
+            'sockets': self.sockets or [],
+            'streams': {name: values[:n].copy() for name, values in (self.streams or {}).items()},
+        }
+
+
+class _DocumentReader:
+    """Hands out complete JSON values from a file, reading it in chunks."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        if self.eof:
+            return False
+        data = self.f.read(READ_SIZE)
+        if not data:
+            self.eof = True
+            return False
+        # drop what has been consumed so the buffer stays bounded
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character without consuming it ('' at EOF)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars):
+        ch = self.peek()
+        if ch == '':
+            raise Truncated()
+        if ch not in chars:
+            raise ValueError(f"expected one of {chars!r} at offset {self.pos}, got {ch!r}")
+        self.pos += 1
+        return ch
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number running into the end of the buffer may continue
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                pass
+            if not self._fill():
+                raise Truncated()
+
+
+def _parse_document(f, table, info):
+    reader = _DocumentReader(f)
+    if reader.peek() == '':
+        # 0 bytes or only whitespace: iperf3 never wrote anything
+        info['empty'] = True
+        return
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == 'intervals':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.pos += 1
+            else:
+                while True:
+                    table.add(reader.value())
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            info[key] = reader.value()
+        # stop at the closing brace, whatever follows is not ours
+        if reader.expect(',}') == '}':
+            return
+
+
+def _parse_stream(f, table, info):
+    info['empty'] = True
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            # killed mid-write, only the last line can be partial
+            info['truncated'] = True
+            continue
+        info['empty'] = False
+        kind = event.get('event')
+        if kind == 'interval':
+            table.add(event['data'])
+        elif kind in ('start', 'end'):
+            info[kind] = event['data']
+        elif kind == 'error':
+            info['error'] = event['data']
+
+
+def _is_stream(path):
+    with open(path, 'r') as f:
+        first = f.readline().strip()
+    if not first.startswith('{') or first == '{':
+        return False
+    try:
+        return 'event' in json.loads(first)
+    except json.JSONDecodeError:
+        return False
+
+
+def parse(path):
+    """Parse an iperf3 -J or --json-stream log into numpy arrays.
+
+    Returns a dict with per-interval 'times' (interval end, s), 'starts',
+    'bits_per_second', 'bytes', 'retransmits' and 'omitted'; 'sockets' and
+    'streams' ({field: intervals x streams array}); plus 'format',
+    'truncated', 'empty' (nothing decoded, e.g. a 0-byte log; such a log
+    also counts as truncated), 'error' and the 'start'/'end' sections when
+    present.
+    Raises ValueError if the file isn't an iperf3 JSON log at all.
+    """
+    table = IntervalTable(os.path.getsize(path) // INTERVAL_BYTES + 1)
+    info = {'truncated': False}
+    stream = _is_stream(path)
+    with open(path, 'r') as f:
+        if stream:
+            _parse_stream(f, table, info)
+        else:
+            try:
+                _parse_document(f, table, info)
+            except Truncated:
+                info['truncated'] = True
+    result = table.result()
+    result['format'] = 'json-stream' if stream else 'json'
+    result['empty'] = info.get('empty', False)
+    result['truncated'] = info['truncated'] or result['empty']
+    result['error'] = info.get('error')
+    result['start'] = info.get('start')
+    result['end'] = info.get('end')
+    return result
+
+
+def main():
+    if len(sys.argv) != 2:
+        print(f"Usage: {sys.argv[0]} <iperf3_json>")
+        sys.exit(1)
+    try:
+        data = parse(sys.argv[1])
+    except (OSError, ValueError) as e:
+        print(f"Error reading {sys.argv[1]}: {e}")
+        sys.exit(1)
+    status = 'empty' if data['empty'] else 'truncated' if data['truncated'] else 'complete'
+    print(f"{sys.argv[1]}: {data['format']}, {len(data['times'])} intervals, {status}"
+          + (f", error: {data['error']}" if data['error'] else ''))
+    if not len(data['times']):
+        return
+    print(f"mean {data['bits_per_second'].mean() / 1e6:.2f} Mbps, "
+          f"{int(np.nansum(data['retransmits']))} retransmits")
+    streams = data['streams']
+    for j, socket in enumerate(data['sockets']):
+        with np.errstate(invalid='ignore'):
+            print(f"stream {socket}: {int(streams['bytes'][:, j].sum())} bytes, "
+                  f"cwnd mean {np.nanmean(streams['snd_cwnd'][:, j]):.0f} max {np.nanmax(streams['snd_cwnd'][:, j]):.0f}, "
+                  f"rtt mean {np.nanmean(streams['rtt'][:, j]) / 1000:.2f} ms, "
+                  f"rttvar mean {np.nanmean(streams['rttvar'][:, j]) / 1000:.2f} ms, "
+                  f"{int(np.nansum(streams['retransmits'][:, j]))} retransmits")
+
+
+if __name__ == "__main__":
+    main()
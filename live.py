@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""Live RTT monitoring of a capture or RTT CSV that is still being written.
+
+Used by `python analyse.py --live <file>`. The file is tailed: each refresh
+reads only the bytes appended since the previous one (partial lines/records
+are kept for the next round), samples go through O(1) running statistics
+(Welford mean/std, min/max, P-square percentile estimators), and a rolling
+window of the last few seconds is redrawn at a fixed frame rate.
+
+Each sample also goes through queuing.MinFilter: the base RTT is the
+minimum of the last base_window seconds and the queuing delay above it
+gets its own running stats and a line on the plot. There is no manifest
+while the run is going, so unlike the batch path the filter is not
+restarted at phase starts; after a tune raises the delay the base catches
+up within base_window.
+"""
+import os
+import sys
+import time
+import math
+from collections import deque
+import numpy as np
+
+from loaders import TIME_NAMES, RTT_NAMES
+import queuing
+
+# upper bound on bytes consumed per refresh, so catching up on a big file
+# doesn't stall the redraw for too long
+READ_SIZE = 64 << 20
+
+
+class P2Quantile:
+    """P-square streaming quantile estimate (Jain & Chlamtac), O(1) per sample."""
+
+    def __init__(self, p):
+        self.p = p
+        self.q = []
+        self.n = [1, 2, 3, 4, 5]
+        self.want = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.step = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        q, n = self.q, self.n
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.want[i] += self.step[i]
+        for i in (1, 2, 3):
+            d = self.want[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                # parabolic prediction, fall back to linear if it leaves the bracket
+                qp = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < qp < q[i + 1]:
+                    qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    def value(self):
+        if not self.q:
+            return math.nan
+        if len(self.q) < 5:
+            return self.q[min(int(self.p * len(self.q)), len(self.q) - 1)]
+        return self.q[2]
+
+
+class RunningStats:
+    """Count, mean, std, min, max and percentiles, updated in O(1) per sample."""
+
+    def __init__(self, percentiles=(50, 95, 99)):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.quantiles = {pct: P2Quantile(pct / 100) for pct in percentiles}
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        for estimator in self.quantiles.values():
+            estimator.add(x)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+    def summary(self):
+        if not self.count:
+            return "no samples yet"
+        text = (f"n={self.count} mean={self.mean:.4f} min={self.min:.4f} "
+                f"max={self.max:.4f} std={self.std:.4f}")
+        for pct, estimator in self.quantiles.items():
+            text += f" p{pct}={estimator.value():.4f}"
+        return text
+
+
+class CsvTail:
+    """Follow an RTT CSV, yielding (time, rtt) rows appended since last poll."""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.partial = b''
+        self.cols = None
+
+    def _reset(self):
+        self.offset = 0
+        self.partial = b''
+        self.cols = None
+
+    def poll(self):
+        times, rtts = [], []
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return times, rtts
+        if size < self.offset:
+            # truncated or replaced, start over
+            self._reset()
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(READ_SIZE)
+        self.offset += len(data)
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        for line in lines:
+            fields = line.decode(errors='replace').replace('"', '').strip().split(',')
+            if self.cols is None:
+                self.cols, is_header = self._columns(fields)
+                if is_header:
+                    continue
+            try:
+                times.append(float(fields[self.cols[0]]))
+                rtts.append(float(fields[self.cols[1]]))
+            except (ValueError, IndexError):
+                # empty ack_rtt fields and the like, same as the batch cleaning
+                continue
+        return times, rtts
+
+    def _columns(self, fields):
+        """(time, rtt) column indices and whether this line was the header."""
+        time_col = next((fields.index(c) for c in TIME_NAMES if c in fields), None)
+        rtt_col = next((fields.index(c) for c in RTT_NAMES if c in fields), None)
+        if time_col is not None and rtt_col is not None:
+            return (time_col, rtt_col), True
+        # headerless time,[seq,]rtt
+        return (0, len(fields) - 1), False
+
+
+class PcapTail:
+    """Follow a pcap that tcpdump -U is still writing, matching ACK RTTs as it goes."""
+
+    def __init__(self, path):
+        import pcaprtt
+        self.pcaprtt = pcaprtt
+        self.path = path
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.pending = b''
+        self.header = None
+        self.epoch = None
+        self.tracker = self.pcaprtt.AckRttTracker()
+
+    def poll(self):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return [], []
+        if size < self.offset:
+            self._reset()
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(READ_SIZE)
+        self.offset += len(data)
+        self.pending += data
+        pos = 0
+        if self.header is None:
+            if len(self.pending) < 40:
+                return [], []
+            self.header = self.pcaprtt.read_header(self.pending)
+            endian, scale, _ = self.header
+            sec, frac = np.frombuffer(self.pending, dtype=endian + 'u4', count=2, offset=24)
+            self.epoch = float(sec) + float(frac) * scale
+            pos = 24
+        chunk, pos = self.pcaprtt.decode_buffer(self.pending, pos, self.header)
+        self.pending = self.pending[pos:]
+        if chunk is None:
+            return [], []
+        rows, _, rtts = self.tracker.feed(chunk)
+        return (chunk['time'][rows] - self.epoch).tolist(), rtts
+
+
+def open_tail(path):
+    return PcapTail(path) if path.endswith('.pcap') else CsvTail(path)
+
+
+def run_live(path, window=30.0, fps=4.0, plot=True, base_window=queuing.WINDOW):
+    """Tail path and keep stats and a rolling-window plot up to date until interrupted.
+
+    Returns the RTT and queuing delay RunningStats.
+    """
+    tail = open_tail(path)
+    stats = RunningStats()
+    queue_stats = RunningStats()
+    floor = queuing.MinFilter(base_window)
+    recent = deque()
+
+    def refresh():
+        times, rtts = tail.poll()
+        for t, rtt in zip(times, rtts):
+            base = floor.add(t, rtt)
+            stats.add(rtt)
+            queue_stats.add(rtt - base)
+            recent.append((t, rtt, base))
+        if recent:
+            cutoff = recent[-1][0] - window
+            while recent[0][0] < cutoff:
+                recent.popleft()
+        return len(times)
+
+    print(f"Following {path} (window {window:g}s, {fps:g} fps, base RTT over {base_window:g}s), Ctrl-C to stop")
+    try:
+        if plot:
+            _animate(refresh, stats, queue_stats, recent, path, window, fps, base_window)
+        else:
+            while True:
+                if refresh():
+                    print(stats.summary())
+                    print(f"  queuing: {queue_stats.summary()}")
+                time.sleep(1.0 / fps)
+    except KeyboardInterrupt:
+        pass
+    print(f"Final: {stats.summary()}")
+    print(f"Final queuing delay: {queue_stats.summary()}")
+    return stats, queue_stats
+
+
+def _animate(refresh, stats, queue_stats, recent, path, window, fps, base_window):
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+    import decimate
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+    line, = ax.plot([], [], 'b-', linewidth=1.0, label='RTT')
+    base_line, = ax.plot([], [], '-', color='black', linewidth=1.0, alpha=0.8,
+                         label=f'Base RTT ({base_window:g}s min)')
+    text = ax.text(0.01, 0.98, '', transform=ax.transAxes, va='top', fontsize=9,
+                   bbox=dict(facecolor='white', alpha=0.7))
+    ax.set_xlabel('Time (seconds)', fontsize=12)
+    ax.set_ylabel('Round Trip Time (ms)', fontsize=12)
+    ax.set_title(f"Live TCP RTT - {os.path.basename(path)}", fontsize=14)
+    ax.grid(True, alpha=0.3)
+    ax.legend(loc='upper right')
+
+    def update(_frame):
+        refresh()
+        if recent:
+            data = np.array(recent)
+            budget = decimate.pixel_budget(ax, fig.dpi)
+            x, y = decimate.minmax(data[:, 0], data[:, 1], budget)
+            line.set_data(x, y)
+            base_line.set_data(*decimate.minmax(data[:, 0], data[:, 2], budget))
+            ax.set_xlim(max(x[-1] - window, 0), max(x[-1], window))
+            ax.set_ylim(0, y.max() * 1.1 if y.max() > 0 else 1)
+        text.set_text(stats.summary().replace(' ', '\n') + '\n\nqueuing\n'
+                      + queue_stats.summary().replace(' ', '\n'))
+        return line, base_line, text
+
+    # keep a reference, the animation stops when it is garbage collected
+    fig._live_animation = FuncAnimation(fig, update, interval=1000.0 / fps, cache_frame_data=False)
+    plt.show()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(f"Usage: {sys.argv[0]} <rtt_csv_or_pcap>  (or: analyse.py --live <file>)")
+        sys.exit(1)
+    run_live(sys.argv[1])
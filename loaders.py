@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Shared loaders for RTT CSVs/pcaps and iperf3 JSON, used by every front-end.
+
+analyse.py, multi.py, rtt.py (and batch/live/phases) all load data through
+here so they agree on headers and cleaning:
+
+- RTT CSVs: the header is detected (tshark's frame.time_relative /
+  tcp.analysis.ack_rtt, hand-made time/rtt, or none at all), only the needed
+  columns are read, with explicit float64 dtypes, by the fastest pandas
+  engine available (pyarrow if installed, else C). Files with stray
+  non-numeric fields fall back to coercion and dropping those rows.
+- .pcap files go through pcaprtt.py.
+- tcp.stream/tcp.srcport/tcp.dstport are kept as int32 columns when the
+  source has them, with the rows grouped by flow (time order within each
+  flow), and load_rtt() narrows the samples to one flow (the dominant
+  bulk-data flow unless told otherwise, see flows.py).
+- Columns are kept compact: time and RTT as float32 (about 7 significant
+  digits, i.e. 61 us steps at 512 s into a run), seq as int64 with -1 for
+  unknown.
+- Results are cached on disk by rttcache.py.
+- load_run() hands the front-ends a Run, holding only the time/RTT (and
+  optionally seq) arrays of one flow plus where they came from, either in
+  memory or memory-mapped on the cache file.
+
+pandas is only imported when a CSV actually has to be parsed, so cache
+hits and --help never pay for it.
+"""
+import os
+import importlib.util
+import numpy as np
+
+import rttcache
+import profiling
+import flows
+
+# dtypes the cleaned columns are stored and handed out in (flow columns: int32)
+DTYPES = {'frame.time_relative': np.float32, 'tcp.seq': np.int64, 'tcp.analysis.ack_rtt': np.float32}
+# header aliases seen in older captures / hand-made files (owd: owd.py)
+TIME_NAMES = ('frame.time_relative', 'time', 'Time')
+RTT_NAMES = ('tcp.analysis.ack_rtt', 'rtt', 'RTT', 'owd')
+SEQ_NAMES = ('tcp.seq', 'seq')
+
+# bump when parsing/cleaning changes so cached results are ignored
+PARSER_VERSION = 4
+
+
+def csv_engine():
+    """pandas CSV engine: RTT_CSV_ENGINE if set, else pyarrow when installed, else C."""
+    engine = os.environ.get('RTT_CSV_ENGINE')
+    if engine:
+        return engine
+    return 'pyarrow' if importlib.util.find_spec('pyarrow') is not None else 'c'
+
+
+def detect_columns(csv_file):
+    """Work out where time/seq/rtt live in an RTT CSV.
+
+    Returns (has_header, {name: header or position}), plus the flow
+    columns under their own names when the header has them; raises
+    ValueError if the header has no recognisable time/RTT columns.
+    """
+    with open(csv_file, 'r') as f:
+        fields = [field.strip().strip('"') for field in f.readline().split(',')]
+    try:
+        float(fields[0])
+    except ValueError:
+        names = {}
+        for key, aliases in (('time', TIME_NAMES), ('rtt', RTT_NAMES), ('seq', SEQ_NAMES)):
+            names[key] = next((a for a in aliases if a in fields), None)
+        if names['time'] is None or names['rtt'] is None:
+            raise ValueError(f"CSV file missing time/RTT columns. Found: {fields}")
+        names.update({name: name for name in flows.FLOW_COLUMNS if name in fields})
+        return True, names
+    # headerless: time,rtt or time,seq,rtt
+    if len(fields) >= 3:
+        return False, {'time': 0, 'seq': 1, 'rtt': 2}
+    return False, {'time': 0, 'seq': None, 'rtt': len(fields) - 1}
+
+
+def read_columns(csv_file, has_header, cols):
+    with profiling.stage('import pandas'):
+        import pandas as pd
+
+    wanted = [c for c in cols.values() if c is not None]
+    kwargs = {'usecols': wanted, 'header': 0 if has_header else None}
+    try:
+        with profiling.stage('read csv') as s:
+            df = pd.read_csv(csv_file, dtype={c: 'float64' for c in wanted}, engine=csv_engine(), **kwargs)
+            s.rows = len(df)
+    except (ValueError, TypeError):
+        # stray non-numeric fields, coerce them to NaN like the old loaders did
+        with profiling.stage('read csv (str)') as s:
+            df = pd.read_csv(csv_file, dtype=str, **kwargs)
+            s.rows = len(df)
+        with profiling.stage('to_numeric coerce'):
+            df = df.apply(pd.to_numeric, errors='coerce')
+    return df
+
+
+def parse_rtt(source):
+    """Parse an RTT CSV or pcap into cleaned, compact columns (no caching)."""
+    if source.endswith('.pcap'):
+        import pcaprtt
+        with profiling.stage('pcap extract') as s:
+            columns = pcaprtt.extract_rtt(source)
+            s.rows = len(columns['tcp.analysis.ack_rtt'])
+        result = {name: _typed(columns[name], dtype) for name, dtype in DTYPES.items()}
+        result.update({name: _typed(columns[name], np.int32) for name in flows.FLOW_COLUMNS})
+        return group_flows(result)
+
+    if os.path.getsize(source) == 0:
+        return {name: np.zeros(0, dtype=dtype) for name, dtype in DTYPES.items()}
+    has_header, cols = detect_columns(source)
+    df = read_columns(source, has_header, cols)
+    with profiling.stage('clean') as s:
+        columns = group_flows(clean_columns(df, cols))
+        s.rows = len(columns['tcp.analysis.ack_rtt'])
+    return columns
+
+
+def _typed(values, dtype):
+    """values as dtype; NaN becomes -1 for the integer columns."""
+    values = np.asarray(values)
+    if np.issubdtype(dtype, np.integer) and values.dtype.kind == 'f':
+        values = np.where(np.isnan(values), -1, values)
+    return values.astype(dtype, copy=False)
+
+
+def group_flows(columns):
+    """Rows reordered so each flow is one contiguous block, time order kept within it.
+
+    flows.select() then slices a flow out instead of copying it, which is
+    what lets a memory-mapped run stay a view of the cache file. The
+    grouping is only how the cache stores rows: selecting flows.ALL puts
+    them back in time order.
+    """
+    if not flows.has_flows(columns) or len(columns['tcp.stream']) < 2:
+        return columns
+    key = flows.flow_keys(columns)
+    if np.all(key[1:] >= key[:-1]):
+        return columns
+    order = np.argsort(key, kind='stable')
+    return {name: values[order] for name, values in columns.items()}
+
+
+def clean_columns(df, cols):
+    """Time/seq/RTT columns (DTYPES) from a parsed CSV, rows without time or RTT dropped.
+
+    seq and the flow columns present in cols (int32) are -1 where missing.
+    """
+    time = df[cols['time']].to_numpy(dtype=np.float64)
+    rtt = df[cols['rtt']].to_numpy(dtype=np.float64)
+    seq = df[cols['seq']].to_numpy(dtype=np.float64) if cols['seq'] is not None else np.full(len(df), np.nan)
+    keep = ~(np.isnan(time) | np.isnan(rtt))
+    columns = {'frame.time_relative': time[keep], 'tcp.seq': seq[keep],
+               'tcp.analysis.ack_rtt': rtt[keep]}
+    columns = {name: _typed(values, DTYPES[name]) for name, values in columns.items()}
+    for name in flows.FLOW_COLUMNS:
+        if name in cols:
+            columns[name] = _typed(df[name].to_numpy(dtype=np.float64)[keep], np.int32)
+    return columns
+
+
+def load_rtt(source, flow=flows.DOMINANT):
+    """Cleaned RTT columns for a CSV or pcap as a dict of numpy arrays.
+
+    Keys match the tshark CSV header, dtypes are DTYPES (the flow columns,
+    when the source has them, int32). flow picks the samples, see
+    flows.select(): the dominant flow by default, flows.ALL for all of
+    them or a tcp.stream number. Goes through the on-disk cache, which
+    holds every flow.
+    """
+    with profiling.stage(f'load rtt {os.path.basename(source)}') as s:
+        columns = rttcache.cached_columns(source, parse_rtt, PARSER_VERSION)
+        columns = flows.select(columns, flow)
+        s.rows = len(columns['tcp.analysis.ack_rtt'])
+    return columns
+
+
+class Run:
+    """One run's RTT samples as contiguous arrays, plus where they came from.
+
+    Only what the stats and plots use is kept: time (float32 s) and rtt
+    (float32), seq (int64, -1 unknown) when asked for, else None. The
+    arrays are the loader's own, never copied here. Indexing with the
+    tshark header names (run['tcp.analysis.ack_rtt']) works like on the
+    load_rtt() dicts, so code written for those takes a Run as well.
+    """
+    __slots__ = ('source', 'flow', 'time', 'rtt', 'seq')
+
+    NAMES = {'frame.time_relative': 'time', 'tcp.analysis.ack_rtt': 'rtt', 'tcp.seq': 'seq'}
+
+    def __init__(self, source, time, rtt, seq=None, flow=None):
+        self.source = source
+        # the (stream, srcport) or stream the samples are from, None if all/unknown
+        self.flow = flow
+        self.time = time
+        self.rtt = rtt
+        self.seq = seq
+
+    def __len__(self):
+        return len(self.rtt)
+
+    def __getitem__(self, name):
+        value = getattr(self, self.NAMES[name]) if name in self.NAMES else None
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name):
+        return name in self.NAMES and getattr(self, self.NAMES[name]) is not None
+
+    def __repr__(self):
+        return f"Run({self.source!r}, flow={self.flow!r}, samples={len(self)})"
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.time, self.rtt, self.seq) if a is not None)
+
+    def stats(self):
+        """Mean, min, max and std (ddof=1) of the RTTs, NaN where undefined."""
+        rtt = self.rtt
+        nan = float('nan')
+        if len(rtt) == 0:
+            return {'mean': nan, 'min': nan, 'max': nan, 'std': nan}
+        # accumulate in float64, the samples are float32
+        return {'mean': float(rtt.mean(dtype=np.float64)), 'min': float(rtt.min()),
+                'max': float(rtt.max()),
+                'std': float(rtt.std(dtype=np.float64, ddof=1)) if len(rtt) > 1 else nan}
+
+
+def load_run(source, flow=flows.DOMINANT, seq=False, mmap=False, show_flows=False):
+    """A Run with the samples of flow (see load_rtt()) from a CSV or pcap.
+
+    seq=True keeps tcp.seq as well. mmap=True maps the cache file instead
+    of reading it; as flows are stored contiguously the run's arrays are
+    then views of the file, paged in by the OS as they are used rather
+    than held in memory (only when the cache is enabled and writable; a
+    flows.ALL run of several flows is a time-ordered copy).
+    show_flows prints the per-flow table first.
+    """
+    with profiling.stage(f'load run {os.path.basename(source)}') as s:
+        columns = rttcache.cached_columns(source, parse_rtt, PARSER_VERSION, mmap)
+        if show_flows:
+            flows.print_flows(flows.breakdown(columns))
+        flow = flows.resolve(columns, flow)
+        wanted = ['frame.time_relative', 'tcp.analysis.ack_rtt'] + (['tcp.seq'] if seq else [])
+        columns = flows.select({name: values for name, values in columns.items()
+                                if name in wanted or name in flows.FLOW_COLUMNS}, flow)
+        s.rows = len(columns['tcp.analysis.ack_rtt'])
+    return Run(source, columns['frame.time_relative'], columns['tcp.analysis.ack_rtt'],
+               columns['tcp.seq'] if seq else None, None if flow == flows.ALL else flow)
+
+
+def load_iperf(json_file, zero_start=False):
+    """Per-interval end times and Mbps from an iperf3 -J or --json-stream log.
+
+    Returns {'times': float64 array, 'throughput': float32 array} plus the full parse from
+    iperfparse.py under 'parsed' (per-stream cwnd/rtt/retransmits arrays),
+    or None if the file is missing. Truncated logs keep their complete
+    intervals. zero_start prepends a (0, 0) point for nicer alignment with
+    the RTT axis. Raises ValueError if the file is not an iperf3 log.
+    """
+    if not json_file or not os.path.exists(json_file):
+        return None
+    import iperfparse
+    with profiling.stage(f'load iperf {os.path.basename(json_file)}') as s:
+        parsed = iperfparse.parse(json_file)
+        s.rows = len(parsed['times'])
+
+    times = parsed['times']
+    # Convert to Mbps for readability
+    throughput_values = (parsed['bits_per_second'] / 1e6).astype(np.float32)
+
+    if zero_start and len(times) and times[0] > 0:
+        times = np.concatenate(([0.0], times))
+        throughput_values = np.concatenate((np.zeros(1, dtype=np.float32), throughput_values))
+    return {'times': times, 'throughput': throughput_values, 'parsed': parsed}
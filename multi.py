@@ -1,167 +1,308 @@
 #!/usr/bin/env python3
 import sys
-import json
-import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 import os
-from matplotlib.ticker import ScalarFormatter
 import argparse
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import loaders
+import decimate
+import phases
+import align
+import profiling
+import catalog
+import flows
+import goodput
+# matplotlib is imported where it is used, pandas only to parse CSVs (see loaders.py)
 
-def process_rtt_csv(csv_file):
-    """Process the RTT CSV file from tcpdump/tshark."""
+# percentile bands drawn around each group's median, outermost first
+BANDS = ((10, 90), (25, 75))
+
+def process_rtt_csv(csv_file, flow=flows.DOMINANT):
+    """Process the RTT CSV file from tcpdump/tshark into a loaders.Run."""
     try:
-        # Read the CSV file
-        df = pd.read_csv(csv_file)
-        
-        # Check if we have the expected columns
-        if 'frame.time_relative' in df.columns and 'tcp.analysis.ack_rtt' in df.columns:
-            # Clean up data - ensure numeric types
-            df['frame.time_relative'] = pd.to_numeric(df['frame.time_relative'], errors='coerce')
-            df['tcp.analysis.ack_rtt'] = pd.to_numeric(df['tcp.analysis.ack_rtt'], errors='coerce')
-        else:
-            # Try with default column names (no headers)
-            df.columns = ['time', 'tcp.seq', 'rtt'] if len(df.columns) == 3 else ['time', 'rtt']
-            df['time'] = pd.to_numeric(df['time'], errors='coerce')
-            df['rtt'] = pd.to_numeric(df['rtt'], errors='coerce')
-            # Rename to standard names
-            df = df.rename(columns={'time': 'frame.time_relative', 'rtt': 'tcp.analysis.ack_rtt'})
-        
-        # Drop rows with NaN values
-        df = df.dropna(subset=['frame.time_relative', 'tcp.analysis.ack_rtt'])
-        
-        return df
+        # Cleaned columns come from the on-disk cache when the file is unchanged;
+        # headerless time,rtt files are handled there too (see loaders.py)
+        return loaders.load_run(csv_file, flow)
     except Exception as e:
         print(f"Error processing RTT CSV file {csv_file}: {e}")
         return None
 
 def process_iperf_json(json_file):
     """Process the iperf3 JSON file."""
-    if not json_file or not os.path.exists(json_file):
-        return None
-    
     try:
-        # Read the JSON file
-        with open(json_file, 'r') as f:
-            data = json.load(f)
-        
-        # Extract intervals data
-        intervals = data.get('intervals', [])
-        
-        # Create lists for time and throughput
-        times = []
-        throughput_values = []
-        
-        for interval in intervals:
-            # Get the end time and throughput from each interval
-            end_time = interval['sum']['end']
-            bits_per_second = interval['sum']['bits_per_second']
-            
-            times.append(end_time)
-            # Convert to Mbps for readability
-            throughput_values.append(bits_per_second / 1e6)
-        
-        return {
-            'times': times,
-            'throughput': throughput_values
-        }
+        return loaders.load_iperf(json_file)
     except Exception as e:
         print(f"Warning: Could not process iperf3 JSON file {json_file}: {e}")
         return None
 
-def create_overlay_plot(rtt_data_list, iperf_data_list, labels, output_file=None):
-    """Create a time series plot overlaying multiple RTT datasets."""
-    fig, ax1 = plt.subplots(figsize=(14, 8))
-    
-    # Colors for different datasets - USE THESE INSTEAD
-    colors = ['blue', 'red', 'green']
-    styles = ['-', '--', '-.']
-    
-    # Plot each RTT dataset - FIX THIS PART
-    for i, (rtt_data, label) in enumerate(zip(rtt_data_list, labels)):
-        if rtt_data is not None:
-            # Specify color and linestyle separately instead of as a format string
-            ax1.plot(rtt_data['frame.time_relative'], rtt_data['tcp.analysis.ack_rtt'], 
-                    color=colors[i], linestyle=styles[i], linewidth=1.2, alpha=0.7, 
-                    label=f'RTT - {label}')
-    
-    ax1.set_xlabel('Time (seconds)', fontsize=12)
-    ax1.set_ylabel('Round Trip Time (ms)', fontsize=12)
-    
-    # Add vertical lines for bandwidth changes
-    markers = [5, 10, 15, 20]  # Change based on your test intervals
-    marker_labels = ['5Mbps→2Mbps', '2Mbps→1Mbps', '1Mbps→500kbps', 'End of test']
-    marker_colors = ['gray', 'gray', 'gray', 'gray']
-    
-    for marker, label, color in zip(markers, marker_labels, marker_colors):
-        ax1.axvline(x=marker, color=color, linestyle='--', alpha=0.5, label=label)
-    
-    # Handle iperf data if available - FIX THIS PART TOO
-    ax2 = None
-    if any(iperf_data is not None for iperf_data in iperf_data_list):
-        ax2 = ax1.twinx()
-        for i, (iperf_data, label) in enumerate(zip(iperf_data_list, labels)):
-            if iperf_data is not None:
-                # Specify color and linestyle separately here too
-                ax2.plot(iperf_data['times'], iperf_data['throughput'], 
-                         color=colors[i], linestyle='-', linewidth=1.0, alpha=0.4, 
-                         label=f'Throughput - {label}')
-        ax2.set_ylabel('Throughput (Mbps)', fontsize=12)
-    
-    # Add statistics text for each dataset
-    y_pos = 0.02
-    for i, (rtt_data, label) in enumerate(zip(rtt_data_list, labels)):
-        if rtt_data is not None:
-            stats_text = f"{label} Stats:\n"
-            stats_text += f"Avg RTT: {rtt_data['tcp.analysis.ack_rtt'].mean():.2f} ms\n"
-            stats_text += f"Min RTT: {rtt_data['tcp.analysis.ack_rtt'].min():.2f} ms\n"
-            stats_text += f"Max RTT: {rtt_data['tcp.analysis.ack_rtt'].max():.2f} ms\n"
-            stats_text += f"Std Dev: {rtt_data['tcp.analysis.ack_rtt'].std():.2f} ms"
+def create_overlay_plot(rtt_data_list, iperf_data_list, labels, output_file=None, decimation='minmax',
+                        manifest=None):
+    """Create a time series plot overlaying multiple RTT datasets.
+
+    Each RTT series is thinned to the plot width first (see decimate.py).
+    Phase markers come from manifest (default schedule if None).
+    """
+    with profiling.stage('import matplotlib'):
+        import matplotlib.pyplot as plt
+    
+    with profiling.stage('draw'):
+        fig, ax1 = plt.subplots(figsize=(14, 8))
+    
+        # Colors for different datasets - USE THESE INSTEAD
+        colors = ['blue', 'red', 'green']
+        styles = ['-', '--', '-.']
+    
+        # Plot each RTT dataset - FIX THIS PART
+        for i, (rtt_data, label) in enumerate(zip(rtt_data_list, labels)):
+            if rtt_data is not None:
+                # Specify color and linestyle separately instead of as a format string
+                rtt_x, rtt_y = decimate.decimate_for_axes(ax1, rtt_data.time, rtt_data.rtt,
+                                                          decimation, 300, label=f'RTT - {label}')
+                ax1.plot(rtt_x, rtt_y, 
+                        color=colors[i % len(colors)], linestyle=styles[i % len(styles)], linewidth=1.2, alpha=0.7, 
+                        label=f'RTT - {label}')
+    
+        ax1.set_xlabel('Time (seconds)', fontsize=12)
+        ax1.set_ylabel('Round Trip Time (ms)', fontsize=12)
+    
+        # Add vertical lines for bandwidth changes - from the run manifest
+        if manifest is None:
+            manifest = phases.load_manifest()
+    
+        for marker, label in phases.markers(manifest):
+            ax1.axvline(x=marker, color='gray', linestyle='--', alpha=0.5, label=label)
+    
+        # Handle iperf data if available - FIX THIS PART TOO
+        ax2 = None
+        if any(iperf_data is not None for iperf_data in iperf_data_list):
+            ax2 = ax1.twinx()
+            for i, (iperf_data, label) in enumerate(zip(iperf_data_list, labels)):
+                if iperf_data is not None:
+                    # Specify color and linestyle separately here too
+                    ax2.plot(iperf_data['times'], iperf_data['throughput'], 
+                             color=colors[i % len(colors)], linestyle='-', linewidth=1.0, alpha=0.4, 
+                             label=f"{iperf_data.get('label', 'Throughput')} - {label}")
+            ax2.set_ylabel('Throughput (Mbps)', fontsize=12)
+    
+        # Add statistics text for each dataset
+        y_pos = 0.02
+        for i, (rtt_data, label) in enumerate(zip(rtt_data_list, labels)):
+            if rtt_data is not None:
+                stats = rtt_data.stats()
+                stats_text = f"{label} Stats:\n"
+                stats_text += f"Avg RTT: {stats['mean']:.2f} ms\n"
+                stats_text += f"Min RTT: {stats['min']:.2f} ms\n"
+                stats_text += f"Max RTT: {stats['max']:.2f} ms\n"
+                stats_text += f"Std Dev: {stats['std']:.2f} ms"
             
-            plt.figtext(0.02, y_pos, stats_text, fontsize=9, 
-                        bbox=dict(facecolor=colors[i], alpha=0.1))
-            y_pos += 0.15
-    
-    # Create a combined legend
-    handles1, labels1 = ax1.get_legend_handles_labels()
-    if ax2:
-        handles2, labels2 = ax2.get_legend_handles_labels()
-        ax1.legend(handles1 + handles2, labels1 + labels2, loc='upper right', 
-                  fontsize=9, framealpha=0.7)
-    else:
-        ax1.legend(loc='upper right', fontsize=9, framealpha=0.7)
+                plt.figtext(0.02, y_pos, stats_text, fontsize=9, 
+                            bbox=dict(facecolor=colors[i % len(colors)], alpha=0.1))
+                y_pos += 0.15
     
-    # Add a title
-    plt.title('TCP RTT Comparison', fontsize=14)
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
+        # Create a combined legend
+        handles1, labels1 = ax1.get_legend_handles_labels()
+        if ax2:
+            handles2, labels2 = ax2.get_legend_handles_labels()
+            ax1.legend(handles1 + handles2, labels1 + labels2, loc='upper right', 
+                      fontsize=9, framealpha=0.7)
+        else:
+            ax1.legend(loc='upper right', fontsize=9, framealpha=0.7)
+    
+        # Add a title
+        plt.title('TCP RTT Comparison', fontsize=14)
+        plt.grid(True, alpha=0.3)
+        plt.tight_layout()
     
     # Save the figure if requested
-    if output_file:
-        plt.savefig(output_file, dpi=300)
-        print(f"Plot saved as {output_file}")
-    else:
+    if not output_file:
         output_file = "rtt_comparison.png"
+    with profiling.stage('savefig dpi=300'):
         plt.savefig(output_file, dpi=300)
-        print(f"Plot saved as {output_file}")
+    print(f"Plot saved as {output_file}")
     
     # Show the plot
     plt.show()
 
+def parse_group(spec):
+    """argparse type for --group label=a.csv,b.csv -> (label, [files])."""
+    label, sep, files = spec.partition('=')
+    files = [f for f in files.split(',') if f]
+    if not sep or not label or not files:
+        raise argparse.ArgumentTypeError(f"expected label=file1.csv,file2.csv, got '{spec}'")
+    return label, files
+
+def load_rtt_columns(csv_file, flow=flows.DOMINANT, mmap=False):
+    """One run as a loaders.Run (time/RTT arrays only), None if unreadable."""
+    if not os.path.exists(csv_file):
+        print(f"Warning: File {csv_file} not found. Skipping.")
+        return None
+    try:
+        return loaders.load_run(csv_file, flow, mmap=mmap)
+    except Exception as e:
+        print(f"Error processing RTT CSV file {csv_file}: {e}")
+        return None
+
+def print_file_flows(csv_file):
+    """Per-flow breakdown of one run, for --flows."""
+    try:
+        columns = loaders.load_rtt(csv_file, flows.ALL)
+    except Exception as e:
+        print(f"Error processing RTT CSV file {csv_file}: {e}")
+        return
+    print(f"{csv_file}:")
+    flows.print_flows(flows.breakdown(columns))
+
+def load_groups(groups, jobs=None, flow=flows.DOMINANT, mmap=False):
+    """Load every run of every group concurrently, keeping the group order.
+
+    Threads are enough: cache hits are plain file reads and the pandas
+    (pyarrow/C) parsers release the GIL while they work. mmap keeps the
+    runs memory-mapped on their cache files (see loaders.load_run).
+    """
+    files = [f for _, group_files in groups for f in group_files]
+    with profiling.stage('load groups', len(files)), ThreadPoolExecutor(max_workers=jobs or min(32, (os.cpu_count() or 1) + 4)) as pool:
+        columns = dict(zip(files, pool.map(load_rtt_columns, files, [flow] * len(files), [mmap] * len(files))))
+    return [(label, [columns[f] for f in group_files if columns[f] is not None])
+            for label, group_files in groups]
+
+def group_bands(runs, step, n_bins, bands=BANDS):
+    """Median and percentile bands of the runs' per-bin mean RTT on a shared grid.
+
+    Each run is reduced to one mean per grid step first (align.grid_rtt), so
+    the result has n_bins points per curve however many samples went in.
+    """
+    matrix = np.full((len(runs), n_bins), np.nan)
+    for i, run in enumerate(runs):
+        _, mean, _ = align.grid_rtt(run.time, run.rtt, 0.0, step, n_bins)
+        matrix[i] = mean
+    pcts = [50] + [p for band in bands for p in band]
+    with warnings.catch_warnings():
+        # grid steps where no run has a sample are simply left NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        values = np.nanpercentile(matrix, pcts, axis=0)
+    return dict(zip(pcts, values))
+
+def print_group_table(groups):
+    print(f"{'group':<16} {'runs':>5} {'samples':>9} {'mean':>8} {'p50':>8} {'p95':>8}")
+    for label, runs in groups:
+        rtts = [run.rtt for run in runs if len(run)]
+        samples = sum(len(r) for r in rtts)
+        if not rtts:
+            print(f"{label:<16} {len(runs):>5} {samples:>9} {'-':>8} {'-':>8} {'-':>8}")
+            continue
+        # median over runs of each run's statistic, so long runs don't dominate
+        mean = np.median([r.mean(dtype=np.float64) for r in rtts])
+        p50, p95 = np.median([np.percentile(r, (50, 95)) for r in rtts], axis=0)
+        print(f"{label:<16} {len(runs):>5} {samples:>9} {mean:>8.4f} {p50:>8.4f} {p95:>8.4f}")
+
+def create_group_plot(groups, output_file=None, step=0.1, manifest=None, bands=BANDS):
+    """Plot each group of runs as a median RTT line with percentile bands."""
+    with profiling.stage('import matplotlib'):
+        import matplotlib.pyplot as plt
+    
+    end = max((float(run.time.max()) for _, runs in groups for run in runs if len(run)), default=0.0)
+    n_bins = max(int(np.ceil(end / step)), 1)
+    t = (np.arange(n_bins) + 0.5) * step
+    
+    with profiling.stage('draw'):
+        fig, ax1 = plt.subplots(figsize=(14, 8))
+        colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+        for i, (label, runs) in enumerate(groups):
+            if not runs:
+                continue
+            color = colors[i % len(colors)]
+            with profiling.stage(f'resample {label}', sum(len(run) for run in runs)):
+                curves = group_bands(runs, step, n_bins, bands)
+            for j, (lo, hi) in enumerate(bands):
+                ax1.fill_between(t, curves[lo], curves[hi], color=color, alpha=0.12 + 0.1 * j, linewidth=0,
+                                 label=f'{label} p{lo}-p{hi}')
+            ax1.plot(t, curves[50], color=color, linewidth=1.4, label=f'{label} median ({len(runs)} runs)')
+    
+        ax1.set_xlabel('Time (seconds)', fontsize=12)
+        ax1.set_ylabel('Round Trip Time (ms)', fontsize=12)
+    
+        if manifest is None:
+            manifest = phases.load_manifest()
+        for marker, label in phases.markers(manifest):
+            ax1.axvline(x=marker, color='gray', linestyle='--', alpha=0.5)
+    
+        ax1.legend(loc='upper right', fontsize=9, framealpha=0.7)
+        plt.title(f'TCP RTT Comparison by group ({step:g}s grid)', fontsize=14)
+        plt.grid(True, alpha=0.3)
+        plt.tight_layout()
+    
+    output_file = output_file or "rtt_group_comparison.png"
+    with profiling.stage('savefig dpi=300'):
+        plt.savefig(output_file, dpi=300)
+    print(f"Plot saved as {output_file}")
+    plt.show()
+    return output_file
+
+def groups_from_catalog(rows, by, where):
+    """[(label, [rtt_csv, ...])] from catalog rows, one group per value of column by."""
+    if not by:
+        return [(where, [row['rtt_csv'] for row in rows])]
+    if by not in rows[0]:
+        print(f"Error: no column '{by}' in the runs table, expected one of {sorted(rows[0])}")
+        sys.exit(1)
+    groups = {}
+    for row in rows:
+        groups.setdefault(str(row[by]), []).append(row['rtt_csv'])
+    return sorted(groups.items())
+
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Compare multiple RTT CSV files with optional iperf3 data.')
-    parser.add_argument('files', nargs='+', help='1-3 RTT CSV files to compare')
+    parser.add_argument('files', nargs='*', help='RTT CSV files to overlay')
+    parser.add_argument('--group', '-g', action='append', type=parse_group, metavar='LABEL=A.csv,B.csv',
+                        help='A group of runs drawn as one median line with percentile bands (repeatable)')
+    parser.add_argument('--step', type=float, default=0.1, help='Group mode: shared time grid step in seconds')
+    parser.add_argument('--jobs', '-j', type=int, help='Group mode: files loaded at once')
+    parser.add_argument('--mmap', action='store_true',
+                        help='Group mode: keep the runs memory-mapped on their cache files instead of in RAM')
     parser.add_argument('--iperf', '-i', nargs='*', help='Corresponding iperf3 JSON files')
+    parser.add_argument('--throughput', choices=('iperf', 'pcap'), default='iperf',
+                        help="Throughput source: the --iperf files, or goodput binned from each run's pcap (see goodput.py)")
+    parser.add_argument('--tput-step', type=float, default=goodput.STEP,
+                        help='--throughput pcap: bin width in seconds (default: 0.01)')
     parser.add_argument('--labels', '-l', nargs='*', help='Labels for each dataset')
     parser.add_argument('--output', '-o', help='Output file name (PNG)')
+    parser.add_argument('--manifest', help='Run manifest with the tune schedule (default: the first run\'s run_<ts>.json)')
+    parser.add_argument('--decimate', choices=decimate.METHODS, default='minmax',
+                        help='Thin each RTT line to the plot width before drawing (default: minmax)')
+    catalog.add_arguments(parser)
+    parser.add_argument('--by', help='With --where: one group per value of this runs column (e.g. qdisc)')
+    flows.add_arguments(parser)
+    profiling.add_arguments(parser)
     
     args = parser.parse_args()
+    profiling.from_args(args)
     
-    # Validate number of files
-    if len(args.files) > 3:
-        print("Error: Maximum 3 RTT files can be compared at once.")
-        sys.exit(1)
+    if args.where:
+        if args.files or args.group:
+            print("Error: --where selects the runs itself, don't also give files or --group.")
+            sys.exit(1)
+        args.group = groups_from_catalog(catalog.select(args.catalog, args.where), args.by, args.where)
+    
+    if args.group:
+        if args.files:
+            print("Error: give either RTT files to overlay or --group options, not both.")
+            sys.exit(1)
+        if args.flows:
+            for _, files in args.group:
+                for csv_file in files:
+                    print_file_flows(csv_file)
+        groups = load_groups(args.group, args.jobs, args.flow, args.mmap)
+        print_group_table(groups)
+        if not any(runs for _, runs in groups):
+            print("Error: no readable runs in any group.")
+            sys.exit(1)
+        manifest = phases.load_manifest(args.group[0][1][0], args.manifest)
+        create_group_plot(groups, args.output, args.step, manifest)
+        return
+    if not args.files:
+        parser.error('no RTT files given (or use --group)')
     
     # Process each RTT file
     rtt_data_list = []
@@ -170,12 +311,17 @@ def main():
             print(f"Warning: File {csv_file} not found. Skipping.")
             rtt_data_list.append(None)
             continue
-        rtt_data = process_rtt_csv(csv_file)
+        if args.flows:
+            print_file_flows(csv_file)
+        rtt_data = process_rtt_csv(csv_file, args.flow)
         rtt_data_list.append(rtt_data)
     
     # Process iperf data if provided
     iperf_data_list = []
-    if args.iperf:
+    if args.throughput == 'pcap':
+        iperf_data_list = [goodput.load_for(f, args.tput_step) if rtt_data is not None else None
+                           for f, rtt_data in zip(args.files, rtt_data_list)]
+    elif args.iperf:
         for json_file in args.iperf:
             iperf_data = process_iperf_json(json_file) if json_file and os.path.exists(json_file) else None
             iperf_data_list.append(iperf_data)
@@ -194,8 +340,11 @@ def main():
         # Use filenames as labels
         labels = [os.path.splitext(os.path.basename(f))[0] for f in args.files]
     
+    # Phase markers follow the first run's manifest
+    manifest = phases.load_manifest(args.files[0], args.manifest)
+    
     # Create the overlay plot
-    create_overlay_plot(rtt_data_list, iperf_data_list, labels, args.output)
+    create_overlay_plot(rtt_data_list, iperf_data_list, labels, args.output, args.decimate, manifest)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
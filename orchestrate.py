@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""Run the full-test.sh experiment from Python, with asyncio instead of polling loops.
+
+full-test.sh runs every VM command through vm_exec_get, which polls
+guest-exec-status every 0.2 s, one command after another: a tune is four
+of those, so a bandwidth change lands a second or more after it was due
+and the phase boundaries drift by the sum of all the sleeps before them.
+Here the same steps (setup_ifb, setup_router, tune, capture, iperf3) are
+asyncio tasks:
+
+- commands on different VMs, or on different devices of one VM, run
+  concurrently; a tune is one guest-exec per shaped device, both at once;
+- guest-exec-status is polled from POLL_START, backing off to POLL_MAX,
+  so short tc commands come back in a few ms;
+- phases are scheduled against the capture start (T0), not by sleeping
+  after the previous step, so a slow tune doesn't push the later ones.
+
+run_<ts>.json gets the same phases/end as full-test.sh writes, where each
+phase's 'start' is when its tune finished, plus 'planned' and 'issued'
+times. A lateness report (issued/applied minus planned, per phase) is
+printed at the end, and `--report run_<ts>.json` prints it for an
+existing manifest.
+
+The VMs are reached through an agent: VirshAgent (virsh
+qemu-agent-command + scp) or StubAgent, which answers every command after
+a fixed delay without touching any VM, to check the timing locally (and
+in test_orchestrate.py):
+
+    python orchestrate.py [qdisc]                       # fq_codel by default
+    python orchestrate.py --agent stub --schedule run_<ts>.json
+    python orchestrate.py --report run_<ts>.json
+"""
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import argparse
+from collections import namedtuple
+
+import phases
+
+SND_VM = 'fyp-1'
+RCV_VM = 'fyp-3'
+ROUT_VM = 'debian12'
+# ssh host names for fetching files from the VMs
+HOSTS = {SND_VM: 'fyp-vm1'}
+SND_IP = '192.168.10.10'
+RCV_IP = '192.168.11.10'
+
+# guest-exec-status polling: first retry after POLL_START, doubling up to POLL_MAX
+POLL_START = 0.005
+POLL_MAX = 0.2
+
+# tuned before the capture starts, then the schedule's first phase
+PRIME = ('5Mbps', '50ms')
+# wait after starting the iperf3 server, after killing iperf3, and before stopping the capture
+SERVER_START = 0.5
+IPERF_FLUSH = 1.0
+CAPTURE_TAIL = 5.0
+
+Result = namedtuple('Result', 'exitcode out err')
+
+
+class AgentError(Exception):
+    """The agent could not run a command at all (as opposed to a command failing)."""
+
+
+class VirshAgent:
+    """Runs shell commands in the VMs through the qemu guest agent."""
+
+    def __init__(self, sudo=True, poll_start=POLL_START, poll_max=POLL_MAX):
+        self.prefix = ['sudo'] if sudo else []
+        self.poll_start = poll_start
+        self.poll_max = poll_max
+
+    async def _call(self, *argv):
+        proc = await asyncio.create_subprocess_exec(*self.prefix, *argv, stdout=asyncio.subprocess.PIPE,
+                                                    stderr=asyncio.subprocess.PIPE)
+        out, err = await proc.communicate()
+        if proc.returncode != 0:
+            raise AgentError(f"{' '.join(argv[:3])}: {err.decode(errors='replace').strip()}")
+        return out
+
+    async def _agent(self, vm, execute, arguments):
+        command = json.dumps({'execute': execute, 'arguments': arguments})
+        out = await self._call('virsh', 'qemu-agent-command', vm, command)
+        try:
+            return json.loads(out)['return']
+        except (ValueError, KeyError) as e:
+            raise AgentError(f"{vm}: unexpected guest agent reply {out[:200]!r}: {e}")
+
+    async def spawn(self, vm, cmd):
+        """Start cmd under /bin/sh -c in vm, returns the guest pid without waiting."""
+        reply = await self._agent(vm, 'guest-exec', {'path': '/bin/sh', 'arg': ['-c', cmd],
+                                                     'capture-output': True})
+        return reply['pid']
+
+    async def status(self, vm, pid):
+        """Result of pid if it has exited, else None."""
+        reply = await self._agent(vm, 'guest-exec-status', {'pid': pid})
+        if not reply.get('exited'):
+            return None
+        return Result(reply.get('exitcode'), _decode(reply.get('out-data')), _decode(reply.get('err-data')))
+
+    async def wait(self, vm, pid):
+        delay = self.poll_start
+        while True:
+            result = await self.status(vm, pid)
+            if result is not None:
+                return result
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.poll_max)
+
+    async def run(self, vm, cmd):
+        return await self.wait(vm, await self.spawn(vm, cmd))
+
+    async def fetch(self, vm, remote, local):
+        await self._call('scp', '-q', f"{HOSTS.get(vm, vm)}:{remote}", local)
+
+
+class StubAgent:
+    """Stands in for VirshAgent without any VM: every command succeeds after latency seconds.
+
+    Commands are recorded in .log as (seconds since creation, vm, command).
+    outputs maps a substring of a command to its stdout, by default the
+    interface lookups answer 'eth1'.
+    """
+
+    def __init__(self, latency=0.02, outputs=None):
+        self.latency = latency
+        self.outputs = {f'to {SND_IP}': 'eth1\n', f'to {RCV_IP}': 'eth1\n'} if outputs is None else outputs
+        self.log = []
+        self.commands = {}
+        self.origin = time.monotonic()
+
+    async def spawn(self, vm, cmd):
+        self.log.append((time.monotonic() - self.origin, vm, cmd))
+        pid = len(self.log)
+        self.commands[pid] = cmd
+        return pid
+
+    async def wait(self, vm, pid):
+        await asyncio.sleep(self.latency)
+        cmd = self.commands.pop(pid, '')
+        out = next((out for key, out in self.outputs.items() if key in cmd), '')
+        return Result(0, out, '')
+
+    async def run(self, vm, cmd):
+        return await self.wait(vm, await self.spawn(vm, cmd))
+
+    async def fetch(self, vm, remote, local):
+        self.log.append((time.monotonic() - self.origin, vm, f'fetch {remote} -> {local}'))
+
+
+def _decode(data):
+    return base64.b64decode(data).decode(errors='replace') if data else ''
+
+
+def half_rtt(rtt):
+    """'50ms' -> '25ms', what netem gets on each of the two shaped devices."""
+    num = rtt.rstrip('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+    return f"{float(num) / 2:g}{rtt[len(num):]}"
+
+
+class Experiment:
+    """One full-test.sh run: the steps, on an agent, timed against the capture start."""
+
+    def __init__(self, agent, qdisc='fq_codel', schedule=None, ts=None, out_dir='.'):
+        self.agent = agent
+        self.qdisc = qdisc
+        self.schedule = schedule or phases.DEFAULT_SCHEDULE
+        self.ts = ts or time.strftime('%Y%m%d-%H%M%S')
+        self.out_dir = out_dir
+        self.rifn = self.sifn = None
+        self.t0 = None
+        self.marks = []
+
+    def now(self):
+        """Seconds since the capture started."""
+        return time.monotonic() - self.t0
+
+    async def vm(self, vm, cmd):
+        """vm_exec_get: run cmd and wait for it, printing its stderr like full-test.sh."""
+        result = await self.agent.run(vm, cmd)
+        if result.err:
+            print(f"[err] {vm}: {result.err.strip()}")
+        return result.out
+
+    async def vm_seq(self, vm, *cmds):
+        for cmd in cmds:
+            await self.vm(vm, cmd)
+
+    async def ifname(self, vm, ip):
+        return (await self.vm(vm, f"ip -o addr show to {ip} | awk '{{print $2}}'")).strip()
+
+    async def setup_ifb(self):
+        await self.vm_seq(RCV_VM, "modprobe ifb numifbs=1", "ip link set dev ifb0 up",
+                          "tc qdisc del dev ifb0 root", f"tc qdisc del dev {self.rifn} root",
+                          f"tc qdisc replace dev {self.rifn} handle ffff: ingress",
+                          f"tc filter replace dev {self.rifn} parent ffff: protocol ip u32 match u32 0 0 "
+                          "action mirred egress redirect dev ifb0")
+
+    async def setup_router(self):
+        await asyncio.gather(self.vm(ROUT_VM, f"tc qdisc replace dev veth1 root {self.qdisc}"),
+                             self.vm(ROUT_VM, f"tc qdisc replace dev vwlan3 root {self.qdisc}"))
+
+    async def tune(self, bw, rtt):
+        """netem delay + tbf rate on ifb0 and the receive interface, both devices at once."""
+        print(f"bw={bw}, rtt={rtt}")
+        half = half_rtt(rtt)
+        # the tbf child needs the netem root above it, so in order within a device
+        await asyncio.gather(*(self.vm(RCV_VM, f"tc qdisc replace dev {dev} root handle 1: netem delay {half}; "
+                                               f"tc qdisc replace dev {dev} parent 1: handle 10: tbf rate {bw} "
+                                               "burst 32kB latency 50ms")
+                               for dev in ('ifb0', self.rifn)))
+
+    async def start_capture(self):
+        await self.vm(SND_VM, "killall tcpdump")
+        return await self.agent.spawn(SND_VM, f"tcpdump -U -i {self.sifn} -w /tmp/{self.ts}.pcap")
+
+    async def begin_iperf(self):
+        await asyncio.gather(self.vm(SND_VM, "killall iperf3"), self.vm(RCV_VM, "killall iperf3"))
+        await self.agent.spawn(RCV_VM, "iperf3 -s")
+        await asyncio.sleep(SERVER_START)
+        await self.agent.spawn(SND_VM, f"iperf3 -c {RCV_IP} -J -t 0 --logfile=/tmp/iperf3_{self.ts}.json")
+
+    async def finish_iperf(self):
+        await asyncio.gather(self.vm(SND_VM, "killall iperf3"), self.vm(RCV_VM, "killall iperf3"))
+        # iperf3 still writes its json on the way out
+        await asyncio.sleep(IPERF_FLUSH)
+
+    async def run_schedule(self):
+        """Tune each phase after the first at its planned time, recording when it took effect."""
+        for phase in self.schedule['phases'][1:]:
+            await asyncio.sleep(max(0.0, phase['start'] - self.now()))
+            issued = self.now()
+            await self.tune(phase['bw'], phase['rtt'])
+            self.mark(phase, issued)
+        await asyncio.sleep(max(0.0, self.schedule['end'] - self.now()))
+
+    def mark(self, phase, issued):
+        self.marks.append({'start': round(self.now(), 3), 'bw': phase['bw'], 'rtt': phase['rtt'],
+                           'planned': phase['start'], 'issued': round(issued, 3)})
+
+    async def run(self):
+        print(f"qdisc: {self.qdisc}")
+        self.rifn, self.sifn = await asyncio.gather(self.ifname(RCV_VM, RCV_IP), self.ifname(SND_VM, SND_IP))
+        await asyncio.gather(self.setup_ifb(), self.setup_router())
+        first = self.schedule['phases'][0]
+        await self.tune(*PRIME)
+        await self.tune(first['bw'], first['rtt'])
+        await self.start_capture()
+        self.t0 = time.monotonic()
+        self.mark(first, 0.0)
+        # iperf3 starts while the schedule is already counting from T0
+        await asyncio.gather(self.begin_iperf(), self.run_schedule())
+        end = round(self.now(), 3)
+        await self.finish_iperf()
+        await asyncio.sleep(CAPTURE_TAIL)
+        await self.vm(SND_VM, "killall tcpdump")
+        pcap = os.path.join(self.out_dir, f"{self.ts}.pcap")
+        iperf_json = os.path.join(self.out_dir, f"iperf3_{self.ts}.json")
+        await asyncio.gather(self.agent.fetch(SND_VM, f"/tmp/{self.ts}.pcap", pcap),
+                             self.agent.fetch(SND_VM, f"/tmp/iperf3_{self.ts}.json", iperf_json))
+        await self.vm(SND_VM, f"rm -f /tmp/{self.ts}.pcap /tmp/iperf3_{self.ts}.json")
+        return {'time': self.ts, 'qdisc': self.qdisc, 'phases': self.marks, 'end': end,
+                'planned_end': self.schedule['end']}
+
+
+def load_schedule(path):
+    """phases/end of a manifest to run; raises ValueError saying what is wrong with it.
+
+    Unlike phases.load_manifest() there is no fallback to the default
+    schedule, a bad --schedule should stop the run rather than run another one.
+    """
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+    except OSError as e:
+        raise ValueError(f"cannot read schedule {path}: {e.strerror}")
+    except ValueError as e:
+        raise ValueError(f"schedule {path} is not valid json: {e}")
+    try:
+        steps = sorted(({'start': float(p['start']), 'bw': p['bw'], 'rtt': p['rtt']}
+                        for p in manifest['phases']), key=lambda p: p['start'])
+        end = manifest['end']
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"schedule {path} needs 'phases' with start/bw/rtt and an 'end' ({e!r})")
+    if not steps:
+        raise ValueError(f"schedule {path} has no phases")
+    if end is None or float(end) <= steps[-1]['start']:
+        raise ValueError(f"schedule {path} needs an 'end' after its last phase start")
+    return {'qdisc': manifest.get('qdisc'), 'phases': steps, 'end': float(end), 'source': path}
+
+
+def write_manifest(manifest, out_dir='.'):
+    path = os.path.join(out_dir, f"run_{manifest['time']}.json")
+    with open(path, 'w') as f:
+        json.dump(manifest, f)
+    print(f"Manifest saved as {path}")
+    return path
+
+
+def lateness(manifest):
+    """Per phase: planned start, and how late the tune was issued and applied.
+
+    Manifests without 'planned' times (full-test.sh) are held against
+    the DEFAULT_SCHEDULE phase at the same position.
+    """
+    default = phases.DEFAULT_SCHEDULE['phases']
+    rows = []
+    for i, p in enumerate(manifest['phases']):
+        planned = p.get('planned', default[i]['start'] if i < len(default) else None)
+        issued = p.get('issued')
+        rows.append({'bw': p['bw'], 'rtt': p.get('rtt'), 'planned': planned, 'start': p['start'],
+                     'issue_late': None if planned is None or issued is None else issued - planned,
+                     'late': None if planned is None else p['start'] - planned,
+                     'tune': None if issued is None else p['start'] - issued})
+    return rows
+
+
+def print_lateness(manifest):
+    def cell(value):
+        return f"{'-':>8}" if value is None else f"{value:>8.3f}"
+
+    print(f"{'phase':<16} {'planned':>8} {'start':>8} {'issued+':>8} {'late':>8} {'tune':>8}")
+    for row in lateness(manifest):
+        label = f"{row['bw']} {row['rtt'] or ''}".strip()
+        print(f"{label:<16} {cell(row['planned'])} {cell(row['start'])} {cell(row['issue_late'])} "
+              f"{cell(row['late'])} {cell(row['tune'])}")
+    planned_end = manifest.get('planned_end', phases.DEFAULT_SCHEDULE['end'])
+    if manifest.get('end') is not None and planned_end is not None:
+        print(f"{'end':<16} {cell(planned_end)} {cell(manifest['end'])} {'':>8} "
+              f"{cell(manifest['end'] - planned_end)}")
+
+
+def extract(ts, out_dir='.'):
+    """rtt_<ts>.csv from the fetched pcap, the pre-analyse step of full-test.sh."""
+    import pcaprtt
+    pcap = os.path.join(out_dir, f"{ts}.pcap")
+    if not os.path.exists(pcap):
+        print(f"Warning: {pcap} was not fetched, skipping RTT extraction")
+        return None
+    rtt_csv = os.path.join(out_dir, f"rtt_{ts}.csv")
+    columns = pcaprtt.extract_rtt(pcap)
+    with open(rtt_csv, 'w') as f:
+        pcaprtt.write_csv(columns, f)
+    print(f"Wrote {len(columns['tcp.analysis.ack_rtt'])} RTT samples to {rtt_csv}")
+    return rtt_csv
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the qdisc experiment (full-test.sh) with concurrent VM commands.')
+    parser.add_argument('qdisc', nargs='?', default='fq_codel', help='Router qdisc (default: fq_codel)')
+    parser.add_argument('--agent', choices=('virsh', 'stub'), default='virsh',
+                        help="How commands reach the VMs; 'stub' runs the schedule without any VM")
+    parser.add_argument('--stub-latency', type=float, default=0.02, help='Stub agent: seconds per command')
+    parser.add_argument('--no-sudo', action='store_true', help='Call virsh/scp without sudo')
+    parser.add_argument('--schedule', help='Manifest whose phases/end to run (default: the full-test.sh schedule)')
+    parser.add_argument('--out-dir', default='.', help='Where the pcap, iperf3 json and manifest go')
+    parser.add_argument('--report', metavar='MANIFEST', help='Only print the lateness report of an existing run')
+    args = parser.parse_args()
+
+    if args.report:
+        if not os.path.exists(args.report):
+            print(f"Error: manifest '{args.report}' not found.")
+            sys.exit(1)
+        print_lateness(phases.load_manifest(manifest_file=args.report))
+        return
+
+    schedule = None
+    if args.schedule:
+        try:
+            schedule = load_schedule(args.schedule)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+    if args.agent == 'stub':
+        agent = StubAgent(args.stub_latency)
+    else:
+        agent = VirshAgent(sudo=not args.no_sudo)
+    experiment = Experiment(agent, args.qdisc, schedule, out_dir=args.out_dir)
+    try:
+        manifest = asyncio.run(experiment.run())
+    except AgentError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    write_manifest(manifest, args.out_dir)
+    print_lateness(manifest)
+    if args.agent == 'stub':
+        print(f"{len(agent.log)} commands sent to the stub agent")
+        return
+    rtt_csv = extract(manifest['time'], args.out_dir)
+    if rtt_csv:
+        print(f"RTT analysis done, please run python analyse.py {rtt_csv} iperf3_{manifest['time']}.json "
+              f"(phases from run_{manifest['time']}.json)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""One-way delay and loss from the sender and receiver captures of a run.
+
+junkyard/capture.sh runs tcpdump on both VM interfaces of the host:
+capture/s_<name>.pcap on the sender side and capture/r_<name>.pcap on the
+receiver side, both stamped by the host clock. The same packet shows up in
+both files. Matching the two copies gives the packet's one-way delay, and
+the file that saw it first gives its direction. That tells a queue on the
+way to the receiver apart from one on the ACK path, which ack_rtt only
+ever sees as a sum.
+
+Matching is a hash join. Each packet is keyed by a 64-bit hash of its
+addresses, ports, IP ID, TCP seq, TCP ack, payload length, window and
+TCP timestamp. The extra fields tell apart pure ACKs, which Linux sends
+with IP ID 0 and an unchanged seq.
+Identical repeated packets (the receiver's RSTs) are paired in order of
+appearance. If a copy is missing, that order slips; pairs that would
+arrive before they left are then dropped and counted as ambiguous.
+
+Both files are walked at once, one pcaprtt.iter_tcp_chunks() chunk at a
+time, always the side that is further behind in time. Unmatched packets
+wait in a per-side table. They leave it once both files are HORIZON
+seconds past them, so the join state is bounded by the packets in flight,
+not by the capture size. A packet given up on in the capture of its
+sending side is a loss. A packet that only the receiving side has
+(capture drop) is counted as missing.
+
+Per direction (s2r, r2s) the result has the loaders.py column layout
+(frame.time_relative = departure time, tcp.seq, tcp.stream and ports),
+with the delay under 'owd' and a 'lost' flag. It is written as
+owd_<name>_<dir>.csv next to the captures, and the plotting scripts read
+those like any RTT CSV. Lost packets have no delay and are left out there.
+
+    python owd.py capture/s_<name>.pcap capture/r_<name>.pcap [--horizon 10]
+    python analyse.py capture/owd_<name>_s2r.csv
+    python multi.py capture/owd_<name>_s2r.csv capture/owd_<name>_r2s.csv
+"""
+import os
+import re
+import sys
+import argparse
+import numpy as np
+
+import pcaprtt
+
+# seconds a packet waits for its other copy; above the worst queueing delay
+HORIZON = 10.0
+SIDES = ('s', 'r')
+DIRECTIONS = ('s2r', 'r2s')
+FIELDS = ('time', 'src', 'dst', 'sport', 'dport', 'seq')
+CSV_COLUMNS = ['frame.time_relative', 'tcp.seq', 'owd', 'tcp.stream', 'tcp.srcport',
+               'tcp.dstport', 'lost']
+
+_M1 = np.uint64(0xbf58476d1ce4e5b9)
+_M2 = np.uint64(0x94d049bb133111eb)
+_K1 = np.uint64(0x9e3779b97f4a7c15)
+_K2 = np.uint64(0x3c6ef372fe94f82a)
+_K3 = np.uint64(0xdaa66d2c7ddf743f)
+
+
+def _mix(x):
+    # splitmix64 finalizer, wraps modulo 2**64
+    x = x ^ (x >> np.uint64(30))
+    x = x * _M1
+    x = x ^ (x >> np.uint64(27))
+    x = x * _M2
+    return x ^ (x >> np.uint64(31))
+
+
+def packet_hash(chunk):
+    """64-bit hash of the header fields that identify a packet on the wire."""
+    u = lambda name: chunk[name].astype(np.uint64)
+    a = (u('src') << np.uint64(32)) | u('dst')
+    b = (u('sport') << np.uint64(48)) | (u('dport') << np.uint64(32)) | u('seq')
+    c = (u('ipid') << np.uint64(48)) | ((u('payload') & np.uint64(0xFFFF)) << np.uint64(32)) | u('ack')
+    d = (u('window') << np.uint64(32)) | u('tsval')
+    return _mix(a) ^ _mix(b + _K1) ^ _mix(c + _K2) ^ _mix(d + _K3)
+
+
+def _occurrence_keys(hashes):
+    """Hash combined with its occurrence number among equal hashes (0, 1, ...).
+
+    Equal packets (duplicate ACKs) are then matched first to first, second
+    to second. Occurrences count in array order, which is time order.
+    """
+    if len(hashes) == 0:
+        return hashes
+    order = np.argsort(hashes, kind='stable')
+    ordered = hashes[order]
+    starts = np.ones(len(ordered), dtype=bool)
+    starts[1:] = ordered[1:] != ordered[:-1]
+    group_start = np.flatnonzero(starts)[np.cumsum(starts) - 1]
+    rank = np.empty(len(hashes), dtype=np.uint64)
+    rank[order] = (np.arange(len(ordered)) - group_start).astype(np.uint64)
+    return _mix(hashes ^ rank)
+
+
+def hash_join(keys, other_keys):
+    """(i, j) index arrays of keys[i] == other_keys[j]; other_keys must be unique."""
+    if len(keys) == 0 or len(other_keys) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    order = np.argsort(other_keys)
+    ordered = other_keys[order]
+    pos = np.minimum(np.searchsorted(ordered, keys), len(ordered) - 1)
+    hit = ordered[pos] == keys
+    return np.flatnonzero(hit), order[pos[hit]]
+
+
+class Pending:
+    """Packets of one capture still waiting for their copy in the other one."""
+
+    def __init__(self):
+        self.hash = np.zeros(0, dtype=np.uint64)
+        self.cols = None
+
+    def __len__(self):
+        return len(self.hash)
+
+    def add(self, hashes, cols):
+        if self.cols is None:
+            self.hash, self.cols = hashes, cols
+            return
+        self.hash = np.concatenate([self.hash, hashes])
+        self.cols = {name: np.concatenate([self.cols[name], cols[name]]) for name in FIELDS}
+
+    def remove(self, idx):
+        """Drop and return the rows idx."""
+        if self.cols is None:
+            return {name: np.zeros(0) for name in FIELDS}
+        keep = np.ones(len(self.hash), dtype=bool)
+        keep[idx] = False
+        taken = {name: values[idx] for name, values in self.cols.items()}
+        self.hash = self.hash[keep]
+        self.cols = {name: values[keep] for name, values in self.cols.items()}
+        return taken
+
+    def expire(self, before):
+        """Drop and return the rows older than before."""
+        if self.cols is None:
+            return self.remove(None)
+        return self.remove(np.flatnonzero(self.cols['time'] < before))
+
+
+def _chunks(pcap_file, chunk_records):
+    for chunk in pcaprtt.iter_tcp_chunks(pcap_file, chunk_records):
+        if len(chunk['time']):
+            yield chunk
+
+
+def match_captures(s_pcap, r_pcap, horizon=HORIZON, chunk_records=pcaprtt.CHUNK_RECORDS):
+    """Stream both captures and pair up the packets they share.
+
+    Returns (matched, unmatched). matched holds the FIELDS arrays from the
+    s side plus 'r_time'. unmatched is {side: FIELDS arrays} of the packets
+    only that side saw.
+    """
+    readers = {'s': _chunks(s_pcap, chunk_records), 'r': _chunks(r_pcap, chunk_records)}
+    ahead = {side: next(readers[side], None) for side in SIDES}
+    pending = {side: Pending() for side in SIDES}
+    # latest time read per side, infinite once a file is done
+    seen = {side: -np.inf for side in SIDES}
+    matched, unmatched = [], {side: [] for side in SIDES}
+
+    while any(chunk is not None for chunk in ahead.values()):
+        # feed whichever file is further behind
+        side = min((s for s in SIDES if ahead[s] is not None), key=lambda s: ahead[s]['time'][0])
+        other = 'r' if side == 's' else 's'
+        chunk = ahead[side]
+        ahead[side] = next(readers[side], None)
+        seen[side] = chunk['time'][-1] if ahead[side] is not None else np.inf
+
+        hashes = packet_hash(chunk)
+        cols = {name: chunk[name] for name in FIELDS}
+        mine, theirs = hash_join(_occurrence_keys(hashes), _occurrence_keys(pending[other].hash))
+        if len(mine):
+            found = pending[other].remove(theirs)
+            s_cols = {name: cols[name][mine] for name in FIELDS} if side == 's' else found
+            r_cols = found if side == 's' else {name: cols[name][mine] for name in FIELDS}
+            matched.append(dict(s_cols, r_time=r_cols['time']))
+        rest = np.ones(len(hashes), dtype=bool)
+        rest[mine] = False
+        pending[side].add(hashes[rest], {name: values[rest] for name, values in cols.items()})
+
+        # nothing older than this can still find its copy
+        cutoff = min(seen.values()) - horizon
+        for s in SIDES:
+            if len(pending[s]):
+                unmatched[s].append(pending[s].expire(cutoff))
+
+    for s in SIDES:
+        unmatched[s].append(pending[s].expire(np.inf))
+    return _concat(matched, FIELDS + ('r_time',)), {s: _concat(unmatched[s], FIELDS) for s in SIDES}
+
+
+def _concat(parts, names):
+    return {name: np.concatenate([p[name] for p in parts]) if parts else np.zeros(0) for name in names}
+
+
+def _pair_keys(cols):
+    return (cols['src'].astype(np.uint64) << np.uint64(32)) | cols['dst'].astype(np.uint64)
+
+
+def one_way_delay(s_pcap, r_pcap, horizon=HORIZON, chunk_records=pcaprtt.CHUNK_RECORDS):
+    """Per-direction one-way delay and loss columns for a capture pair.
+
+    Returns ({'s2r': columns, 'r2s': columns}, counts), where columns are
+    CSV_COLUMNS numpy arrays sorted by departure time (relative to the
+    first packet of either file, owd NaN for lost packets). counts has
+    {'matched', 'lost', 'missing', 'ambiguous'} per direction.
+    """
+    matched, unmatched = match_captures(s_pcap, r_pcap, horizon, chunk_records)
+
+    # an address pair's direction is where most of its matched packets were
+    # seen first; it also decides whether a one-sided packet was lost or
+    # just not captured
+    known, inverse = np.unique(_pair_keys(matched), return_inverse=True)
+    inverse = inverse.reshape(-1)
+    first_s = matched['time'] <= matched['r_time']
+    from_s = np.bincount(inverse, weights=first_s, minlength=len(known)) * 2 \
+        >= np.bincount(inverse, minlength=len(known))
+    s2r = from_s[inverse]
+    delay = np.where(s2r, matched['r_time'] - matched['time'], matched['time'] - matched['r_time'])
+    # identical repeated packets (RSTs, ipid 0) pair up in order; after a
+    # drop that can pair copies that arrive before they left, drop those
+    bad = delay < 0
+    ambiguous = {'s2r': int((bad & s2r).sum()), 'r2s': int((bad & ~s2r).sum())}
+    if bad.any():
+        matched = {name: values[~bad] for name, values in matched.items()}
+        s2r, delay = s2r[~bad], delay[~bad]
+    departure = np.where(s2r, matched['time'], matched['r_time'])
+
+    rows = {name: [matched[name]] for name in FIELDS}
+    rows['time'] = [departure]
+    rows['owd'] = [delay]
+    rows['s2r'] = [s2r]
+    rows['lost'] = [np.zeros(len(delay), dtype=bool)]
+    missing = {}
+    for side in SIDES:
+        cols = unmatched[side]
+        keys = _pair_keys(cols)
+        # pairs never matched count as sent from where they were seen
+        if len(known):
+            pos = np.minimum(np.searchsorted(known, keys), len(known) - 1)
+            leaves_s = np.where(known[pos] == keys, from_s[pos], side == 's')
+        else:
+            leaves_s = np.full(len(keys), side == 's')
+        sent_here = leaves_s if side == 's' else ~leaves_s
+        lost = {name: values[sent_here] for name, values in cols.items()}
+        missing['s2r' if side == 'r' else 'r2s'] = int((~sent_here).sum())
+        for name in FIELDS:
+            rows[name].append(lost[name])
+        rows['owd'].append(np.full(len(lost['time']), np.nan))
+        rows['s2r'].append(np.full(len(lost['time']), side == 's'))
+        rows['lost'].append(np.ones(len(lost['time']), dtype=bool))
+    rows = {name: np.concatenate(parts) for name, parts in rows.items()}
+
+    out, counts = {}, {}
+    if len(rows['time']) == 0:
+        for d in DIRECTIONS:
+            out[d] = {name: np.zeros(0, dtype=bool if name == 'lost' else np.float64) for name in CSV_COLUMNS}
+            counts[d] = {'matched': 0, 'lost': 0, 'missing': 0, 'ambiguous': 0}
+        return out, counts
+
+    start = rows['time'].min()
+    packets = {name: rows[name].astype(np.uint32) for name in ('src', 'dst', 'sport', 'dport')}
+    stream, _ = pcaprtt.assign_streams(packets)
+    for d in DIRECTIONS:
+        sel = rows['s2r'] if d == 's2r' else ~rows['s2r']
+        order = np.flatnonzero(sel)[np.argsort(rows['time'][sel], kind='stable')]
+        seq = rows['seq'][order].astype(np.int64)
+        # relative to the first packet of each stream in this direction
+        _, first, which = np.unique(stream[order], return_index=True, return_inverse=True)
+        seq = (seq - seq[first][which.reshape(-1)]) % (1 << 32)
+        out[d] = {'frame.time_relative': rows['time'][order] - start, 'tcp.seq': seq,
+                  'owd': rows['owd'][order], 'tcp.stream': stream[order],
+                  'tcp.srcport': rows['sport'][order].astype(np.int64),
+                  'tcp.dstport': rows['dport'][order].astype(np.int64), 'lost': rows['lost'][order]}
+        lost = int(out[d]['lost'].sum())
+        counts[d] = {'matched': len(order) - lost, 'lost': lost, 'missing': missing[d],
+                     'ambiguous': ambiguous[d]}
+    return out, counts
+
+
+def write_csv(columns, out):
+    """Write one direction in the quoted tshark-like format loaders.py reads."""
+    out.write(','.join(CSV_COLUMNS) + '\n')
+    rows = zip(columns['frame.time_relative'].tolist(), columns['tcp.seq'].tolist(),
+               columns['owd'].tolist(), columns['tcp.stream'].tolist(),
+               columns['tcp.srcport'].tolist(), columns['tcp.dstport'].tolist(),
+               columns['lost'].tolist())
+    out.writelines(f'"{t:.9f}","{s}","{"" if d != d else f"{d:.9f}"}","{k}","{a}","{b}","{int(x)}"\n'
+                   for t, s, d, k, a, b, x in rows)
+
+
+def output_path(s_pcap, direction):
+    name = os.path.splitext(os.path.basename(s_pcap))[0]
+    name = re.sub(r'^s_', '', name)
+    return os.path.join(os.path.dirname(s_pcap), f'owd_{name}_{direction}.csv')
+
+
+def print_summary(out, counts):
+    print(f"{'dir':<4} {'packets':>8} {'lost':>6} {'loss %':>7} {'missing':>7} {'ambig':>5} "
+          f"{'min':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for d in DIRECTIONS:
+        c = counts[d]
+        delay = out[d]['owd'][~out[d]['lost']]
+        sent = c['matched'] + c['lost']
+        rate = 100.0 * c['lost'] / sent if sent else 0.0
+        stats = np.percentile(delay, (0, 50, 95, 99, 100)) if len(delay) else [np.nan] * 5
+        print(f"{d:<4} {sent:>8} {c['lost']:>6} {rate:>7.2f} {c['missing']:>7} {c['ambiguous']:>5} "
+              + ' '.join(f"{v:>8.4f}" for v in stats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='One-way delay and loss per direction from sender/receiver captures.')
+    parser.add_argument('s_pcap', help='Sender side capture (capture/s_<name>.pcap)')
+    parser.add_argument('r_pcap', nargs='?', help='Receiver side capture (default: r_<name>.pcap next to it)')
+    parser.add_argument('--horizon', type=float, default=HORIZON,
+                        help='Seconds a packet waits for its copy before it counts as lost (default: 10)')
+    args = parser.parse_args()
+
+    r_pcap = args.r_pcap or os.path.join(os.path.dirname(args.s_pcap),
+                                         re.sub(r'^s_', 'r_', os.path.basename(args.s_pcap)))
+    for path in (args.s_pcap, r_pcap):
+        if not os.path.exists(path):
+            print(f"Error: pcap file '{path}' not found.")
+            sys.exit(1)
+    try:
+        out, counts = one_way_delay(args.s_pcap, r_pcap, args.horizon)
+    except ValueError as e:
+        print(f"Error processing pcap files: {e}")
+        sys.exit(1)
+
+    print_summary(out, counts)
+    for d in DIRECTIONS:
+        path = output_path(args.s_pcap, d)
+        with open(path, 'w') as f:
+            write_csv(out[d], f)
+        print(f"Wrote {len(out[d]['owd'])} {d} packets to {path}")
+
+
+if __name__ == "__main__":
+    main()
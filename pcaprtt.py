@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+"""Extract TCP ACK RTT samples straight from a pcap file.
+
+Replacement for the tshark pre-analysis step in full-test.sh:
+
+    tshark -r X.pcap -T fields -e frame.time_relative -e tcp.seq \
+        -e tcp.analysis.ack_rtt -e tcp.stream -e ip.src -e tcp.srcport \
+        -e ip.dst -e tcp.dstport -Y "tcp.analysis.ack_rtt" ...
+
+The flow columns (tcp.stream and the ACK packet's addresses) let the
+loaders tell the iperf3 data connection from the control connection, see
+flows.py.
+
+The capture is memory-mapped and walked in chunks of records; header fields
+are gathered for a whole chunk at once with numpy fancy indexing, and the
+segment/ACK matching is done with sorted searches instead of a per-packet
+state machine. Only IPv4 over Ethernet / Linux cooked / raw IP is decoded,
+which is everything the testbed produces.
+"""
+import sys
+import os
+import mmap
+import struct
+from collections import deque
+import numpy as np
+
+# magic -> (byte order, timestamp fraction scale)
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = (12, 14, 101)
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_ACK = 0x10
+
+CSV_COLUMNS = ['frame.time_relative', 'tcp.seq', 'tcp.analysis.ack_rtt',
+               'tcp.stream', 'ip.src', 'tcp.srcport', 'ip.dst', 'tcp.dstport']
+
+# records handled per numpy pass, keeps the per-chunk index arrays small
+CHUNK_RECORDS = 1 << 18
+
+# offset used to keep per-direction sequence spaces apart in one sorted array
+_SEQ_SPAN = np.int64(1) << np.int64(48)
+
+
+def _u16(buf, idx):
+    return (buf[idx].astype(np.uint32) << 8) | buf[idx + 1]
+
+
+def _u32(buf, idx):
+    return ((buf[idx].astype(np.uint32) << 24) | (buf[idx + 1].astype(np.uint32) << 16)
+            | (buf[idx + 2].astype(np.uint32) << 8) | buf[idx + 3])
+
+
+def read_header(mm):
+    """Return (byte order, ts scale, link type) from the pcap global header."""
+    if len(mm) < 24 or bytes(mm[:4]) not in PCAP_MAGIC:
+        raise ValueError("not a pcap file (pcapng is not supported, use 'tcpdump -w')")
+    endian, scale = PCAP_MAGIC[bytes(mm[:4])]
+    linktype = struct.unpack_from(endian + 'I', mm, 20)[0] & 0x0FFFFFFF
+    return endian, scale, linktype
+
+
+def _walk_records(mm, pos, endian, max_records):
+    """Collect record header offsets; stops early on a truncated last record."""
+    incl_len = struct.Struct(endian + 'I').unpack_from
+    end = len(mm)
+    offsets = []
+    while len(offsets) < max_records and pos + 16 <= end:
+        nxt = pos + 16 + incl_len(mm, pos + 8)[0]
+        if nxt > end:
+            # tcpdump killed mid-write
+            break
+        offsets.append(pos)
+        pos = nxt
+    return np.asarray(offsets, dtype=np.int64), pos
+
+
+def _decode_chunk(buf, offsets, endian, scale, linktype):
+    """Decode IPv4/TCP headers for a chunk of records, fully vectorized."""
+    hdr = buf[offsets[:, None] + np.arange(16)].view(endian + 'u4').reshape(-1, 4)
+    time = hdr[:, 0].astype(np.float64) + hdr[:, 1] * scale
+    caplen = hdr[:, 2].astype(np.int64)
+    data = offsets + 16
+    last = len(buf) - 1
+
+    if linktype == LINKTYPE_ETHERNET:
+        ethertype = _u16(buf, np.minimum(data + 12, last - 1))
+        vlan = ethertype == 0x8100
+        ethertype = np.where(vlan, _u16(buf, np.minimum(data + 16, last - 1)), ethertype)
+        l3 = data + 14 + 4 * vlan
+        ok = (caplen >= 34) & (ethertype == 0x0800)
+    elif linktype == LINKTYPE_LINUX_SLL:
+        ok = (caplen >= 36) & (_u16(buf, np.minimum(data + 14, last - 1)) == 0x0800)
+        l3 = data + 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        ok = (caplen >= 40) & (_u16(buf, np.minimum(data, last - 1)) == 0x0800)
+        l3 = data + 20
+    elif linktype in LINKTYPE_RAW:
+        ok = caplen >= 20
+        l3 = data
+    else:
+        raise ValueError(f"unsupported link type {linktype}")
+
+    l3 = np.minimum(l3, last - 20)
+    vihl = buf[l3]
+    ihl = (vihl & 0x0F).astype(np.int64) * 4
+    ok &= ((vihl >> 4) == 4) & (ihl >= 20) & (buf[l3 + 9] == 6)
+    # only first fragments carry the TCP header
+    ok &= (_u16(buf, l3 + 6) & 0x1FFF) == 0
+    l4 = l3 + ihl
+    ok &= l4 + 20 <= data + caplen
+
+    idx = np.flatnonzero(ok)
+    l3, l4, ihl = l3[idx], l4[idx], ihl[idx]
+    doff = (buf[l4 + 12] >> 4).astype(np.int64) * 4
+    payload = _u16(buf, l3 + 2).astype(np.int64) - ihl - doff
+    # TCP timestamp value where Linux puts it (NOP, NOP, TS first), else 0
+    opt = np.minimum(l4 + 20, last - 7)
+    has_ts = ((doff >= 32) & (opt + 8 <= data[idx] + caplen[idx]) & (_u32(buf, opt) == 0x0101080A))
+    tsval = np.where(has_ts, _u32(buf, opt + 4), 0)
+    return {
+        'frame': idx,
+        'time': time[idx],
+        'ipid': _u16(buf, l3 + 4),
+        'src': _u32(buf, l3 + 12),
+        'dst': _u32(buf, l3 + 16),
+        'sport': _u16(buf, l4),
+        'dport': _u16(buf, l4 + 2),
+        'seq': _u32(buf, l4 + 4),
+        'ack': _u32(buf, l4 + 8),
+        'flags': buf[l4 + 13],
+        'window': _u16(buf, l4 + 14),
+        'tsval': tsval,
+        'payload': np.maximum(payload, 0),
+    }
+
+
+def iter_tcp_chunks(pcap_file, chunk_records=CHUNK_RECORDS):
+    """Yield dicts of per-packet TCP header arrays, one per chunk of records.
+
+    'time' is absolute (epoch seconds), 'frame' is the 0-based record number
+    in the file, so non-TCP frames still count like they do in tshark.
+    """
+    with open(pcap_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < 24:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = np.frombuffer(mm, dtype=np.uint8)
+        try:
+            endian, scale, linktype = read_header(mm)
+            pos, base = 24, 0
+            while True:
+                offsets, pos = _walk_records(mm, pos, endian, chunk_records)
+                if len(offsets) == 0:
+                    break
+                chunk = _decode_chunk(buf, offsets, endian, scale, linktype)
+                chunk['frame'] += base
+                base += len(offsets)
+                yield chunk
+        finally:
+            # the numpy view pins the mapping, drop it before closing
+            del buf
+            mm.close()
+
+
+def count_records(pcap_file):
+    """(records, seconds spanned, truncated) without decoding any packet.
+
+    Raises ValueError for files that aren't pcaps; a header-only or empty
+    file gives (0, 0.0, False).
+    """
+    with open(pcap_file, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return 0, 0.0, False
+        if size <= 24:
+            read_header(f.read(24))
+            return 0, 0.0, False
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            endian, scale, _ = read_header(mm)
+            stamp = struct.Struct(endian + 'II').unpack_from
+            count, pos, last = 0, 24, 24
+            while True:
+                offsets, pos = _walk_records(mm, pos, endian, CHUNK_RECORDS)
+                if len(offsets) == 0:
+                    break
+                count += len(offsets)
+                last = int(offsets[-1])
+            span = 0.0
+            if count:
+                first = stamp(mm, 24)
+                end = stamp(mm, last)
+                span = (end[0] - first[0]) + (end[1] - first[1]) * scale
+            return count, span, pos != len(mm)
+        finally:
+            mm.close()
+
+
+def read_tcp_packets(pcap_file, chunk_records=CHUNK_RECORDS):
+    """Read every TCP packet of a capture into one dict of arrays.
+
+    Also returns 'epoch', the timestamp of the first record in the file.
+    """
+    chunks = list(iter_tcp_chunks(pcap_file, chunk_records))
+    if not chunks:
+        return None
+    packets = {key: np.concatenate([c[key] for c in chunks]) for key in chunks[0]}
+    packets['epoch'] = first_timestamp(pcap_file)
+    return packets
+
+
+def first_timestamp(pcap_file):
+    with open(pcap_file, 'rb') as f:
+        head = f.read(40)
+    endian, scale, _ = read_header(head)
+    sec, frac = struct.unpack_from(endian + 'II', head, 24)
+    return sec + frac * scale
+
+
+def _group_starts(group):
+    """Boolean mask of the first element of each run in a sorted key array."""
+    starts = np.ones(len(group), dtype=bool)
+    starts[1:] = group[1:] != group[:-1]
+    return starts
+
+
+def _unwrap32(values, group):
+    """Unwrap 32-bit sequence numbers per group into monotone-ish int64.
+
+    Elements must already be ordered by (group, capture order).
+    """
+    v = values.astype(np.int64)
+    d = np.diff(v, prepend=v[:1])
+    d = (d + (1 << 31)) % (1 << 32) - (1 << 31)
+    starts = _group_starts(group)
+    d[starts] = 0
+    cs = np.cumsum(d)
+    first = np.flatnonzero(starts)
+    which = np.cumsum(starts) - 1
+    return v[first][which] + cs - cs[first][which]
+
+
+def assign_streams(packets):
+    """Number TCP conversations like tcp.stream and tag each packet's direction.
+
+    Returns (stream, direction): stream is 0-based in order of first
+    appearance, direction is 0 for the side that sent the first packet.
+    """
+    a = (packets['src'].astype(np.uint64) << np.uint64(16)) | packets['sport']
+    b = (packets['dst'].astype(np.uint64) << np.uint64(16)) | packets['dport']
+    ends = np.stack([np.minimum(a, b), np.maximum(a, b)], axis=1)
+    _, first, inverse = np.unique(ends, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first, kind='stable')] = np.arange(len(first))
+    stream = rank[inverse]
+    # direction relative to whoever spoke first in the conversation
+    opener = a[first][inverse]
+    direction = (a != opener).astype(np.int64)
+    return stream, direction
+
+
+def match_ack_rtt(packets):
+    """Match data segments to the ACKs that cover them, like tcp.analysis.ack_rtt.
+
+    An ACK gets a sample when it is the first ACK in the reverse direction
+    that covers a still-outstanding segment and it acknowledges exactly that
+    segment's end. Returns (ack packet indices, rtt seconds, relative seq of
+    the ACK packet, stream, direction).
+    """
+    n = len(packets['time'])
+    stream, direction = assign_streams(packets)
+    key = stream * 2 + direction
+    order = np.lexsort((np.arange(n), key))
+    skey = key[order]
+
+    # relative sequence numbers, based on the first packet of each direction
+    seq_abs = np.empty(n, dtype=np.int64)
+    seq_abs[order] = _unwrap32(packets['seq'][order], skey)
+    starts = np.flatnonzero(_group_starts(skey))
+    isn = np.zeros(key.max() + 2, dtype=np.int64)
+    isn_raw = np.zeros(key.max() + 2, dtype=np.int64)
+    have_isn = np.zeros(key.max() + 2, dtype=bool)
+    isn[skey[starts]] = seq_abs[order[starts]]
+    isn_raw[skey[starts]] = packets['seq'][order[starts]]
+    have_isn[skey[starts]] = True
+    rel_seq = seq_abs - isn[key]
+
+    flags = packets['flags']
+    syn = (flags & TCP_SYN) != 0
+    fin = (flags & TCP_FIN) != 0
+    nextseq = rel_seq + packets['payload'] + syn + fin
+    is_seg = (packets['payload'] > 0) | syn | fin
+
+    # ACK numbers, unwrapped per direction and expressed in the peer's seq space
+    ack_idx = np.flatnonzero(((flags & TCP_ACK) != 0) & have_isn[key ^ 1])
+    if len(ack_idx) == 0 or not is_seg.any():
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, np.zeros(0), empty, empty, empty
+    ack_key = key[ack_idx]
+    ack_order = np.lexsort((ack_idx, ack_key))
+    ack_idx, ack_key = ack_idx[ack_order], ack_key[ack_order]
+    ack_raw = packets['ack'][ack_idx]
+    ack_unwrapped = _unwrap32(ack_raw, ack_key)
+    first = np.flatnonzero(_group_starts(ack_key))
+    which = np.cumsum(_group_starts(ack_key)) - 1
+    peer = ack_key ^ 1
+    first_rel = (ack_raw[first].astype(np.int64) - isn_raw[peer[first]]) % (1 << 32)
+    ack_rel = first_rel[which] + ack_unwrapped - ack_unwrapped[first][which]
+
+    # per-direction running max of ACK, kept apart by a per-group offset so a
+    # single searchsorted works across all directions at once
+    offset = (ack_key.astype(np.int64) + 1) * _SEQ_SPAN
+    covered = np.maximum.accumulate(ack_rel + offset)
+    pos_key = ack_key.astype(np.int64) * (n + 1) + ack_idx
+
+    seg = np.flatnonzero(is_seg)
+    peer_key = (key[seg] ^ 1).astype(np.int64)
+    target = nextseq[seg] + (peer_key + 1) * _SEQ_SPAN
+    # first reverse-direction ACK sent after the segment ...
+    after = np.searchsorted(pos_key, peer_key * (n + 1) + seg, side='right')
+    # ... and first one covering it
+    cover = np.searchsorted(covered, target, side='left')
+    j = np.maximum(after, cover)
+    in_group = j < len(ack_idx)
+    j_safe = np.minimum(j, len(ack_idx) - 1)
+    in_group &= ack_key[j_safe] == peer_key
+    # segment must still be outstanding when it was sent
+    prev = np.maximum(after - 1, 0)
+    outstanding = (after == 0) | (ack_key[prev] != peer_key) | (covered[prev] < target)
+    exact = ack_rel[j_safe] + offset[j_safe] == target
+    hit = in_group & outstanding & exact
+
+    seg, j = seg[hit], j_safe[hit]
+    # several segments ending at the same ACK point: keep the oldest one
+    j_unique, first_seg = np.unique(j, return_index=True)
+    acked_by = ack_idx[j_unique]
+    rtt = packets['time'][acked_by] - packets['time'][seg[first_seg]]
+    # back to capture order
+    order = np.argsort(acked_by, kind='stable')
+    acked_by, rtt = acked_by[order], rtt[order]
+    return acked_by, rtt, rel_seq[acked_by], stream[acked_by], direction[acked_by]
+
+
+def decode_buffer(data, pos, header):
+    """Decode the complete records in data[pos:] (bytes-like, e.g. newly read).
+
+    header is the (byte order, ts scale, link type) tuple of the file.
+    Returns (chunk dict or None, offset of the first unconsumed byte).
+    """
+    endian, scale, linktype = header
+    offsets, end = _walk_records(data, pos, endian, len(data))
+    if len(offsets) == 0:
+        return None, pos
+    chunk = _decode_chunk(np.frombuffer(data, dtype=np.uint8), offsets, endian, scale, linktype)
+    return chunk, end
+
+
+
+class AckRttTracker:
+    """Incremental counterpart of match_ack_rtt for packets arriving in order.
+
+    Keeps, per direction, the outstanding segments that extend the highest
+    sequence sent so far; an ACK pops everything it covers and yields a
+    sample when it ends exactly on one of them. Work per packet is O(1)
+    amortized, so it can follow a capture that is still being written.
+    """
+
+    def __init__(self):
+        self.dirs = {}
+
+    def _state(self, src, sport, dst, dport):
+        key = (src, sport, dst, dport)
+        state = self.dirs.get(key)
+        if state is None:
+            state = self.dirs[key] = {'isn': None, 'last_raw': 0, 'last': 0, 'high': -1,
+                                      'ack_raw': None, 'ack': 0, 'acked': -1,
+                                      'outstanding': deque()}
+        return state
+
+    @staticmethod
+    def _advance(last_raw, last, raw):
+        return last + ((raw - last_raw + (1 << 31)) % (1 << 32) - (1 << 31))
+
+    def add(self, t, src, sport, dst, dport, seq, ack, flags, payload):
+        """Feed one packet; returns (relative seq, rtt) or None."""
+        me = self._state(src, sport, dst, dport)
+        peer = self.dirs.get((dst, dport, src, sport))
+
+        if me['isn'] is None:
+            me['isn'] = me['last_raw'] = seq
+        me['last'] = self._advance(me['last_raw'], me['last'], seq)
+        me['last_raw'] = seq
+        rel_seq = me['last']
+
+        nextseq = rel_seq + payload + ((flags & TCP_SYN) != 0) + ((flags & TCP_FIN) != 0)
+        covered = peer['acked'] if peer is not None else -1
+        if nextseq > rel_seq and nextseq > me['high'] and nextseq > covered:
+            me['outstanding'].append((nextseq, t))
+            me['high'] = nextseq
+
+        if not flags & TCP_ACK or peer is None or peer['isn'] is None:
+            return None
+        if me['ack_raw'] is None:
+            me['ack'] = (ack - peer['isn']) % (1 << 32)
+        else:
+            me['ack'] = self._advance(me['ack_raw'], me['ack'], ack)
+        me['ack_raw'] = ack
+        acked = me['ack']
+        sample = None
+        pending = peer['outstanding']
+        while pending and pending[0][0] <= acked:
+            end, sent = pending.popleft()
+            if end == acked:
+                sample = (rel_seq, t - sent)
+        me['acked'] = max(me['acked'], acked)
+        return sample
+
+    def feed(self, chunk):
+        """Feed a decoded chunk; returns (row indices, rel seqs, rtts) lists."""
+        rows, seqs, rtts = [], [], []
+        fields = zip(chunk['time'].tolist(), chunk['src'].tolist(), chunk['sport'].tolist(),
+                     chunk['dst'].tolist(), chunk['dport'].tolist(), chunk['seq'].tolist(),
+                     chunk['ack'].tolist(), chunk['flags'].tolist(), chunk['payload'].tolist())
+        for i, packet in enumerate(fields):
+            sample = self.add(*packet)
+            if sample is not None:
+                rows.append(i)
+                seqs.append(sample[0])
+                rtts.append(sample[1])
+        return rows, seqs, rtts
+
+
+def extract_rtt(pcap_file):
+    """Return the tshark ack_rtt columns for a pcap as a dict of numpy arrays.
+
+    Keys match the CSV header written by full-test.sh, so the result can be
+    handed to pd.DataFrame() in place of pd.read_csv() on rtt_*.csv. The
+    flow columns describe the ACK packet that carried each sample; ip.src
+    and ip.dst are IPv4 addresses as integers.
+    """
+    packets = read_tcp_packets(pcap_file)
+    if packets is None or len(packets['time']) == 0:
+        return {col: np.zeros(0) for col in CSV_COLUMNS}
+    acked_by, rtt, seq, stream, _ = match_ack_rtt(packets)
+    return {
+        'frame.time_relative': packets['time'][acked_by] - packets['epoch'],
+        'tcp.seq': seq,
+        'tcp.analysis.ack_rtt': rtt,
+        'tcp.stream': stream,
+        'ip.src': packets['src'][acked_by],
+        'tcp.srcport': packets['sport'][acked_by],
+        'ip.dst': packets['dst'][acked_by],
+        'tcp.dstport': packets['dport'][acked_by],
+    }
+
+
+def format_ip(addresses):
+    """Dotted-quad strings for an array of IPv4 addresses held as integers."""
+    a = np.asarray(addresses, dtype=np.uint32)
+    return [f'{x >> 24}.{(x >> 16) & 255}.{(x >> 8) & 255}.{x & 255}' for x in a.tolist()]
+
+
+def write_csv(columns, out):
+    """Write RTT columns in the same quoted format tshark uses."""
+    out.write(','.join(CSV_COLUMNS) + '\n')
+    rows = zip(columns['frame.time_relative'].tolist(),
+               columns['tcp.seq'].tolist(),
+               columns['tcp.analysis.ack_rtt'].tolist(),
+               columns['tcp.stream'].tolist(),
+               format_ip(columns['ip.src']),
+               columns['tcp.srcport'].tolist(),
+               format_ip(columns['ip.dst']),
+               columns['tcp.dstport'].tolist())
+    out.writelines(f'"{t:.9f}","{s}","{r:.9f}","{k}","{a}","{ap}","{b}","{bp}"\n'
+                   for t, s, r, k, a, ap, b, bp in rows)
+
+
+def main():
+    if len(sys.argv) < 2 or len(sys.argv) > 3:
+        print(f"Usage: {sys.argv[0]} <pcap_file> [rtt_csv_file]")
+        sys.exit(1)
+
+    pcap_file = sys.argv[1]
+    if not os.path.exists(pcap_file):
+        print(f"Error: pcap file '{pcap_file}' not found.")
+        sys.exit(1)
+
+    try:
+        columns = extract_rtt(pcap_file)
+    except ValueError as e:
+        print(f"Error processing pcap file: {e}")
+        sys.exit(1)
+
+    if len(sys.argv) == 3:
+        with open(sys.argv[2], 'w') as f:
+            write_csv(columns, f)
+        print(f"Wrote {len(columns['tcp.analysis.ack_rtt'])} RTT samples to {sys.argv[2]}")
+    else:
+        write_csv(columns, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""Per-phase statistics driven by the run manifest written by full-test.sh.
+
+full-test.sh writes run_<ts>.json next to the capture:
+
+    {"time": "<ts>", "qdisc": "fq_codel",
+     "phases": [{"start": 0.0, "bw": "500Mbps", "rtt": "50ms"},
+                {"start": 5.02, "bw": "2kbps", "rtt": "50ms"}, ...],
+     "end": 20.3}
+
+with start/end in seconds since the capture started, measured when each
+tune actually finished (orchestrate.py also records each phase's
+'planned' and 'issued' times). Runs recorded before manifests existed fall back to
+DEFAULT_SCHEDULE, the schedule currently in full-test.sh.
+
+    python phases.py rtt_<ts>.csv [iperf3_<ts>.json]   # per-phase table + json
+"""
+import os
+import re
+import sys
+import json
+import numpy as np
+
+TIMESTAMP = re.compile(r'(\d{8}[-_]\d{6})')
+
+DEFAULT_SCHEDULE = {
+    'qdisc': None,
+    'phases': [{'start': 0.0, 'bw': '500Mbps', 'rtt': '50ms'},
+               {'start': 5.0, 'bw': '2kbps', 'rtt': '50ms'},
+               {'start': 10.0, 'bw': '2Mbps', 'rtt': '50ms'},
+               {'start': 15.0, 'bw': '500kbps', 'rtt': '50ms'}],
+    'end': 20.0,
+}
+
+PERCENTILES = (50, 95, 99)
+
+
+def manifest_path(data_file):
+    """run_<ts>.json next to an rtt_<ts>.csv / iperf3_<ts>.json / <ts>.pcap."""
+    match = TIMESTAMP.search(os.path.basename(data_file))
+    if not match:
+        return None
+    return os.path.join(os.path.dirname(data_file), f"run_{match.group(1)}.json")
+
+
+def load_manifest(data_file=None, manifest_file=None):
+    """Load the run manifest for data_file; falls back to DEFAULT_SCHEDULE.
+
+    The returned dict always has 'phases', 'end' and 'source' (the manifest
+    path, or None for the default schedule).
+    """
+    path = manifest_file or (manifest_path(data_file) if data_file else None)
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                manifest = json.load(f)
+            manifest['phases'] = sorted(manifest['phases'], key=lambda p: p['start'])
+            manifest.setdefault('end', None)
+            manifest['source'] = path
+            return manifest
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: could not read manifest {path}: {e}, using default schedule")
+    manifest = json.loads(json.dumps(DEFAULT_SCHEDULE))
+    manifest['source'] = None
+    return manifest
+
+
+def boundaries(manifest):
+    """Phase start times after the first one, as used by searchsorted."""
+    return np.array([p['start'] for p in manifest['phases'][1:]], dtype=np.float64)
+
+
+def markers(manifest):
+    """(x, label) pairs for the vertical lines on the plots."""
+    phases = manifest['phases']
+    out = [(cur['start'], f"{prev['bw']}→{cur['bw']}") for prev, cur in zip(phases, phases[1:])]
+    if manifest.get('end') is not None:
+        out.append((manifest['end'], 'End of test'))
+    return out
+
+
+def assign(times, manifest):
+    """Phase index of each timestamp (vectorized)."""
+    return np.searchsorted(boundaries(manifest), np.asarray(times, dtype=np.float64), side='right')
+
+
+def phase_stats(times, values, manifest, pcts=PERCENTILES):
+    """Per-phase count/mean/std/min/max/percentiles without per-phase copies.
+
+    Samples before the first phase or after the manifest 'end' are dropped.
+    Everything comes from bincount plus one lexsort by (phase, value): the
+    first/last element of each group are min/max, percentiles are read
+    (linearly interpolated) at offsets into the group. Returns a dict of
+    arrays with one entry per phase.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    n_phases = len(manifest['phases'])
+    keep = times >= manifest['phases'][0]['start']
+    if manifest.get('end') is not None:
+        keep &= times <= manifest['end']
+    times, values = times[keep], values[keep]
+    return group_stats(assign(times, manifest), values, n_phases, pcts)
+
+
+def group_stats(group, values, n_groups, pcts=PERCENTILES):
+    """phase_stats() for any grouping: group is the 0-based group of each value."""
+    count = np.bincount(group, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(group, weights=values, minlength=n_groups) / count
+        sq = np.bincount(group, weights=(values - mean[group]) ** 2, minlength=n_groups)
+        std = np.where(count > 1, np.sqrt(sq / (count - 1)), np.nan)
+    stats = {'count': count, 'mean': mean, 'std': std}
+
+    if len(values) == 0:
+        for key in ['min', 'max'] + [f'p{pct}' for pct in pcts]:
+            stats[key] = np.full(n_groups, np.nan)
+        return stats
+
+    ordered = values[np.lexsort((values, group))]
+    first = np.cumsum(count) - count
+    span = np.maximum(count - 1, 0)
+    last = np.minimum(first + span, len(values) - 1)
+    first = np.minimum(first, len(values) - 1)
+    stats['min'] = np.where(count > 0, ordered[first], np.nan)
+    stats['max'] = np.where(count > 0, ordered[last], np.nan)
+    for pct in pcts:
+        pos = first + span * (pct / 100.0)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, last)
+        frac = pos - lo
+        stats[f'p{pct}'] = np.where(count > 0, ordered[lo] * (1 - frac) + ordered[hi] * frac, np.nan)
+    return stats
+
+
+def summarize(rtt_times, rtt_values, manifest, iperf_data=None):
+    """Per-phase RTT and throughput.
+
+    Returns a list of plain dicts, ready for json.dump or a table. Queuing
+    delay comes from queuing.phase_rows(), write_summary() stores it apart.
+    """
+    rtt = phase_stats(rtt_times, rtt_values, manifest)
+    tput = None
+    if iperf_data and len(iperf_data['times']) > 0:
+        tput = phase_stats(iperf_data['times'], iperf_data['throughput'], manifest, pcts=())
+    phases = manifest['phases']
+    ends = [p['start'] for p in phases[1:]] + [manifest.get('end')]
+    rows = []
+    for i, (phase, end) in enumerate(zip(phases, ends)):
+        row = {'phase': i, 'start': phase['start'], 'end': end, 'bw': phase.get('bw'),
+               'netem_rtt': phase.get('rtt'), 'samples': int(rtt['count'][i])}
+        for key in ('mean', 'std', 'min', 'max') + tuple(f'p{p}' for p in PERCENTILES):
+            row[f'rtt_{key}'] = num(rtt[key][i])
+        if tput is not None:
+            row['tput_mean_mbps'] = num(tput['mean'][i])
+        rows.append(row)
+    return rows
+
+
+def num(x):
+    """x as a float for json and the tables, None for NaN (or None)."""
+    return None if x is None or np.isnan(x) else float(x)
+
+
+def cell(value, width, digits):
+    """value right-aligned in width with digits decimals, '-' for None."""
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}.{digits}f}"
+
+
+def print_table(rows):
+    print(f"{'phase':<16} {'start':>6} {'n':>7} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} "
+          f"{'std':>8} {'Mbps':>7}")
+    for row in rows:
+        label = f"{row['bw']} {row['netem_rtt'] or ''}".strip()
+        print(f"{label:<16} {row['start']:>6.1f} {row['samples']:>7} "
+              f"{cell(row['rtt_mean'], 8, 4)} {cell(row['rtt_p50'], 8, 4)} "
+              f"{cell(row['rtt_p95'], 8, 4)} {cell(row['rtt_p99'], 8, 4)} "
+              f"{cell(row['rtt_std'], 8, 4)} "
+              f"{cell(row.get('tput_mean_mbps'), 7, 2)}")
+
+
+def write_summary(rows, manifest, output_file, load=None, queuing=None):
+    """Write the per-phase rows (plus the align.py load report and the
+    queuing.py per-phase rows, if any) as json."""
+    summary = {'qdisc': manifest.get('qdisc'), 'manifest': manifest.get('source'), 'phases': rows}
+    if load is not None:
+        summary['load'] = load
+    if queuing is not None:
+        summary['queuing'] = queuing
+    with open(output_file, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"Phase summary saved as {output_file}")
+
+
+def main():
+    if len(sys.argv) < 2 or len(sys.argv) > 3:
+        print(f"Usage: {sys.argv[0]} <rtt_csv_file> [iperf3_json_file]")
+        sys.exit(1)
+    import loaders
+
+    rtt_file = sys.argv[1]
+    columns = loaders.load_rtt(rtt_file)
+    iperf_data = loaders.load_iperf(sys.argv[2]) if len(sys.argv) == 3 else None
+    manifest = load_manifest(rtt_file)
+    if manifest['source'] is None:
+        print("No run manifest found, using the default full-test.sh schedule")
+    rows = summarize(columns['frame.time_relative'], columns['tcp.analysis.ack_rtt'], manifest, iperf_data)
+    print_table(rows)
+    prefix = os.path.splitext(rtt_file)[0]
+    write_summary(rows, manifest, f"{prefix}_phases.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Per-stage timing for the CLI tools (--profile on analyse.py, multi.py, rtt.py).
+
+Stages are marked where the work happens:
+
+    with profiling.stage('read csv') as s:
+        df = pd.read_csv(...)
+        s.rows = len(df)
+
+When profiling is off (the default) stage() hands back one shared no-op
+object, so a marked stage costs a function call and an attribute check.
+When on, each stage records wall time, CPU time, the process RSS and
+peak RSS at its end, and an optional row count. Stages nest; the
+breakdown is printed at exit, indented by depth, and --profile-trace
+also writes a Chrome trace (chrome://tracing, ui.perfetto.dev).
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import resource
+import threading
+
+_enabled = False
+_trace_file = None
+_records = []
+# nesting depth per thread, multi.py loads runs on a thread pool
+_local = threading.local()
+_origin = 0.0
+
+
+class _NoStage:
+    """Stand-in returned while profiling is off; rows set on it are dropped."""
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def _rss_mb():
+    # current resident set from /proc, falls back to the peak elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return _peak_mb()
+
+
+def _peak_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB on Linux
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+
+class _Stage:
+    __slots__ = ('name', 'rows', 'depth', 'start', 'cpu', 'thread')
+
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.depth = getattr(_local, 'depth', 0)
+        _local.depth = self.depth + 1
+        self.thread = threading.get_ident()
+        self.start = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        _local.depth = self.depth
+        # CPU time is per process, so it overlaps between threads
+        _records.append({'name': self.name, 'depth': self.depth, 'thread': self.thread,
+                         'start': self.start - _origin, 'wall': end - self.start,
+                         'cpu': time.process_time() - self.cpu,
+                         'rss_mb': _rss_mb(), 'peak_mb': _peak_mb(), 'rows': self.rows})
+        return False
+
+
+def stage(name, rows=None):
+    """Context manager timing one stage; set .rows on it for a row count."""
+    if not _enabled:
+        return _NO_STAGE
+    return _Stage(name, rows)
+
+
+def enabled():
+    return _enabled
+
+
+def enable(trace_file=None):
+    """Start recording; the breakdown (and trace file) is written at exit."""
+    global _enabled, _trace_file, _origin
+    if _enabled:
+        return
+    _enabled = True
+    _trace_file = trace_file
+    _origin = time.perf_counter()
+    atexit.register(report)
+
+
+def add_arguments(parser):
+    parser.add_argument('--profile', action='store_true',
+                        help='Print wall/CPU time, RSS and rows per stage at exit')
+    parser.add_argument('--profile-trace', metavar='FILE',
+                        help='Also write the stages as a Chrome trace JSON (implies --profile)')
+
+
+def from_args(args):
+    if args.profile or args.profile_trace:
+        enable(args.profile_trace)
+
+
+def report():
+    """Print the stage breakdown and write the trace file, if any."""
+    if not _records:
+        return
+    # records are appended on exit, put them back in start order for display
+    records = sorted(_records, key=lambda r: r['start'])
+    width = max(len('  ' * r['depth'] + r['name']) for r in records)
+    print(f"\n{'stage':<{width}} {'wall s':>8} {'cpu s':>8} {'rss MB':>8} {'peak MB':>8} {'rows':>10}")
+    for r in records:
+        rows = '' if r['rows'] is None else r['rows']
+        print(f"{'  ' * r['depth'] + r['name']:<{width}} {r['wall']:>8.3f} {r['cpu']:>8.3f} "
+              f"{r['rss_mb']:>8.1f} {r['peak_mb']:>8.1f} {rows:>10}")
+    print(f"{'total':<{width}} {time.perf_counter() - _origin:>8.3f}  peak RSS {_peak_mb():.1f} MB")
+    if _trace_file:
+        write_trace(records, _trace_file)
+
+
+def write_trace(records, trace_file):
+    events = [{'name': r['name'], 'ph': 'X', 'pid': os.getpid(), 'tid': r['thread'],
+               'ts': r['start'] * 1e6, 'dur': r['wall'] * 1e6,
+               'args': {'cpu_s': r['cpu'], 'rss_mb': r['rss_mb'], 'peak_mb': r['peak_mb'],
+                        'rows': r['rows']}} for r in records]
+    with open(trace_file, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    print(f"Profile trace saved as {trace_file}")
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""Multi-resolution min/max/mean/count pyramid of a run's RTT, for zooming.
+
+Level 0 puts the samples of one flow into BASE_STEP (0.1 ms) slots of
+capture time. Each level above merges FANOUT (4) neighbouring slots of the
+level below, and the top level has at most TOP non-empty slots. A level
+stores only its non-empty slots: slot number (time // step) plus
+count/min/max/mean. Levels that are not at least FANOUT times smaller than
+the run are left out, because the raw samples are as cheap to read there.
+So the pyramid is at most about the size of the run in the rttcache.
+
+It is written next to the source as <source>.rttpyramid, in the rttcache.py
+file format with the same size/mtime key, so a re-captured file is rebuilt.
+A view of [start, end] at `width` pixels picks the coarsest level whose
+slot is no wider than (end - start) / width: at least one slot per pixel.
+That takes two searchsorted calls and a slice of the memory-mapped level,
+so only the pages of the requested slots are read, whatever the capture
+length. When a window is too narrow even for the finest stored level, the
+raw samples of the window are read from the memory-mapped run cache and
+thinned with decimate.minmax.
+
+    python pyramid.py build [rtt_<ts>.csv|<ts>.pcap|directory ...]
+    python pyramid.py view rtt_<ts>.csv --window 5:6 [--width 2000] [-o zoom.png]
+
+Without -o the view is an interactive window that fetches the slots for
+the new range again after every zoom or pan. `batch.py --pyramid` builds
+one for every run it renders.
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import numpy as np
+
+import rttcache
+import loaders
+import flows
+
+SUFFIX = '.rttpyramid'
+# bump when the levels change so old pyramids are rebuilt
+PYRAMID_VERSION = 1
+BASE_STEP = 0.0001
+FANOUT = 4
+TOP = 64
+WIDTH = 2000
+
+
+def _version(flow):
+    return f"{PYRAMID_VERSION}:{loaders.PARSER_VERSION}:{flow}"
+
+
+def _merge(slot, count, lo, hi, total):
+    """Sum/min/max of runs of equal slot numbers (slot is sorted)."""
+    starts = np.flatnonzero(np.diff(slot, prepend=slot[0] - 1))
+    return (slot[starts], np.add.reduceat(count, starts), np.minimum.reduceat(lo, starts),
+            np.maximum.reduceat(hi, starts), np.add.reduceat(total, starts))
+
+
+def build(times, rtts):
+    """Pyramid columns for one run's (time, rtt) samples.
+
+    Returns a dict of arrays: 'range' (first and last sample time), 'steps'
+    (slot width of each stored level) and per level i 'L<i>.slot' (int64),
+    'L<i>.count' (int32), 'L<i>.min', 'L<i>.max', 'L<i>.mean' (float32).
+    """
+    times = np.asarray(times, dtype=np.float64)
+    rtts = np.asarray(rtts, dtype=np.float64)
+    n = len(times)
+    columns = {'range': np.array([times.min(), times.max()] if n else [], dtype=np.float64)}
+    levels = []
+    if n:
+        slot = np.floor(times / BASE_STEP).astype(np.int64)
+        if np.any(np.diff(slot) < 0):
+            order = np.argsort(slot, kind='stable')
+            slot, rtts = slot[order], rtts[order]
+        level = _merge(slot, np.ones(n, dtype=np.int64), rtts, rtts, rtts)
+        step = BASE_STEP
+        while True:
+            # levels about as big as the run itself add nothing over the raw samples
+            if len(level[0]) * FANOUT <= n:
+                levels.append((step, level))
+            if len(level[0]) <= TOP:
+                break
+            level = _merge(level[0] // FANOUT, *level[1:])
+            step *= FANOUT
+    columns['steps'] = np.array([step for step, _ in levels], dtype=np.float64)
+    for i, (_, (slot, count, lo, hi, total)) in enumerate(levels):
+        columns[f'L{i}.slot'] = slot
+        columns[f'L{i}.count'] = count.astype(np.int32)
+        columns[f'L{i}.min'] = lo.astype(np.float32)
+        columns[f'L{i}.max'] = hi.astype(np.float32)
+        columns[f'L{i}.mean'] = (total / count).astype(np.float32)
+    return columns
+
+
+def source_key(source, flow=flows.DOMINANT):
+    """The rttcache key of source for a pyramid of flow; take it before loading the run."""
+    return rttcache.source_key(source, _version(flow))
+
+
+def save(source, columns, flow=flows.DOMINANT, key=None):
+    """Write the pyramid next to source; key is the source_key() taken before loading it."""
+    key = key or source_key(source, flow)
+    return rttcache.write_cache(source, columns, key, SUFFIX)
+
+
+def load(source, flow=flows.DOMINANT):
+    """The memory-mapped pyramid of source for flow, or None if missing or stale."""
+    return rttcache.read_cache(source, _version(flow), mmap=True, suffix=SUFFIX)
+
+
+def build_for(source, flow=flows.DOMINANT, run=None, key=None):
+    """Build and save the pyramid of source.
+
+    run is the already loaded loaders.Run of flow, if any; it is only saved
+    with key, the source_key() taken before that run was loaded.
+    """
+    if run is None:
+        key = source_key(source, flow)
+        run = loaders.load_run(source, flow)
+    columns = build(run.time, run.rtt)
+    # don't keep a pyramid of a file that changed while it was read
+    if key is not None and source_key(source, flow) == key:
+        save(source, columns, flow, key)
+    return columns
+
+
+def open_pyramid(source, flow=flows.DOMINANT):
+    """load(), building the pyramid first when there is none (or it is stale)."""
+    pyramid = load(source, flow)
+    if pyramid is None:
+        print(f"Building pyramid for {source}")
+        build_for(source, flow)
+        pyramid = load(source, flow)
+        if pyramid is None:
+            # read-only directory: keep the one just built in memory
+            pyramid = build_for(source, flow)
+    return pyramid
+
+
+def fetch(pyramid, start, end, width=WIDTH):
+    """The slots of the coarsest level with at least width slots in [start, end].
+
+    Returns {'level', 'step', 'time' (slot centres), 'count', 'min', 'max',
+    'mean'}, or None when no stored level is fine enough (use fetch_raw()).
+    """
+    steps = pyramid['steps']
+    fine = np.flatnonzero(steps <= (end - start) / max(width, 1))
+    if not len(fine):
+        return None
+    level = int(fine[-1])
+    step = float(steps[level])
+    slots = pyramid[f'L{level}.slot']
+    lo = np.searchsorted(slots, np.floor(start / step), side='left')
+    hi = np.searchsorted(slots, np.floor(end / step), side='right')
+    view = {'level': level, 'step': step, 'time': (slots[lo:hi] + 0.5) * step}
+    for name in ('count', 'min', 'max', 'mean'):
+        view[name] = np.asarray(pyramid[f'L{level}.{name}'][lo:hi])
+    return view
+
+
+def fetch_raw(source, start, end, width=WIDTH, flow=flows.DOMINANT):
+    """(time, rtt) of the samples in [start, end], minmax-decimated to width."""
+    import decimate
+    run = loaders.load_run(source, flow, mmap=True)
+    keep = slice(np.searchsorted(run.time, start, side='left'),
+                 np.searchsorted(run.time, end, side='right'))
+    return decimate.minmax(run.time[keep], run.rtt[keep], width)
+
+
+def parse_window(spec):
+    """argparse type for --window: 'START:END' in seconds, either side may be empty."""
+    try:
+        start, end = spec.split(':')
+        start = float(start) if start else None
+        end = float(end) if end else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected START:END in seconds, got '{spec}'")
+    if start is not None and end is not None and end <= start:
+        raise argparse.ArgumentTypeError(f"window end must be after its start, got '{spec}'")
+    return start, end
+
+
+def query(source, pyramid, start, end, width, flow=flows.DOMINANT):
+    """fetch(), falling back to fetch_raw(); prints what was read and how long it took."""
+    began = time.perf_counter()
+    view = fetch(pyramid, start, end, width)
+    if view is None:
+        x, y = fetch_raw(source, start, end, width, flow)
+        what = f"{len(x)} raw samples"
+    else:
+        what = f"{len(view['time'])} slots of level {view['level']} ({view['step'] * 1e3:g} ms)"
+    print(f"[{start:g}, {end:g}]s: {what} in {(time.perf_counter() - began) * 1e3:.1f} ms")
+    if view is None:
+        return {'level': None, 'time': x, 'min': y, 'max': y, 'mean': y}
+    return view
+
+
+def plot_view(source, pyramid, start, end, width=WIDTH, flow=flows.DOMINANT, output=None):
+    """Plot [start, end] from the pyramid; interactive (re-fetched on zoom) without output."""
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+    ax.set_xlabel('Time (seconds)', fontsize=12)
+    ax.set_ylabel('Round Trip Time (ms)', fontsize=12)
+    ax.set_title(f"TCP RTT - {os.path.basename(source)} [{start:g}, {end:g}]s", fontsize=14)
+    ax.grid(True, alpha=0.3)
+    drawn = []
+
+    def draw(lo, hi):
+        for artist in drawn:
+            artist.remove()
+        drawn.clear()
+        view = query(source, pyramid, lo, hi, width, flow)
+        if view['level'] is not None:
+            drawn.append(ax.fill_between(view['time'], view['min'], view['max'], step='mid',
+                                         color='b', alpha=0.25, linewidth=0, label='min-max'))
+        drawn.extend(ax.plot(view['time'], view['mean'], 'b-', linewidth=0.8,
+                             label='RTT' if view['level'] is None else 'mean'))
+        ax.legend(loc='upper right')
+
+    draw(start, end)
+    ax.set_xlim(start, end)
+    if output:
+        plt.tight_layout()
+        plt.savefig(output, dpi=300)
+        plt.close(fig)
+        print(f"Plot saved as {output}")
+        return
+
+    def on_xlim(axes):
+        lo, hi = axes.get_xlim()
+        draw(lo, hi)
+        axes.set_title(f"TCP RTT - {os.path.basename(source)} [{lo:g}, {hi:g}]s", fontsize=14)
+
+    ax.callbacks.connect('xlim_changed', on_xlim)
+    plt.show()
+
+
+def _sources(paths):
+    """rtt_*.csv and *.pcap files in paths (directories are searched)."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found += sorted(glob.glob(os.path.join(path, 'rtt_*.csv')) + glob.glob(os.path.join(path, '*.pcap')))
+        else:
+            found.append(path)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and view multi-resolution RTT pyramids for fast zooming.')
+    parser.add_argument('command', choices=('build', 'view'))
+    parser.add_argument('paths', nargs='*', default=['.'],
+                        help='build: RTT CSVs, pcaps or directories (default: .); view: one RTT CSV or pcap')
+    parser.add_argument('--window', type=parse_window, default=(None, None),
+                        help='view: time range START:END in seconds, e.g. 5:6 or 14: (default: whole run)')
+    parser.add_argument('--width', type=int, default=WIDTH, help='view: pixels across the window (default: 2000)')
+    parser.add_argument('-o', '--output', help='view: save the plot here instead of opening a window')
+    parser.add_argument('--no-plot', action='store_true', help='view: only fetch and print what was read')
+    flows.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        sources = _sources(args.paths)
+        if not sources:
+            print(f"No rtt_<timestamp>.csv or .pcap files in {' '.join(args.paths)}")
+            sys.exit(1)
+        for source in sources:
+            if not os.path.exists(source):
+                print(f"Error: '{source}' not found.")
+                continue
+            try:
+                columns = build_for(source, args.flow)
+            except Exception as e:
+                print(f"Error building pyramid for {source}: {e}")
+                continue
+            levels = len(columns['steps'])
+            size = sum(values.nbytes for values in columns.values())
+            print(f"{source}: {levels} levels, {size / 1024:.0f} KiB")
+        return
+
+    if len(args.paths) != 1 or not os.path.isfile(args.paths[0]):
+        print("Error: view takes one existing RTT CSV or pcap")
+        sys.exit(1)
+    source = args.paths[0]
+    pyramid = open_pyramid(source, args.flow)
+    first, last = pyramid['range'] if len(pyramid['range']) else (0.0, 0.0)
+    start = first if args.window[0] is None else args.window[0]
+    end = last if args.window[1] is None else args.window[1]
+    if end <= start:
+        print(f"Error: empty window [{start:g}, {end:g}], the run spans [{first:g}, {last:g}]s")
+        sys.exit(1)
+    if args.no_plot:
+        query(source, pyramid, start, end, args.width, args.flow)
+        return
+    plot_view(source, pyramid, start, end, args.width, args.flow, args.output)
+
+
+if __name__ == "__main__":
+    main()
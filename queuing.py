@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Queuing delay above a sliding-window minimum RTT.
+
+The base RTT of the path is the lowest RTT seen in the last `window` seconds
+(WINDOW, like the min_rtt filter of BBR), so it follows the netem delay when
+tune changes it. Queuing delay is each sample minus that base.
+
+The minimum is kept in a monotonic deque of (time, rtt): a new sample
+first drops every entry at the back that is not below it, and entries that
+left the window are dropped from the front. The front is then the window
+minimum. Each sample is pushed and popped at most once, O(n) for a run and
+O(1) amortized per sample. The filter only looks back, so the same code
+runs over a whole run here and on the tailing feed in live.py.
+
+Over a whole run the filter also restarts at every phase start of the run
+manifest. Without that, after a tune raises the delay, the old lower base
+would stay for a full window and count as queuing.
+
+Per phase the queuing delay gets count/mean and exact p50/p95/p99 (one
+sort, phases.group_stats); live.py keeps P-square estimates of the same
+percentiles. Run it on one flow (the default, see flows.py): with
+`--flow all`, stray acks on the iperf3 control connection pull the base
+down to microseconds (as they do in older csvs without flow columns).
+
+    python queuing.py rtt_<ts>.csv [--window 10] [-o queue_<ts>.csv]
+"""
+import os
+import sys
+import argparse
+from collections import deque
+import numpy as np
+
+import phases
+from phases import num, cell
+
+WINDOW = 10.0
+PERCENTILES = (50, 95, 99)
+
+
+class MinFilter:
+    """Minimum over the last `window` seconds, monotonic deque, O(1) amortized per sample."""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        # (time, rtt) with rtt strictly increasing from the front
+        self.entries = deque()
+
+    def reset(self):
+        self.entries.clear()
+
+    def add(self, t, rtt):
+        """Add a sample and return the minimum over (t - window, t]."""
+        entries = self.entries
+        while entries and entries[-1][1] >= rtt:
+            entries.pop()
+        entries.append((t, rtt))
+        cutoff = t - self.window
+        # the sample just added is always inside the window
+        while entries[0][0] <= cutoff:
+            entries.popleft()
+        return entries[0][1]
+
+
+def queuing_delay(times, rtts, window=WINDOW, resets=()):
+    """Per-sample (base RTT, queuing delay) float32 arrays for a whole run.
+
+    The filter restarts at each time in resets (normally
+    phases.boundaries(manifest)). Rows that are not in time order are
+    filtered in time order and returned in their original order.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    rtts = np.asarray(rtts, dtype=np.float64)
+    order = None
+    if len(times) > 1 and np.any(np.diff(times) < 0):
+        order = np.argsort(times, kind='stable')
+        times, rtts = times[order], rtts[order]
+
+    cuts = np.searchsorted(times, np.sort(np.asarray(resets, dtype=np.float64)), side='left')
+    filt = MinFilter(window)
+    base = []
+    start = 0
+    for stop in cuts.tolist() + [len(times)]:
+        filt.reset()
+        base.extend(map(filt.add, times[start:stop].tolist(), rtts[start:stop].tolist()))
+        start = stop
+    base = np.array(base, dtype=np.float64)
+    queue = rtts - base
+
+    if order is not None:
+        unsorted = np.empty_like(base)
+        unsorted[order] = base
+        base = unsorted
+        unsorted = np.empty_like(queue)
+        unsorted[order] = queue
+        queue = unsorted
+    return base.astype(np.float32), queue.astype(np.float32)
+
+
+def for_run(times, rtts, manifest=None, window=WINDOW):
+    """queuing_delay() restarted at the phase starts of manifest (if any)."""
+    resets = phases.boundaries(manifest) if manifest else ()
+    return queuing_delay(times, rtts, window, resets)
+
+
+def summary(queue, pcts=PERCENTILES):
+    """Overall count/mean/percentiles of the queuing delay, as a plain dict."""
+    queue = np.asarray(queue, dtype=np.float64)
+    row = {'samples': len(queue), 'mean': num(queue.mean()) if len(queue) else None}
+    values = np.percentile(queue, pcts) if len(queue) else [np.nan] * len(pcts)
+    for pct, value in zip(pcts, values):
+        row[f'p{pct}'] = num(value)
+    return row
+
+
+def phase_rows(times, base, queue, manifest, window=WINDOW):
+    """Per-phase base RTT and queuing delay, one plain dict per phase."""
+    delay = phases.phase_stats(times, queue, manifest, PERCENTILES)
+    floor = phases.phase_stats(times, base, manifest, pcts=(50,))
+    rows = []
+    for i, phase in enumerate(manifest['phases']):
+        row = {'phase': i, 'start': phase['start'], 'bw': phase.get('bw'), 'netem_rtt': phase.get('rtt'),
+               'window': window, 'samples': int(delay['count'][i]),
+               'base_rtt_min': num(floor['min'][i]), 'base_rtt_p50': num(floor['p50'][i]),
+               'queue_mean': num(delay['mean'][i])}
+        for pct in PERCENTILES:
+            row[f'queue_p{pct}'] = num(delay[f'p{pct}'][i])
+        rows.append(row)
+    return rows
+
+
+def print_table(rows):
+    window = rows[0]['window'] if rows else WINDOW
+    print(f"Queuing delay over the {window:g}s minimum RTT:")
+    print(f"{'phase':<16} {'n':>7} {'base':>8} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for row in rows:
+        label = f"{row['bw']} {row['netem_rtt'] or ''}".strip()
+        print(f"{label:<16} {row['samples']:>7} {cell(row['base_rtt_p50'], 8, 4)} "
+              f"{cell(row['queue_mean'], 8, 4)} {cell(row['queue_p50'], 8, 4)} "
+              f"{cell(row['queue_p95'], 8, 4)} {cell(row['queue_p99'], 8, 4)}")
+
+
+def plot_layer(ax, times, base, queue, window=WINDOW, decimation='minmax', dpi=300):
+    """Draw the windowed base RTT and the queuing delay on the RTT axis ax."""
+    import decimate
+    x, y = decimate.decimate_for_axes(ax, times, base, decimation, dpi, label='Base RTT')
+    ax.plot(x, y, '-', color='black', linewidth=1.0, alpha=0.8, label=f'Base RTT ({window:g}s min)')
+    x, y = decimate.decimate_for_axes(ax, times, queue, decimation, dpi, label='Queuing delay')
+    ax.plot(x, y, '-', color='darkorange', linewidth=0.8, alpha=0.7, label='Queuing delay')
+
+
+def write_csv(output_file, times, base, queue):
+    with open(output_file, 'w') as f:
+        f.write('frame.time_relative,base_rtt,queuing_delay\n')
+        np.savetxt(f, np.column_stack([times, base, queue]), fmt='%.9g', delimiter=',')
+    print(f"Queuing delay saved as {output_file}")
+
+
+def main():
+    import loaders
+    import flows
+
+    parser = argparse.ArgumentParser(description='Per-sample and per-phase queuing delay over a sliding-window minimum RTT.')
+    parser.add_argument('rtt_csv_file', help='RTT CSV from tshark/pcaprtt.py, or a .pcap')
+    parser.add_argument('--window', type=float, default=WINDOW,
+                        help='Seconds of history for the base RTT minimum (default: 10)')
+    parser.add_argument('--manifest', help='Run manifest with the tune schedule (default: run_<ts>.json next to the CSV)')
+    parser.add_argument('-o', '--output', help='Per-sample csv (default: queue_<name>.csv)')
+    flows.add_arguments(parser)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.rtt_csv_file):
+        print(f"Error: RTT file '{args.rtt_csv_file}' not found.")
+        sys.exit(1)
+    if args.window <= 0:
+        print("Error: --window must be positive")
+        sys.exit(1)
+    run = loaders.load_run(args.rtt_csv_file, args.flow, show_flows=args.flows)
+    manifest = phases.load_manifest(args.rtt_csv_file, args.manifest)
+    if manifest['source'] is None:
+        print("No run manifest found, using the default full-test.sh schedule")
+    base, queue = for_run(run.time, run.rtt, manifest, args.window)
+    print_table(phase_rows(run.time, base, queue, manifest, args.window))
+    name = os.path.splitext(os.path.basename(args.rtt_csv_file))[0]
+    if name.startswith('rtt_'):
+        name = name[len('rtt_'):]
+    write_csv(args.output or f"queue_{name}.csv", run.time, base, queue)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""On-disk columnar cache for cleaned RTT samples.
+
+Parsing rtt_*.csv (quoted tshark output) or extracting from a .pcap is the
+slow part of every plot run. The cleaned float columns (see loaders.py) are
+stored next to the source as <source>.rttcache:
+
+    RTTCACHE\\n  <8 byte header length>  <json header>  <raw column bytes>
+
+The header records the source path, size and mtime_ns; a cache entry is only
+used when all three still match, so an edited or re-captured file is always
+re-parsed. Columns start on 64 byte boundaries, so they can be
+memory-mapped in place (read_cache(mmap=True)). Cache files in a directory are kept under RTT_CACHE_MAX_MB
+(default 512) by dropping the least recently used ones.
+
+    python rttcache.py clear [dir]   # remove cache files
+"""
+import sys
+import os
+import json
+import glob
+import struct
+import numpy as np
+
+import profiling
+
+MAGIC = b'RTTCACHE\n'
+# bump when the file layout changes so old entries are ignored
+FORMAT_VERSION = 1
+SUFFIX = '.rttcache'
+ALIGN = 64
+
+
+def cache_enabled():
+    return os.environ.get('RTT_CACHE', '1') not in ('0', 'off', 'no')
+
+
+def cache_limit():
+    return int(float(os.environ.get('RTT_CACHE_MAX_MB', '512')) * 1024 * 1024)
+
+
+def cache_path(source, suffix=SUFFIX):
+    return source + suffix
+
+
+def source_key(source, version=0):
+    st = os.stat(source)
+    return {'path': os.path.abspath(source), 'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns, 'version': [FORMAT_VERSION, version]}
+
+
+def read_cache(source, version=0, mmap=False, suffix=SUFFIX):
+    """Return cached columns for source, or None if missing or stale.
+
+    With mmap the columns are read-only np.memmap views of the cache file
+    rather than arrays read into memory. suffix picks another file kept
+    in the same format next to source (pyramid.py).
+    """
+    path = cache_path(source, suffix)
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            (hlen,) = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(hlen))
+            if header['key'] != source_key(source, version):
+                return None
+            start = _align(len(MAGIC) + 8 + hlen)
+            columns = {}
+            for col in header['columns']:
+                offset = start + col['offset']
+                if mmap and col['length']:
+                    # np.memmap raises ValueError past the end of a truncated file
+                    values = np.memmap(path, dtype=col['dtype'], mode='r', offset=offset,
+                                       shape=(col['length'],))
+                else:
+                    f.seek(offset)
+                    values = np.fromfile(f, dtype=col['dtype'], count=col['length'])
+                    if len(values) != col['length']:
+                        return None
+                columns[col['name']] = values
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+    # touch so eviction is least-recently-used
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return columns
+
+
+def _align(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def write_cache(source, columns, key, suffix=SUFFIX):
+    """Write columns atomically next to source; key is the pre-parse stat.
+
+    Only files with the cache suffix count towards RTT_CACHE_MAX_MB.
+    Returns the path written, None when it could not be written.
+    """
+    path = cache_path(source, suffix)
+    # offsets are relative to the first aligned byte after the header
+    layout, offset = [], 0
+    for name, values in columns.items():
+        layout.append({'name': name, 'dtype': values.dtype.str, 'length': len(values),
+                       'offset': offset})
+        offset += _align(values.nbytes)
+    header = json.dumps({'key': key, 'columns': layout}).encode()
+    start = _align(len(MAGIC) + 8 + len(header))
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            for col in layout:
+                f.write(b'\0' * (start + col['offset'] - f.tell()))
+                f.write(np.ascontiguousarray(columns[col['name']]).tobytes())
+        os.replace(tmp, path)
+    except OSError:
+        # read-only directory etc., caching is best effort
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return None
+    if suffix == SUFFIX:
+        evict(os.path.dirname(os.path.abspath(source)), keep=path)
+    return path
+
+
+def evict(directory, limit=None, keep=None):
+    """Delete least recently used cache files until the directory fits limit."""
+    limit = cache_limit() if limit is None else limit
+    entries = []
+    for path in glob.glob(os.path.join(directory, '*' + SUFFIX)):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def cached_columns(source, parse, version=0, mmap=False):
+    """Return parse(source) (a dict of numpy arrays), going through the cache.
+
+    version identifies the parser; bumping it invalidates existing entries.
+    mmap asks for memory-mapped columns (see read_cache); a fresh parse is
+    mapped back from the entry just written, so the parsed copy can go.
+    """
+    if not cache_enabled():
+        return parse(source)
+    with profiling.stage('cache read'):
+        cached = read_cache(source, version, mmap)
+    if cached is not None:
+        return cached
+    key = source_key(source, version)
+    columns = parse(source)
+    # don't cache if the file changed while we were reading it
+    if source_key(source, version) == key:
+        with profiling.stage('cache write'):
+            write_cache(source, columns, key)
+        mapped = read_cache(source, version, mmap) if mmap else None
+        if mapped is not None:
+            columns = mapped
+    return columns
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != 'clear' or len(sys.argv) > 3:
+        print(f"Usage: {sys.argv[0]} clear [directory]")
+        sys.exit(1)
+    directory = sys.argv[2] if len(sys.argv) == 3 else '.'
+    evict(directory, limit=0)
+    print(f"Cleared RTT cache in {directory}")
+
+
+if __name__ == "__main__":
+    main()
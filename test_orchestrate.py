@@ -0,0 +1,68 @@
+"""orchestrate.Experiment on the StubAgent: a short schedule, no VMs.
+
+    python -m pytest -q test_orchestrate.py
+"""
+import asyncio
+
+import pytest
+
+import orchestrate
+
+SCHEDULE = {'qdisc': None,
+            'phases': [{'start': 0.0, 'bw': '500Mbps', 'rtt': '50ms'},
+                       {'start': 0.1, 'bw': '2kbps', 'rtt': '50ms'},
+                       {'start': 0.2, 'bw': '2Mbps', 'rtt': '80ms'}],
+            'end': 0.3}
+LATENCY = 0.01
+
+
+@pytest.fixture
+def manifest(monkeypatch, tmp_path):
+    # the fixed waits around iperf3 and the capture are what makes a real run long
+    for name in ('SERVER_START', 'IPERF_FLUSH', 'CAPTURE_TAIL'):
+        monkeypatch.setattr(orchestrate, name, 0.0)
+    agent = orchestrate.StubAgent(LATENCY)
+    experiment = orchestrate.Experiment(agent, 'pfifo', SCHEDULE, ts='20990101-000000', out_dir=str(tmp_path))
+    result = asyncio.run(experiment.run())
+    result['agent'] = agent
+    return result
+
+
+def test_marks_follow_schedule(manifest):
+    marks = manifest['phases']
+    assert [(m['bw'], m['rtt']) for m in marks] == [(p['bw'], p['rtt']) for p in SCHEDULE['phases']]
+    assert [m['planned'] for m in marks] == [p['start'] for p in SCHEDULE['phases']]
+    assert marks[0]['start'] == 0.0 and marks[0]['issued'] == 0.0
+    for mark in marks[1:]:
+        # issued at (not before) its planned time, applied after one stub round trip
+        assert mark['planned'] <= mark['issued'] < mark['planned'] + 0.05
+        assert mark['start'] - mark['issued'] >= LATENCY - 0.002
+    assert manifest['qdisc'] == 'pfifo'
+    assert manifest['planned_end'] == SCHEDULE['end']
+    assert manifest['end'] >= SCHEDULE['end']
+
+
+def test_tune_commands(manifest):
+    cmds = [cmd for _, vm, cmd in manifest['agent'].log if vm == orchestrate.RCV_VM and 'netem' in cmd]
+    # prime + first phase + two scheduled tunes, each on ifb0 and the receive interface
+    assert len(cmds) == 8
+    assert sum('netem delay 40ms' in cmd and 'rate 2Mbps' in cmd for cmd in cmds) == 2
+
+
+def test_lateness_rows(manifest):
+    rows = orchestrate.lateness(manifest)
+    assert [row['planned'] for row in rows] == [0.0, 0.1, 0.2]
+    for row, mark in zip(rows, manifest['phases']):
+        assert row['late'] == pytest.approx(mark['start'] - mark['planned'])
+        assert row['issue_late'] == pytest.approx(mark['issued'] - mark['planned'])
+        assert row['tune'] == pytest.approx(mark['start'] - mark['issued'])
+        assert row['late'] >= 0
+
+
+def test_load_schedule_errors(tmp_path):
+    path = tmp_path / 'run.json'
+    path.write_text('{"phases": [{"start": 0, "bw": "1Mbps"}], "end": 2}')
+    with pytest.raises(ValueError, match='start/bw/rtt'):
+        orchestrate.load_schedule(str(path))
+    with pytest.raises(ValueError, match='cannot read'):
+        orchestrate.load_schedule(str(tmp_path / 'missing.json'))